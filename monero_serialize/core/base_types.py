@@ -1,4 +1,5 @@
 class XmrType:
+    __slots__ = ()
     VERSION = 0
 
 
@@ -0,0 +1,283 @@
+import struct
+
+from .base_types import BoolType, IntType, UVarintType
+from .message_types import BlobType, MessageType
+
+
+_INT_CODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+_FIXED_LAYOUTS = {}
+
+
+class FixedLayout(object):
+    """
+    Precompiled BC codec of a message with an entirely fixed-size wire layout,
+    i.e., all MFIELDS are fixed width integers, fixed size blobs or fixed layout messages.
+
+    Integer fields are decoded / encoded with a single struct.Struct call
+    (other fields padded), blobs and sub-messages with slices of the buffer.
+    """
+
+    def __init__(self, msg_type, fields):
+        self.msg_type = msg_type
+        self.int_fields = []
+        self.int_masks = []
+        self.blob_fields = []  # (fname, offset, size)
+        self.msg_fields = []  # (fname, offset, layout)
+
+        fmt = "<"
+        offset = 0
+        for fname, ftype, size, layout in fields:
+            if layout is not None:
+                self.msg_fields.append((fname, offset, layout))
+                fmt += "%dx" % size
+            elif issubclass(ftype, IntType):
+                self.int_fields.append(fname)
+                self.int_masks.append((1 << (8 * size)) - 1)
+                fmt += _INT_CODES[size]
+            else:
+                self.blob_fields.append((fname, offset, size))
+                fmt += "%dx" % size
+            offset += size
+
+        self.size = offset
+        self.int_struct = struct.Struct(fmt) if self.int_fields else None
+        self.ints_only = not self.blob_fields and not self.msg_fields
+
+    def decode(self, buf, offset=0, msg=None):
+        """
+        Decodes the message from the buffer (bytearray) at the offset
+        :param buf:
+        :param offset:
+        :param msg: message to decode into, new one is created if None
+        :return:
+        """
+        msg = self.msg_type() if msg is None else msg
+        if self.int_struct is not None:
+            for fname, val in zip(self.int_fields, self.int_struct.unpack_from(buf, offset)):
+                setattr(msg, fname, val)
+        for fname, off, size in self.blob_fields:
+            setattr(msg, fname, buf[offset + off: offset + off + size])
+        for fname, off, layout in self.msg_fields:
+            setattr(msg, fname, layout.decode(buf, offset + off))
+        return msg
+
+    def encode_into(self, msg, buf, offset=0):
+        """
+        Encodes the message to the buffer at the offset
+        :param msg:
+        :param buf:
+        :param offset:
+        :return:
+        """
+        if self.int_struct is not None:
+            vals = [getattr(msg, f) & m for f, m in zip(self.int_fields, self.int_masks)]
+            self.int_struct.pack_into(buf, offset, *vals)
+        for fname, off, size in self.blob_fields:
+            data = getattr(msg, fname)
+            if isinstance(data, BlobType):
+                data = getattr(data, data.DATA_ATTR)
+            if len(data) != size:
+                raise ValueError("Fixed size blob has not defined size: %s" % size)
+            buf[offset + off: offset + off + size] = data
+        for fname, off, layout in self.msg_fields:
+            layout.encode_into(getattr(msg, fname), buf, offset + off)
+        return buf
+
+    def encode(self, msg):
+        return self.encode_into(msg, bytearray(self.size))
+
+    def decode_vector(self, buf, count, offset=0):
+        """
+        Decodes count consecutive messages from the buffer
+        :param buf:
+        :param count:
+        :param offset:
+        :return: list of messages
+        """
+        if self.ints_only:
+            data = memoryview(buf)[offset: offset + count * self.size]
+            return [self.msg_type(**dict(zip(self.int_fields, vals)))
+                    for vals in self.int_struct.iter_unpack(data)]
+        return [self.decode(buf, offset + i * self.size) for i in range(count)]
+
+    def decode_vector_into(self, buf, elems, offset=0):
+        """
+        Decodes len(elems) messages into the existing elements, messages of the same type are reused
+        """
+        for i, elem in enumerate(elems):
+            elems[i] = self.decode(buf, offset + i * self.size,
+                                   elem if elem.__class__ is self.msg_type else None)
+        return elems
+
+    def encode_vector(self, msgs):
+        """
+        Encodes the messages to one buffer
+        :param msgs:
+        :return: bytearray
+        """
+        buf = bytearray(len(msgs) * self.size)
+        for i, msg in enumerate(msgs):
+            self.encode_into(msg, buf, i * self.size)
+        return buf
+
+
+class FixedBlobLayout(object):
+    """
+    Codec of vectors of fixed size blobs (keys), elements are bytearrays sliced from one buffer.
+    """
+
+    def __init__(self, blob_type):
+        self.blob_type = blob_type
+        self.size = blob_type.SIZE
+
+    def decode_vector(self, buf, count, offset=0):
+        size = self.size
+        return [buf[offset + i * size: offset + (i + 1) * size] for i in range(count)]
+
+    def decode_vector_into(self, buf, elems, offset=0):
+        """
+        Decodes len(elems) blobs into the existing elements, bytearrays are overwritten in place
+        """
+        size = self.size
+        for i, elem in enumerate(elems):
+            data = buf[offset + i * size: offset + (i + 1) * size]
+            if isinstance(elem, bytearray):
+                elem[:] = data
+            else:
+                elems[i] = data
+        return elems
+
+    def encode_vector(self, blobs):
+        size = self.size
+        buf = bytearray(len(blobs) * size)
+        for i, data in enumerate(blobs):
+            if isinstance(data, BlobType):
+                data = getattr(data, data.DATA_ATTR)
+            if len(data) != size:
+                raise ValueError("Fixed size blob has not defined size: %s" % size)
+            buf[i * size: (i + 1) * size] = data
+        return buf
+
+
+class ByteVector(bytearray):
+    """
+    Decoded vector of unsigned bytes, e.g., tx extra.
+    A bytearray that also compares equal to the list / tuple of its integer values,
+    the representation of byte vectors in messages built by hand.
+    """
+    __slots__ = ()
+    __hash__ = None
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return bytearray.__eq__(self, other)
+
+    def __ne__(self, other):
+        res = self.__eq__(other)
+        return res if res is NotImplemented else not res
+
+
+class FixedBytesLayout(object):
+    """
+    Codec of vectors of unsigned bytes, e.g., tx extra.
+    Decoded vector is one ByteVector (bytearray), lists of ints, bytes and bytearrays are encoded.
+    """
+
+    def __init__(self, int_type):
+        self.int_type = int_type
+        self.size = 1
+
+    def decode_vector(self, buf, count, offset=0):
+        return ByteVector(buf[offset: offset + count])
+
+    def decode_vector_into(self, buf, elems, offset=0):
+        elems[:] = buf[offset: offset + len(elems)]
+        return elems
+
+    def encode_vector(self, data):
+        return data if isinstance(data, (bytes, bytearray)) else bytes(data)
+
+
+def fixed_bytes_layout(int_type):
+    """
+    Returns the FixedBytesLayout of the unsigned byte type, None for other integer types. Cached.
+    :param int_type:
+    :return:
+    """
+    if not issubclass(int_type, IntType):
+        return None
+    try:
+        return _FIXED_LAYOUTS[int_type]
+    except KeyError:
+        pass
+
+    is_byte = (not issubclass(int_type, BoolType)
+               and int_type.WIDTH == 1 and not int_type.SIGNED and not int_type.VARIABLE)
+    res = FixedBytesLayout(int_type) if is_byte else None
+    _FIXED_LAYOUTS[int_type] = res
+    return res
+
+
+def fixed_blob_layout(blob_type):
+    """
+    Returns the FixedBlobLayout of the fixed size blob type, None if the size is not fixed. Cached.
+    :param blob_type:
+    :return:
+    """
+    try:
+        return _FIXED_LAYOUTS[blob_type]
+    except KeyError:
+        pass
+
+    fsize = _field_size(blob_type) if issubclass(blob_type, BlobType) else None
+    res = FixedBlobLayout(blob_type) if fsize is not None else None
+    _FIXED_LAYOUTS[blob_type] = res
+    return res
+
+
+def _field_size(ftype):
+    """
+    Returns (wire size, layout) of the fixed size field type, None if the size is not fixed
+    """
+    if not isinstance(ftype, type) or issubclass(ftype, UVarintType):
+        return None
+    if hasattr(ftype, "serialize_archive"):
+        return None
+    if issubclass(ftype, IntType):
+        return (ftype.WIDTH, None) if ftype.WIDTH in _INT_CODES and not ftype.VARIABLE else None
+    if issubclass(ftype, BlobType):
+        return (ftype.SIZE, None) if ftype.FIX_SIZE and ftype.SIZE > 0 else None
+    if issubclass(ftype, MessageType):
+        layout = fixed_layout(ftype)
+        return (layout.size, layout) if layout is not None else None
+    return None
+
+
+def fixed_layout(msg_type):
+    """
+    Returns the precompiled FixedLayout of the message type, None if the message
+    does not have a fixed-size wire layout (or has a custom serialize_archive). Cached.
+
+    :param msg_type:
+    :return:
+    """
+    try:
+        return _FIXED_LAYOUTS[msg_type]
+    except KeyError:
+        pass
+
+    res = None
+    specs = msg_type.f_specs() if not hasattr(msg_type, "serialize_archive") else None
+    if specs:
+        fields = []
+        for field in specs:
+            fsize = _field_size(field[1]) if len(field) == 2 else None
+            if fsize is None:
+                fields = None
+                break
+            fields.append((field[0], field[1], fsize[0], fsize[1]))
+        res = FixedLayout(msg_type, fields) if fields else None
+
+    _FIXED_LAYOUTS[msg_type] = res
+    return res
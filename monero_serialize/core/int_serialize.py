@@ -62,6 +62,24 @@ def load_uvarint_b(buffer):
     return result
 
 
+def load_uvarint_b_off(buffer, offset=0):
+    """
+    Variable int deserialization, synchronous from buffer at the offset.
+    :param buffer:
+    :param offset:
+    :return: (value, offset after the varint)
+    """
+    result = 0
+    shift = 0
+    byte = 0x80
+    while byte & 0x80:
+        byte = buffer[offset]
+        result += (byte & 0x7F) << shift
+        shift += 7
+        offset += 1
+    return result, offset
+
+
 def dump_uvarint_b(n):
     """
     Serializes uvarint to the buffer
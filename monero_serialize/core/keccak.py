@@ -0,0 +1,143 @@
+'''
+Keccak-256 as used by Monero (original Keccak padding, not the FIPS-202 SHA3).
+
+Uses pycryptodome(x) or pysha3 if installed, pure Python implementation otherwise.
+Hasher objects follow the hashlib interface (update, digest, hexdigest).
+'''
+
+try:
+    from Cryptodome.Hash import keccak as _crypto_keccak
+except ImportError:  # pragma: no cover
+    try:
+        from Crypto.Hash import keccak as _crypto_keccak
+    except ImportError:
+        _crypto_keccak = None
+
+try:
+    import sha3 as _sha3
+except ImportError:  # pragma: no cover
+    _sha3 = None
+
+
+HASH_SIZE = 32
+
+_RATE = 136
+_MASK = (1 << 64) - 1
+
+_RC = [
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+]
+
+# rotation offsets, indexed by x + 5 * y
+_ROT = [
+    0, 1, 62, 28, 27,
+    36, 44, 6, 55, 20,
+    3, 10, 43, 25, 39,
+    41, 45, 15, 21, 8,
+    18, 2, 61, 56, 14,
+]
+
+# rho + pi: lane x + 5 * y moves to y + 5 * ((2x + 3y) % 5)
+_PI = [0] * 25
+for _x in range(5):
+    for _y in range(5):
+        _PI[_y + 5 * ((2 * _x + 3 * _y) % 5)] = _x + 5 * _y
+_RHO_PI = [(src, _ROT[src]) for src in _PI]
+_CHI = [(i, (i + 1) % 5 + i - i % 5, (i + 2) % 5 + i - i % 5) for i in range(25)]
+
+
+def _keccak_f(lanes):
+    """
+    Keccak-f[1600] permutation of the 25 lanes (list of ints)
+    """
+    for rc in _RC:
+        c = [lanes[x] ^ lanes[x + 5] ^ lanes[x + 10] ^ lanes[x + 15] ^ lanes[x + 20] for x in range(5)]
+        d = [c[(x - 1) % 5] ^ (((c[(x + 1) % 5] << 1) | (c[(x + 1) % 5] >> 63)) & _MASK) for x in range(5)]
+        b = []
+        for src, rot in _RHO_PI:
+            v = lanes[src] ^ d[src % 5]
+            b.append(((v << rot) | (v >> (64 - rot))) & _MASK if rot else v)
+        lanes = [b[i] ^ (~b[j] & b[k]) for i, j, k in _CHI]
+        lanes[0] ^= rc
+    return lanes
+
+
+class KeccakHash(object):
+    """
+    Pure Python Keccak-256 sponge, hashlib-like interface
+    """
+    digest_size = HASH_SIZE
+    block_size = _RATE
+
+    def __init__(self, data=None, pad=0x01):
+        self._lanes = [0] * 25
+        self._buf = bytearray()
+        self._pad = pad
+        if data is not None:
+            self.update(data)
+
+    def _absorb(self, block):
+        lanes = self._lanes
+        for i, v in enumerate(int.from_bytes(block[i:i + 8], 'little') for i in range(0, _RATE, 8)):
+            lanes[i] ^= v
+        self._lanes = _keccak_f(lanes)
+
+    def update(self, data):
+        buf = self._buf
+        buf += data
+        if len(buf) >= _RATE:
+            nblocks = len(buf) // _RATE
+            view = memoryview(buf)
+            for i in range(nblocks):
+                self._absorb(view[i * _RATE:(i + 1) * _RATE])
+            view.release()
+            del buf[:nblocks * _RATE]
+        return self
+
+    def copy(self):
+        res = KeccakHash(pad=self._pad)
+        res._lanes = list(self._lanes)
+        res._buf = bytearray(self._buf)
+        return res
+
+    def digest(self):
+        block = bytearray(self._buf)
+        block += bytes(_RATE - len(block))
+        block[len(self._buf)] ^= self._pad
+        block[-1] ^= 0x80
+
+        lanes = list(self._lanes)
+        for i in range(0, _RATE // 8):
+            lanes[i] ^= int.from_bytes(block[i * 8:(i + 1) * 8], 'little')
+        lanes = _keccak_f(lanes)
+        return b''.join(v.to_bytes(8, 'little') for v in lanes[:HASH_SIZE // 8])
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+def keccak_256(data=None):
+    """
+    Returns new Keccak-256 hasher, optionally fed with the data
+    :param data:
+    :return:
+    """
+    if _crypto_keccak is not None:
+        return _crypto_keccak.new(digest_bits=256, data=data)  # pragma: no cover
+    if _sha3 is not None:
+        return _sha3.keccak_256(data if data is not None else b'')  # pragma: no cover
+    return KeccakHash(data)
+
+
+def keccak_hash(data):
+    """
+    Returns Keccak-256 digest of the data
+    :param data:
+    :return: bytes
+    """
+    return keccak_256(data).digest()
@@ -31,7 +31,7 @@ class BlobType(XmrType):
         return eq_obj_contents(self, rhs)
 
     def __repr__(self):
-        dct = slot_obj_dict(self) if hasattr(self, "__slots__") else self.__dict__
+        dct = slot_obj_dict(self)
         return "<%s: %s>" % (self.__class__.__name__, dct)
 
 
@@ -39,6 +39,48 @@ class UnicodeType(XmrType):
     pass
 
 
+class VariantDispatch(object):
+    """
+    Variant field lookup tables: BC code, boost code, field name and element class -> field.
+    """
+    __slots__ = ("codes", "boost_codes", "names", "classes")
+
+    def __init__(self, fields):
+        self.codes = {}
+        self.boost_codes = {}
+        self.names = {}
+        self.classes = {}
+        for field in fields:
+            ftype = field[1]
+            code = getattr(ftype, "VARIANT_CODE", None)
+            boost_code = getattr(ftype, "BOOST_VARIANT_CODE", code)
+            if code is not None:
+                self.codes.setdefault(code, field)
+            if boost_code is not None:
+                self.boost_codes.setdefault(boost_code, field)
+            self.names.setdefault(field[0], field)
+            if isinstance(ftype, type):
+                self.classes.setdefault(ftype, field)
+
+
+_VARIANT_DISPATCH = {}
+
+
+def variant_dispatch(variant_type):
+    """
+    Returns cached dispatch tables of the variant type.
+    Built once per variant type from its field specs, MFIELDS should not be modified afterwards.
+
+    :param variant_type:
+    :return: VariantDispatch
+    """
+    res = _VARIANT_DISPATCH.get(variant_type)
+    if res is None:
+        res = VariantDispatch(variant_type.f_specs())
+        _VARIANT_DISPATCH[variant_type] = res
+    return res
+
+
 class VariantType(XmrType):
     """
     Union of types, variant tags needed. is only one of the types. List in typedef, enum.
@@ -72,6 +114,50 @@ class VariantType(XmrType):
                 return x
         raise ValueError('Unrecognized variant')
 
+    @classmethod
+    def fdef_by_code(cls, code, boost=False):
+        """
+        Returns variant field with the given variant code, None if not found
+        :param code:
+        :param boost: use BOOST_VARIANT_CODE if defined
+        :return:
+        """
+        dispatch = variant_dispatch(cls)
+        return (dispatch.boost_codes if boost else dispatch.codes).get(code)
+
+    @classmethod
+    def fdef_by_name(cls, name):
+        """
+        Returns variant field with the given name, None if not found
+        :param name:
+        :return:
+        """
+        return variant_dispatch(cls).names.get(name)
+
+    @classmethod
+    def fdef_by_elem(cls, elem):
+        """
+        Returns variant field for the unwrapped variant value.
+        Resolved by the value class, subclasses and classes of the same name
+        (not direct hierarchy) are resolved once and remembered.
+
+        :param elem:
+        :return:
+        """
+        classes = variant_dispatch(cls).classes
+        res = classes.get(elem.__class__)
+        if res is not None:
+            return res
+
+        fields = cls.f_specs()
+        name = elem.__class__.__name__
+        res = next((x for x in fields if isinstance(elem, x[1])), None)
+        res = res if res else next((x for x in fields if name == x[1].__name__), None)
+        if res is None:
+            raise ValueError("Unrecognized variant: %s" % elem)
+        classes[elem.__class__] = res
+        return res
+
     def set_variant(self, fname, fvalue):
         self.variant_elem = fname
         self.variant_elem_type = fvalue.__class__
@@ -81,7 +167,7 @@ class VariantType(XmrType):
         return eq_obj_contents(self, rhs)
 
     def __repr__(self):
-        dct = slot_obj_dict(self) if hasattr(self, "__slots__") else self.__dict__
+        dct = slot_obj_dict(self)
         return "<%s: %s>" % (self.__class__.__name__, dct)
 
 
@@ -105,8 +191,158 @@ class TupleType(XmrType):
         return cls.MFIELDS
 
 
-class MessageType(XmrType):
+class MessageTypeMeta(type):
+    """
+    Derives __slots__ of the message class from its MFIELDS.
+    Fields inherited from parent classes (e.g., Transaction extends TransactionPrefix.MFIELDS)
+    are already present in the parent slots so only the new fields are added.
+    Explicitly declared __slots__ are merged with the fields (extra non-field attributes).
+
+    Message instances thus do not have per-instance __dict__, unless `__dict__` is
+    declared in __slots__.
+    """
+    def __new__(mcs, name, bases, ns, **kwargs):
+        inherited = set()
+        for base in bases:
+            for c in base.__mro__:
+                inherited.update(c.__dict__.get("__slots__", ()))
+
+        declared = ns.get("__slots__", ())
+        declared = (declared,) if isinstance(declared, str) else declared
+        fields = ns.get("MFIELDS", ())
+
+        slots = []
+        for fname in list(declared) + [x[0] for x in fields]:
+            if fname not in inherited and fname not in slots:
+                slots.append(fname)
+
+        ns["__slots__"] = tuple(slots)
+        cls = super().__new__(mcs, name, bases, ns, **kwargs)
+        if ns.get("ENC_CACHE"):
+            cls.set_enc_cache(True)
+        return cls
+
+
+class EncodeCache(object):
+    """
+    Serialized bytes of the message, per archive format key.
+    Parents are the cached messages the bytes were embedded into,
+    they are invalidated together with the message.
+    """
+    __slots__ = ("data", "parents")
+
+    def __init__(self):
+        self.data = {}
+        self.parents = []
+
+
+def _enc_cache_setattr(self, name, value):
+    object.__setattr__(self, name, value)
+    if name != "_enc_cache":
+        self.invalidate_enc_cache()
+
+
+def _enc_cache_delattr(self, name):
+    object.__delattr__(self, name)
+    if name != "_enc_cache":
+        self.invalidate_enc_cache()
+
+
+_ENC_CACHE_ROOTS = set()  # classes set_enc_cache() was called on
+_ENC_CACHE_TRACKED = set()  # classes with the attribute write tracking installed
+
+
+def _enc_cache_reachable(tp, res):
+    """
+    Collects message types reachable from the type fields into res,
+    including subclasses of the message types (e.g., Transaction of TransactionPrefix)
+    """
+    if not isinstance(tp, type):
+        return
+    if issubclass(tp, MessageType):
+        if tp in res:
+            return
+        res.add(tp)
+        for sub in tp.__subclasses__():
+            _enc_cache_reachable(sub, res)
+    elif issubclass(tp, ContainerType):
+        _enc_cache_reachable(tp.ELEM_TYPE, res)
+        return
+    elif not issubclass(tp, (VariantType, TupleType)):
+        return
+
+    for fdef in tp.f_specs():
+        for ftype in fdef[1:] if isinstance(fdef, (tuple, list)) else (fdef,):
+            _enc_cache_reachable(ftype, res)
+
+
+def _enc_cache_update_tracking():
+    """
+    Installs attribute write tracking on all message types reachable from the cached classes,
+    removes it from the types no longer reachable.
+    Types with own attribute write handling (e.g., frozen messages) are left as they are.
+    """
+    global _ENC_CACHE_TRACKED
+    tracked = set()
+    for cls in _ENC_CACHE_ROOTS:
+        if cls.ENC_CACHE:
+            _enc_cache_reachable(cls, tracked)
+
+    for cls in _ENC_CACHE_TRACKED - tracked:
+        cls.__setattr__ = object.__setattr__
+        cls.__delattr__ = object.__delattr__
+    for cls in tracked - _ENC_CACHE_TRACKED:
+        if cls.__setattr__ not in (object.__setattr__, _enc_cache_setattr):
+            continue
+        cls.__setattr__ = _enc_cache_setattr
+        cls.__delattr__ = _enc_cache_delattr
+    _ENC_CACHE_TRACKED = set(cls for cls in tracked if cls.__setattr__ is _enc_cache_setattr)
+
+
+def _enc_cache_link(val, parent):
+    """
+    Links nested messages of the value to the cached parent so their attribute writes invalidate it.
+    Cached messages with the encoding already stored were linked when serialized, not descended into.
+    """
+    if isinstance(val, (list, tuple)):
+        for elem in val:
+            _enc_cache_link(elem, parent)
+        return
+    if isinstance(val, VariantType):
+        _enc_cache_link(getattr(val, val.variant_elem, None) if val.variant_elem else None, parent)
+        return
+    if not isinstance(val, MessageType):
+        return
+
+    if val.ENC_CACHE:
+        cache = val.get_enc_cache()
+        if cache is not None and cache.data:
+            return
+        val.set_enc_cache_data(None, None, parent)
+        parent = val
+    else:
+        val.set_enc_cache_data(None, None, parent)
+    for fdef in val.f_specs():
+        _enc_cache_link(getattr(val, fdef[0], None), parent)
+
+
+class MessageType(XmrType, metaclass=MessageTypeMeta):
+    """
+    Message type, serialized as a sequence of MFIELDS.
+
+    Encoding cache (opt-in per class, see set_enc_cache()):
+    the message remembers its serialized bytes per archive format
+    so re-dumping an unchanged message is a single buffer copy.
+    Attribute writes on the message and on the messages nested in it
+    (all message types reachable from its fields are tracked) invalidate
+    the cache of the message and of all cached messages it was serialized in.
+    In-place modifications (e.g., list.append, bytearray item set) and
+    writes on wrapped variant objects are not tracked,
+    call invalidate_enc_cache() after such change.
+    """
+    __slots__ = ("_enc_cache",)
     MFIELDS = []
+    ENC_CACHE = False
 
     def __init__(self, **kwargs):
         for kw in kwargs:
@@ -116,13 +352,81 @@ class MessageType(XmrType):
         return eq_obj_contents(self, rhs)
 
     def __repr__(self):
-        dct = slot_obj_dict(self) if hasattr(self, "__slots__") else self.__dict__
+        dct = slot_obj_dict(self)
         return "<%s: %s>" % (self.__class__.__name__, dct)
 
     @classmethod
     def f_specs(cls):
         return cls.MFIELDS
 
+    @classmethod
+    def set_enc_cache(cls, enabled=True):
+        """
+        Enables / disables the encoding cache for the class and its subclasses.
+        Enabling installs attribute write tracking on the class and all message types nested in it.
+
+        Only attribute writes are tracked. In-place changes of lists and bytearrays
+        (e.g., tx.vin[0].key_offsets[0] += 1, tx.extra[0] = 1, tx.vout.append(out)) are not,
+        the stale cached bytes are dumped until invalidate_enc_cache() is called
+        on the message owning the changed field or the field is reassigned.
+        :param enabled:
+        :return:
+        """
+        cls.ENC_CACHE = enabled
+        _ENC_CACHE_ROOTS.add(cls)
+        _enc_cache_update_tracking()
+
+    def get_enc_cache(self, key=None):
+        """
+        Returns the cached encoding for the archive key, None if not cached.
+        If key is None, returns the whole EncodeCache object.
+        :param key:
+        :return:
+        """
+        cache = getattr(self, "_enc_cache", None)
+        if cache is None or key is None:
+            return cache
+        return cache.data.get(key)
+
+    def set_enc_cache_data(self, key, data, parent=None):
+        """
+        Stores the serialized bytes of the message
+        :param key: archive format key
+        :param data: serialized bytes
+        :param parent: cached message the bytes are part of
+        :return:
+        """
+        cache = getattr(self, "_enc_cache", None)
+        if cache is None:
+            cache = EncodeCache()
+            object.__setattr__(self, "_enc_cache", cache)
+        if data is not None:
+            cache.data[key] = data
+        if parent is not None and parent is not self:
+            if not any(p is parent for p in cache.parents):
+                cache.parents.append(parent)
+
+    def link_enc_cache(self):
+        """
+        Links the nested messages to the message after its encoding was stored,
+        so attribute writes on them invalidate the cached encoding
+        :return:
+        """
+        for fdef in self.f_specs():
+            _enc_cache_link(getattr(self, fdef[0], None), self)
+
+    def invalidate_enc_cache(self):
+        """
+        Drops the cached encodings of the message and all its cached parents
+        :return:
+        """
+        cache = getattr(self, "_enc_cache", None)
+        if cache is None:
+            return
+        object.__setattr__(self, "_enc_cache", None)
+        for parent in cache.parents:
+            parent.invalidate_enc_cache()
+
     def _field(self, fname=None, idx=None, specs=None):
         fld = None
         specs = self.f_specs() if specs is None else specs
@@ -1,14 +1,44 @@
+_CLS_SLOTS = {}
+
+
+def cls_slots(cls):
+    """
+    Returns tuple of all __slots__ names declared in the class hierarchy.
+    Private slots (underscore prefixed) are not part of the object contents, thus skipped.
+    Result is cached per class.
+
+    :param cls:
+    :return:
+    """
+    res = _CLS_SLOTS.get(cls)
+    if res is not None:
+        return res
+
+    names = []
+    for c in reversed(cls.__mro__):
+        slots = c.__dict__.get("__slots__", ())
+        slots = (slots,) if isinstance(slots, str) else slots
+        for f in slots:
+            if f not in names and f not in ("__dict__", "__weakref__") and not f.startswith("_"):
+                names.append(f)
+
+    res = tuple(names)
+    _CLS_SLOTS[cls] = res
+    return res
+
+
 def eq_obj_slots(l, r):
     """
-    Compares objects with __slots__ defined
+    Compares objects with __slots__ defined.
+    Slots declared in the whole class hierarchy are compared, then __dict__ if present.
     :param l:
     :param r:
     :return:
     """
-    for f in l.__slots__:
+    for f in cls_slots(l.__class__):
         if getattr(l, f, None) != getattr(r, f, None):
             return False
-    return True
+    return getattr(l, "__dict__", None) == getattr(r, "__dict__", None)
 
 
 def eq_obj_contents(l, r):
@@ -20,21 +50,19 @@ def eq_obj_contents(l, r):
     """
     if l.__class__ is not r.__class__:
         return False
-    if hasattr(l, "__slots__"):
-        return eq_obj_slots(l, r)
-    else:
-        return l.__dict__ == r.__dict__
+    return eq_obj_slots(l, r)
 
 
 def slot_obj_dict(o):
     """
-    Builds dict for o with __slots__ defined
+    Builds dict for o with __slots__ defined, supports also __dict__ attributes
     :param o:
     :return:
     """
     d = {}
-    for f in o.__slots__:
+    for f in cls_slots(o.__class__):
         d[f] = getattr(o, f, None)
+    d.update(getattr(o, "__dict__", {}))
     return d
 
 
@@ -29,6 +29,34 @@ class MemoryReaderWriter:
         else:
             self.woffset = len(buffer)
 
+    def reset(self, buffer=None):
+        """
+        Resets the reader / writer state for the next message.
+        Without a new buffer the current data is rewound to be read again,
+        call truncate(0) to overwrite it from the beginning (allocated buffer is kept).
+        :param buffer: new buffer to read from
+        :return:
+        """
+        self.nread = 0
+        self.nwritten = 0
+        self.offset = 0
+        if buffer is not None:
+            self.buffer = buffer
+            self.woffset = len(buffer)
+        self.ndata = self.woffset
+
+    def truncate(self, size):
+        """
+        Sets the write offset to size, next writes overwrite the data after it.
+        Allocated buffer is kept.
+        :param size:
+        :return:
+        """
+        if size > self.woffset:
+            raise ValueError('Cannot truncate beyond written data')
+        self.ndata -= self.woffset - size
+        self.woffset = size
+
     def is_empty(self):
         return self.offset == len(self.buffer) or self.offset == self.woffset
 
@@ -43,8 +71,7 @@ class MemoryReaderWriter:
             raise EOFError
 
         nread = min(ln, len(self.buffer) - self.offset)
-        for idx in range(nread):
-            buf[idx] = self.buffer[self.offset + idx]
+        buf[:nread] = self.buffer[self.offset : self.offset + nread]
 
         self.offset += nread
         self.nread += nread
@@ -71,26 +98,19 @@ class MemoryReaderWriter:
         bufoff = 0
 
         # Fill existing place in the buffer
-        while towrite > 0 and nall - self.woffset > 0:
-            self.buffer[self.woffset] = buf[bufoff]
-            self.woffset += 1
-            bufoff += 1
-            towrite -= 1
-
-        # Allocate next chunk if needed
-        while towrite > 0:
-            _towrite = min(32, towrite)
-            chunk = bytearray(32)  # chunk size typical for EC point
-
-            for i in range(_towrite):
-                chunk[i] = buf[bufoff]
-                self.woffset += 1
-                bufoff += 1
-                towrite -= 1
-
-            self.buffer.extend(chunk)
+        nfill = min(towrite, max(0, nall - self.woffset))
+        if nfill > 0:
+            self.buffer[self.woffset : self.woffset + nfill] = buf[:nfill]
+            self.woffset += nfill
+            bufoff += nfill
+            towrite -= nfill
+
+        # Allocate next chunks if needed, chunk size typical for EC point
+        if towrite > 0:
+            self.buffer.extend(buf[bufoff:])
+            self.buffer.extend(bytes(-towrite % 32))
+            self.woffset += towrite
             if self.do_gc:
-                chunk = None  # dereference
                 self.gc()
 
         self.nwritten += nwritten
@@ -103,3 +123,24 @@ class MemoryReaderWriter:
     def get_buffer(self):
         mv = memoryview(self.buffer)
         return mv[self.offset : self.woffset]
+
+
+class RecordingReaderWriter:
+    """
+    Passes reads / writes to the underlying reader / writer
+    and records the transferred bytes.
+    """
+
+    def __init__(self, iobj):
+        self.iobj = iobj
+        self.record = bytearray()
+
+    async def areadinto(self, buf):
+        nread = await self.iobj.areadinto(buf)
+        self.record += memoryview(buf)[:nread]
+        return nread
+
+    async def awrite(self, buf):
+        nwritten = await self.iobj.awrite(buf)
+        self.record += buf
+        return nwritten
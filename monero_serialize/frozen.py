@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Frozen (immutable, hashable) messages.
+
+freeze() returns a deep immutable copy of the message: lists are converted
+to tuples, bytearrays to bytes and sub-messages to their frozen counterparts.
+Frozen messages hash by a lazily computed digest (SHA-256) of their BC encoding
+and compare by the digest, so they can be used in sets and as dict keys
+without deep field-by-field comparisons. Messages that cannot be encoded
+on their own, e.g., partially populated decoded outPk CtKey (mask only),
+are digested over the names and values of the present fields.
+
+    out = freeze(tx.vout[0])
+    outputs = {out: idx}
+'''
+
+import hashlib
+import struct
+
+from . import helpers
+from . import xmrserialize as x
+
+
+_FROZEN_TYPES = {}
+
+
+class FrozenMessage(object):
+    """
+    Frozen message mixin. The frozen class is the subclass of the original message type,
+    FROZEN_BASE is the original type.
+    """
+    __slots__ = ()
+    FROZEN_BASE = None
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Frozen %s is immutable' % self.FROZEN_BASE.__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError('Frozen %s is immutable' % self.FROZEN_BASE.__name__)
+
+    def digest(self):
+        """
+        Returns SHA-256 of the BC encoding of the message, computed lazily.
+        Falls back to the digest of the present fields if the message cannot be encoded.
+        :return:
+        """
+        dg = getattr(self, '_digest', None)
+        if dg is None:
+            try:
+                dg = hashlib.sha256(encode(self, self.FROZEN_BASE)).digest()
+            except helpers.ArchiveException:
+                dg = self.fields_digest()
+            object.__setattr__(self, '_digest', dg)
+        return dg
+
+    def fields_digest(self):
+        """
+        Returns SHA-256 over the type name and the names and values of the present (not None) fields
+        :return:
+        """
+        h = hashlib.sha256(b'fields:' + self.FROZEN_BASE.__name__.encode())
+        for fname, fval in _attrs(self):
+            if fval is not None:
+                _digest_update(h, fname)
+                _digest_update(h, fval)
+        return h.digest()
+
+    def __hash__(self):
+        return int.from_bytes(self.digest()[:8], 'big')
+
+    def __eq__(self, rhs):
+        if not isinstance(rhs, FrozenMessage):
+            return False
+        return self.FROZEN_BASE is rhs.FROZEN_BASE and self.digest() == rhs.digest()
+
+    def __ne__(self, rhs):
+        return not self.__eq__(rhs)
+
+    def __reduce__(self):
+        return freeze, (thaw(self),)
+
+
+def _digest_update(h, val):
+    """
+    Feeds tagged, length prefixed frozen value to the hasher
+    """
+    if isinstance(val, FrozenMessage):
+        h.update(b'm')
+        h.update(val.digest())
+    elif isinstance(val, (bytes, bytearray)):
+        h.update(b'b' + struct.pack('<Q', len(val)))
+        h.update(val)
+    elif isinstance(val, str):
+        _digest_update(h, val.encode('utf8'))
+    elif isinstance(val, int):
+        h.update(b'i%d;' % val)
+    elif isinstance(val, (list, tuple)):
+        h.update(b't' + struct.pack('<Q', len(val)))
+        for elem in val:
+            _digest_update(h, elem)
+    elif isinstance(val, type):
+        h.update(b'c')
+        _digest_update(h, val.__name__)
+    elif val is None:
+        h.update(b'n')
+    else:
+        raise ValueError('Unsupported frozen value: %r' % (val,))
+
+
+def frozen_type(msg_type):
+    """
+    Returns the frozen counterpart of the message / variant type. Cached.
+    :param msg_type:
+    :return:
+    """
+    if issubclass(msg_type, FrozenMessage):
+        return msg_type
+
+    res = _FROZEN_TYPES.get(msg_type)
+    if res is None:
+        ns = {'__slots__': ('_digest',), 'FROZEN_BASE': msg_type, '__module__': msg_type.__module__}
+        res = type(msg_type)('Frozen' + msg_type.__name__, (FrozenMessage, msg_type), ns)
+        _FROZEN_TYPES[msg_type] = res
+    return res
+
+
+def is_frozen(obj):
+    return isinstance(obj, FrozenMessage)
+
+
+def _attrs(obj):
+    res = []
+    for f in x.cls_slots(obj.__class__):
+        if hasattr(obj, f):
+            res.append((f, getattr(obj, f)))
+    res.extend(getattr(obj, '__dict__', {}).items())
+    return res
+
+
+def freeze(obj):
+    """
+    Returns deep frozen copy of the object. Frozen objects are returned as they are.
+    Messages and wrapped variants are converted to frozen types,
+    lists to tuples and bytearrays to bytes.
+
+    :param obj:
+    :return:
+    """
+    if isinstance(obj, (FrozenMessage, bytes, str, int)) or obj is None:
+        return obj
+    elif isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    elif isinstance(obj, bytearray):
+        return bytes(obj)
+    elif isinstance(obj, (x.MessageType, x.VariantType)):
+        res = frozen_type(obj.__class__).__new__(frozen_type(obj.__class__))
+        for fname, fval in _attrs(obj):
+            if fname == 'variant_elem_type':
+                object.__setattr__(res, fname, fval.FROZEN_BASE if is_frozen_type(fval) else fval)
+            else:
+                object.__setattr__(res, fname, freeze(fval))
+        return res
+    return obj
+
+
+def thaw(obj):
+    """
+    Returns deep mutable copy of the frozen object.
+    Inverse to freeze(): tuples are converted to lists, bytes are kept.
+
+    :param obj:
+    :return:
+    """
+    if isinstance(obj, (list, tuple)):
+        return [thaw(v) for v in obj]
+    elif isinstance(obj, (x.MessageType, x.VariantType)):
+        cls = obj.FROZEN_BASE if isinstance(obj, FrozenMessage) else obj.__class__
+        res = cls.__new__(cls)
+        for fname, fval in _attrs(obj):
+            object.__setattr__(res, fname, fval if fname == 'variant_elem_type' else thaw(fval))
+        return res
+    return obj
+
+
+def is_frozen_type(tp):
+    return isinstance(tp, type) and issubclass(tp, FrozenMessage)
+
+
+def encode(obj, obj_type=None, versions=None):
+    """
+    Synchronously dumps the message / variant in the BC format.
+
+    :param obj:
+    :param obj_type: type to serialize the object as, frozen types are mapped to the original ones
+    :param versions:
+    :return:
+    """
+    obj_type = obj_type if obj_type else obj.__class__
+    obj_type = obj_type.FROZEN_BASE if is_frozen_type(obj_type) else obj_type
+
+    writer = x.MemoryReaderWriter()
+    ar = x.Archive(writer, True, versions)
+    helpers.run_sync(ar.field(obj, obj_type))
+    return bytes(writer.get_buffer())
@@ -56,3 +56,19 @@ class ArchiveException(Exception):
             return super().__str__()
 
         return '%s, path: %s' % (super().__str__(), self.tracker)
+
+
+def run_sync(coro):
+    """
+    Runs the coroutine which does not suspend (e.g., serialization to / from MemoryReaderWriter)
+    synchronously, without an event loop.
+
+    :param coro:
+    :return: coroutine result
+    """
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    coro.close()
+    raise ValueError('Coroutine suspended, use an event loop')
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Memory footprint profiling of the decoded object graphs.
+
+Walks decoded message trees (messages with or without __slots__, variants,
+containers, blobs) and reports the deep size per field path, so it is possible
+to see which fields drive the memory usage of e.g. `Transaction`, `TransferDetails`
+or `PendingTransaction`.
+
+Also measures tracemalloc allocations performed during decoding of a message.
+
+Note: Used for debugging and benchmarking, not optimized for speed.
+'''
+
+import collections
+import re
+import sys
+import tracemalloc
+
+from . import xmrserialize as x
+
+
+_SKIP_TYPES = (type, type(None), bool)
+_INDEX_RE = re.compile(r'\[\d+\]')
+
+
+def obj_attrs(obj):
+    """
+    Returns list of (name, value) of the set attributes of the object.
+    Supports __slots__ declared in the whole class hierarchy and __dict__.
+
+    :param obj:
+    :return:
+    """
+    res = []
+    names = set()
+    for cls in obj.__class__.__mro__:
+        slots = cls.__dict__.get('__slots__', ())
+        slots = (slots,) if isinstance(slots, str) else slots
+        for f in slots:
+            if f in names or f in ('__dict__', '__weakref__'):
+                continue
+            names.add(f)
+            if hasattr(obj, f):
+                res.append((f, getattr(obj, f)))
+
+    dct = getattr(obj, '__dict__', None)
+    if dct:
+        for f in dct:
+            if f not in names:
+                res.append((f, dct[f]))
+    return res
+
+
+def obj_children(obj):
+    """
+    Returns list of (path_suffix, child) for the given object in the decoded tree.
+
+    :param obj:
+    :return:
+    """
+    if isinstance(obj, (x.MessageType, x.VariantType, x.BlobType)):
+        return [('.%s' % k, v) for k, v in obj_attrs(obj)]
+    elif isinstance(obj, (list, tuple)):
+        return [('[%d]' % i, v) for i, v in enumerate(obj)]
+    elif isinstance(obj, dict):
+        return [('[%r]' % k, v) for k, v in obj.items()]
+    return []
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    Returns deep size of the object in bytes.
+    Each object is counted only once, shared objects are tracked in seen set.
+    Types and singletons are not counted.
+
+    :param obj:
+    :param seen: set of already counted object ids
+    :return:
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, _SKIP_TYPES) or id(cur) in seen:
+            continue
+
+        seen.add(id(cur))
+        size += sys.getsizeof(cur)
+        if isinstance(cur, dict):
+            stack.extend(cur.keys())
+        stack.extend(v for _, v in obj_children(cur))
+    return size
+
+
+def field_sizes(obj, max_depth=None, aggregate=False, prefix=''):
+    """
+    Returns ordered dictionary of field path -> deep size of the field.
+    Root object is reported under the prefix path (empty by default) and
+    includes also the object itself.
+
+    Each object is accounted only once, under the first path it was reached by.
+
+    :param obj: decoded object tree
+    :param max_depth: maximal depth of reported paths, None for unlimited
+    :param aggregate: if True, container indices are collapsed, i.e., `vin[].k_image`
+                      aggregates `k_image` sizes of all inputs.
+    :param prefix: root path
+    :return:
+    """
+    res = collections.OrderedDict()
+    seen = set()
+
+    def walk(cur, path, depth):
+        if isinstance(cur, _SKIP_TYPES) or id(cur) in seen:
+            return 0
+
+        if max_depth is not None and depth >= max_depth:
+            size = deep_sizeof(cur, seen)
+        else:
+            seen.add(id(cur))
+            size = sys.getsizeof(cur)
+            if isinstance(cur, dict):
+                size += sum(deep_sizeof(k, seen) for k in cur.keys())
+            for suffix, child in obj_children(cur):
+                size += walk(child, path + suffix, depth + 1)
+
+        key = _INDEX_RE.sub('[]', path) if aggregate else path
+        res[key] = res.get(key, 0) + size
+        return size
+
+    walk(obj, prefix, 0)
+    return res
+
+
+def top_fields(obj, limit=10, max_depth=None, aggregate=True):
+    """
+    Returns list of (path, size) of the largest leaf-most fields.
+    Root path is excluded.
+
+    :param obj:
+    :param limit:
+    :param max_depth:
+    :param aggregate:
+    :return:
+    """
+    sizes = field_sizes(obj, max_depth=max_depth, aggregate=aggregate)
+    items = [(k, v) for k, v in sizes.items() if k]
+    items.sort(key=lambda kv: kv[1], reverse=True)
+    return items[:limit]
+
+
+class DecodeStats(object):
+    """
+    Memory statistics of a single message decoding
+    """
+    def __init__(self, msg_type=None, blob_size=0, peak=0, retained=0, blocks=0, deep_size=0):
+        self.msg_type = msg_type
+        self.blob_size = blob_size
+        self.peak = peak
+        self.retained = retained
+        self.blocks = blocks
+        self.deep_size = deep_size
+
+    def __repr__(self):
+        return '<DecodeStats %s: blob: %s, peak: %s, retained: %s, blocks: %s, deep: %s>' % (
+            self.msg_type.__name__ if self.msg_type else None,
+            self.blob_size, self.peak, self.retained, self.blocks, self.deep_size)
+
+
+async def decode_allocations(msg_type, data, archive_fnc=None, versions=None, decode_fnc=None):
+    """
+    Decodes the message from the data and measures the tracemalloc
+    allocations performed during the decoding.
+
+    Peak is the maximal traced memory during the decoding, retained is the memory
+    held after the decoding, blocks is the number of memory blocks retained.
+
+    :param msg_type: message type to decode
+    :param data: serialized message
+    :param archive_fnc: archive constructor (reader, writing, versions), BC archive by default
+    :param versions: version settings passed to the archive
+    :param decode_fnc: coroutine function (archive) -> msg, for messages decoded with a context,
+                       ar.message(None, msg_type) by default
+    :return: (msg, DecodeStats)
+    """
+    archive_fnc = archive_fnc if archive_fnc else x.Archive
+    reader = x.MemoryReaderWriter(bytearray(data))
+    ar = archive_fnc(reader, False, versions)
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+
+    try:
+        tracemalloc.clear_traces()
+        snap_before = tracemalloc.take_snapshot()
+        mem_before, _ = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        await ar.root()
+        msg = await (decode_fnc(ar) if decode_fnc else ar.message(None, msg_type))
+
+        mem_after, mem_peak = tracemalloc.get_traced_memory()
+        snap_after = tracemalloc.take_snapshot()
+
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    blocks = sum(st.count_diff for st in snap_after.compare_to(snap_before, 'filename'))
+    stats = DecodeStats(msg_type=msg_type, blob_size=len(data),
+                        peak=max(0, mem_peak - mem_before), retained=mem_after - mem_before,
+                        blocks=blocks, deep_size=deep_sizeof(msg))
+    return msg, stats
+
+
+def collect_messages(obj, res=None):
+    """
+    Collects the first occurrence of each message type in the object tree.
+
+    :param obj:
+    :param res: ordered dict type -> message instance
+    :return:
+    """
+    res = collections.OrderedDict() if res is None else res
+    seen = set()
+    stack = [obj]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, _SKIP_TYPES) or id(cur) in seen:
+            continue
+
+        seen.add(id(cur))
+        if isinstance(cur, x.MessageType) and cur.__class__ not in res:
+            res[cur.__class__] = cur
+        stack.extend(reversed([v for _, v in obj_children(cur)]))
+    return res
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Decoding memory benchmark.
+
+Measures tracemalloc peak / retained allocations per decode of the bundled
+test data and for each xmrtypes message type. Per type samples are taken from
+the test data, types without a sample are generated from their fields.
+RctSig / RctSigPrunable are decoded with the counts of their transaction.
+Types that cannot be encoded on their own are reported as unsupported.
+
+Usage: python -m monero_serialize.tests.bench_memory
+'''
+import asyncio
+import binascii
+import collections
+import os
+import re
+
+import pkg_resources
+
+from .. import memprof
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+from .. import xmrboost as xmrb
+
+
+__author__ = 'dusanklinec'
+
+
+def load_data(name, unhex=False):
+    data = pkg_resources.resource_string(__name__, os.path.join('data', name))
+    if name.startswith('tx_hf'):
+        data = binascii.unhexlify(re.search(rb'"tx_hex":\s*"([0-9a-fA-F]+)"', data).group(1))
+    elif unhex:
+        data = binascii.unhexlify(data)
+    return data
+
+
+def samples():
+    """
+    Root samples: (name, msg_type, data, archive constructor, versions)
+    :return:
+    """
+    return [
+        ('tx_hf13', xmr.Transaction, load_data('tx_hf13.txt'), x.Archive, xmr.hf_versions(13)),
+        ('tx_hf15', xmr.Transaction, load_data('tx_hf15.txt'), x.Archive, xmr.hf_versions(15)),
+        ('tx_unsigned_01_bc', xmr.UnsignedTxSet, load_data('tx_unsigned_01_bc.txt'), x.Archive, xmr.hf_versions(9)),
+        ('tx_01', xmr.Transaction, load_data('tx_01.txt', True), xmrb.Archive, None),
+        ('tx_metadata_01', xmr.PendingTransaction, load_data('tx_metadata_01.txt', True), xmrb.Archive,
+         xmr.hf_versions(9)),
+    ]
+
+
+async def encode_bc(msg, versions=None, encode_fnc=None):
+    writer = x.MemoryReaderWriter()
+    ar = x.Archive(writer, True, versions)
+    await (encode_fnc(ar, msg) if encode_fnc else ar.message(msg))
+    return bytes(writer.get_buffer())
+
+
+def xmr_message_types():
+    """
+    Message types defined in xmrtypes, in the definition order
+    """
+    return [v for v in vars(xmr).values()
+            if isinstance(v, type) and issubclass(v, x.MessageType) and v.__module__ == xmr.__name__]
+
+
+def gen_value(tp, params=None, depth=0):
+    """
+    Generates a minimal value of the type: zero integers, zero blobs, one element containers,
+    the first variant option
+    """
+    if depth > 16:
+        raise ValueError('Recursive type %s' % tp.__name__)
+    if issubclass(tp, (x.IntType, x.UVarintType)):
+        return 0
+    elif issubclass(tp, x.BlobType):
+        return bytearray(tp.SIZE if tp.FIX_SIZE else 32)
+    elif issubclass(tp, x.UnicodeType):
+        return ''
+    elif issubclass(tp, x.ContainerType):
+        elem_type = x.container_elem_type(tp, params)
+        return [gen_value(elem_type, None, depth + 1) for _ in range(tp.SIZE if tp.FIX_SIZE else 1)]
+    elif issubclass(tp, x.VariantType):
+        return gen_value(tp.f_specs()[0][1], None, depth + 1)
+    elif issubclass(tp, x.TupleType):
+        return [gen_value(ftype, None, depth + 1) for ftype in tp.f_specs()]
+    elif issubclass(tp, x.MessageType):
+        msg = tp()
+        for fdef in tp.f_specs():
+            setattr(msg, fdef[0], gen_value(fdef[1], fdef[2:], depth + 1))
+        return msg
+    raise ValueError('Unsupported type %s' % tp.__name__)
+
+
+def rct_context(tx):
+    """
+    RCT type and counts the signatures of the transaction are serialized with
+    """
+    inputs, outputs = len(tx.vin), len(tx.vout)
+    mixin = len(tx.vin[0].key_offsets) - 1 if inputs and isinstance(tx.vin[0], xmr.TxinToKey) else 0
+    return tx.rct_signatures.type, inputs, outputs, mixin
+
+
+def rct_sig_fnc(ctx):
+    """
+    Returns the encode / decode coroutine function of RctSig, base and prunable part as in the transaction
+    """
+    rct_type, inputs, outputs, mixin = ctx
+
+    async def fnc(ar, msg=None):
+        msg = xmr.RctSig() if msg is None else msg
+        await msg.serialize_rctsig_base(ar, inputs, outputs)
+        if not ar.writing:
+            msg.p = xmr.RctSigPrunable()
+        await msg.p.serialize_rctsig_prunable(ar, rct_type, inputs, outputs, mixin)
+        return msg
+    return fnc
+
+
+def rct_prunable_fnc(ctx):
+    """
+    Returns the encode / decode coroutine function of RctSigPrunable
+    """
+    async def fnc(ar, msg=None):
+        msg = xmr.RctSigPrunable() if msg is None else msg
+        await msg.serialize_rctsig_prunable(ar, *ctx)
+        return msg
+    return fnc
+
+
+# samples serialized only within their parent, completed to a standalone message
+COMPLETE = {
+    xmr.CtKey: lambda msg: xmr.CtKey(dest=getattr(msg, 'dest', None) or bytearray(32), mask=msg.mask),  # outPk: mask only
+}
+
+
+async def bench(verbose=True):
+    """
+    Runs the benchmark
+    :param verbose:
+    :return: (list of (name, DecodeStats), list of (unsupported type name, reason))
+    """
+    results, unsupported = [], []
+    reachable = collections.OrderedDict()
+    contexts = {}
+    for name, msg_type, data, archive_fnc, versions in samples():
+        msg, stats = await memprof.decode_allocations(msg_type, data, archive_fnc, versions)
+        results.append((name, stats))
+        memprof.collect_messages(msg, reachable)
+        if archive_fnc is x.Archive and isinstance(msg, xmr.Transaction) and msg.version == 2 \
+                and xmr.RctSig not in contexts:
+            ctx = rct_context(msg)
+            contexts[xmr.RctSig] = (msg.rct_signatures, versions, rct_sig_fnc(ctx))
+            contexts[xmr.RctSigPrunable] = (msg.rct_signatures.p, versions, rct_prunable_fnc(ctx))
+
+        if verbose:
+            print('%-20s %r' % (name, stats))
+            for path, size in memprof.top_fields(msg, limit=5, max_depth=3):
+                print('    %-50s %8d' % (path, size))
+
+    for msg_type in xmr_message_types():
+        if msg_type in contexts:
+            msg, versions, fnc = contexts[msg_type]
+        else:
+            msg, versions, fnc = reachable.get(msg_type), xmr.hf_versions(9), None
+            msg = COMPLETE[msg_type](msg) if msg is not None and msg_type in COMPLETE else msg
+
+        try:
+            msg = gen_value(msg_type) if msg is None else msg
+            data = await encode_bc(msg, versions, fnc)
+            _, stats = await memprof.decode_allocations(msg_type, data, x.Archive, versions, fnc)
+        except (x.helpers.ArchiveException, ValueError) as e:
+            unsupported.append((msg_type.__name__, str(e) or e.__class__.__name__))
+            if verbose:
+                print('%-20s unsupported: %s' % (msg_type.__name__, unsupported[-1][1]))
+            continue
+
+        results.append((msg_type.__name__, stats))
+        if verbose:
+            print('%-20s %r' % (msg_type.__name__, stats))
+    return results, unsupported
+
+
+def main():
+    asyncio.get_event_loop().run_until_complete(bench(True))
+
+
+if __name__ == "__main__":
+    main()
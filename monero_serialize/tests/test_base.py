@@ -10,6 +10,7 @@ import aiounittest
 
 from .. import xmrserialize as x
 from .. import xmrtypes as xmr
+from ..core import keccak
 
 
 __author__ = 'dusanklinec'
@@ -37,6 +38,24 @@ class XmrSerializeBaseTest(aiounittest.AsyncTestCase):
 
             self.assertEqual(test_num, test_deser)
 
+    def test_keccak(self):
+        """
+        Keccak-256, pure Python sponge checked against SHA3-256 with the FIPS-202 padding
+        :return:
+        """
+        import hashlib
+        self.assertEqual(keccak.keccak_hash(b'').hex(),
+                         'c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470')
+        self.assertEqual(keccak.KeccakHash(b'').digest(), keccak.keccak_hash(b''))
+
+        data = bytes(random.getrandbits(8) for _ in range(700))
+        for size in (0, 1, 135, 136, 137, 272, 700):
+            self.assertEqual(keccak.KeccakHash(data[:size], pad=0x06).digest(), hashlib.sha3_256(data[:size]).digest())
+            h = keccak.KeccakHash()
+            for i in range(0, size, 50):
+                h.update(memoryview(data)[i:min(i + 50, size)])
+            self.assertEqual(h.copy().digest(), keccak.keccak_hash(data[:size]))
+
 
 if __name__ == "__main__":
     unittest.main()  # pragma: no cover
@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
 import random
+import re
 import base64
+import binascii
+import itertools
 import unittest
 import pkg_resources
 
@@ -68,6 +72,71 @@ class XmrTestData(object):
         msg = xmr.BoroSig(s0=s0, s1=s1, ee=ee)
         return msg
 
+    def gen_rct_transaction(self, rct_type, inputs=2, outputs=2, mixin=2):
+        """
+        Returns a synthetic v2 transaction with RCT signatures of the given type.
+        Keys are generated locally, cycling through byte offsets, as larger types need hundreds of keys.
+        :param rct_type:
+        :param inputs:
+        :param outputs:
+        :param mixin:
+        :return:
+        """
+        counter = itertools.count()
+
+        def key():
+            offset = next(counter) % 224
+            return bytearray(range(offset, offset + 32))
+
+        T = xmr.RctType
+        vin = [xmr.TxinToKey(amount=0, key_offsets=list(range(1, mixin + 2)), k_image=key()) for _ in range(inputs)]
+        vout = [xmr.TxOut(amount=0, target=xmr.TxoutToKey(key=key())) for _ in range(outputs)]
+        ecdh8 = rct_type in (T.Bulletproof2, T.CLSAG, T.BulletproofPlus)
+        rct = xmr.RctSig(
+            type=rct_type, txnFee=12345,
+            pseudoOuts=[key() for _ in range(inputs)] if rct_type == T.Simple else [],
+            ecdhInfo=[xmr.EcdhTuple(mask=bytearray(32) if ecdh8 else key(),
+                                    amount=key()[:8] + bytearray(24) if ecdh8 else key()) for _ in range(outputs)],
+            outPk=[xmr.CtKey(dest=bytearray(32), mask=key()) for _ in range(outputs)])
+
+        is_full = rct_type == T.Full
+        prunable = xmr.RctSigPrunable(rangeSigs=[], bulletproofs=[], bulletproofs_plus=[], MGs=[], CLSAGs=[],
+                                      pseudoOuts=[key() for _ in range(inputs)] if xmr.is_rct_bp(rct_type) else [])
+        if rct_type == T.BulletproofPlus:
+            prunable.bulletproofs_plus = [xmr.BulletproofPlus(A=key(), A1=key(), B=key(), r1=key(), s1=key(), d1=key(),
+                                                              L=[key() for _ in range(7)], R=[key() for _ in range(7)])]
+        elif xmr.is_rct_bp(rct_type):
+            prunable.bulletproofs = [xmr.Bulletproof(A=key(), S=key(), T1=key(), T2=key(), taux=key(), mu=key(),
+                                                     L=[key() for _ in range(7)], R=[key() for _ in range(7)],
+                                                     a=key(), b=key(), t=key())]
+        else:
+            prunable.rangeSigs = [
+                xmr.RangeSig(asig=xmr.BoroSig(s0=[key() for _ in range(64)], s1=[key() for _ in range(64)], ee=key()),
+                             Ci=[key() for _ in range(64)])
+                for _ in range(outputs)]
+
+        if rct_type in (T.CLSAG, T.BulletproofPlus):
+            prunable.CLSAGs = [xmr.CLSAG(s=[key() for _ in range(mixin + 1)], c1=key(), D=key()) for _ in range(inputs)]
+        else:
+            ss2 = 1 + (inputs if is_full else 1)
+            prunable.MGs = [xmr.MgSig(ss=[[key() for _ in range(ss2)] for _ in range(mixin + 1)], cc=key())
+                            for _ in range(1 if is_full else inputs)]
+
+        rct.p = prunable
+        return xmr.Transaction(version=2, unlock_time=0, vin=vin, vout=vout, extra=bytearray(b'\x01' + key()),
+                               rct_signatures=rct)
+
+    def load_tx_hf(self, hf):
+        """
+        Returns (tx blob, tx hash) of the test transaction for the hard fork, BC format.
+        :param hf: 13 or 15
+        :return:
+        """
+        data = pkg_resources.resource_string(__name__, os.path.join('data', 'tx_hf%d.txt' % hf))
+        tx_hex = re.search(rb'"tx_hex":\s*"([0-9a-fA-F]+)"', data).group(1)
+        tx_hash = re.search(rb'"tx_hash":\s*"([0-9a-fA-F]+)"', data).group(1)
+        return binascii.unhexlify(tx_hex), binascii.unhexlify(tx_hash)
+
 
 if __name__ == "__main__":
     unittest.main()  # pragma: no cover
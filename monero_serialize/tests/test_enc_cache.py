@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import unittest
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+
+
+__author__ = 'dusanklinec'
+
+
+class XmrEncCacheTest(aiounittest.AsyncTestCase):
+    """Encoding cache tests"""
+
+    CACHED = (xmr.TransactionPrefix, xmr.RctSig, xmr.RctSigPrunable, xmr.TxinToKey)
+
+    def __init__(self, *args, **kwargs):
+        super(XmrEncCacheTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+        for tp in self.CACHED:
+            tp.set_enc_cache(True)
+
+    def tearDown(self):
+        for tp in self.CACHED:
+            tp.set_enc_cache(False)
+
+    async def dump(self, msg, msg_type=None, hf=13):
+        writer = x.MemoryReaderWriter()
+        ar = x.Archive(writer, True, xmr.hf_versions(hf))
+        await ar.message(msg, msg_type)
+        return bytes(writer.get_buffer())
+
+    async def load(self, data, hf=13):
+        reader = x.MemoryReaderWriter(bytearray(data))
+        ar = x.Archive(reader, False, xmr.hf_versions(hf))
+        return await ar.message(None, xmr.Transaction)
+
+    async def test_redump(self):
+        for hf in (13, 15):
+            tx_bin, _ = self.test_data.load_tx_hf(hf)
+            msg = await self.load(tx_bin, hf)
+            self.assertIsNotNone(msg.get_enc_cache())
+            self.assertIsNotNone(msg.rct_signatures.p.get_enc_cache())
+            self.assertEqual(await self.dump(msg, hf=hf), tx_bin)
+            self.assertEqual(await self.dump(msg, hf=hf), tx_bin)
+
+            # Cache is per archive setting
+            prefix = await self.dump(msg, xmr.TransactionPrefix, hf=hf)
+            self.assertTrue(tx_bin.startswith(prefix))
+
+    async def test_cache_hit(self):
+        tx_bin, _ = self.test_data.load_tx_hf(13)
+        msg = await self.load(tx_bin)
+        cache = msg.get_enc_cache()
+        key = list(cache.data.keys())[0]
+        cache.data[key] = b'cached'
+        self.assertEqual(await self.dump(msg), b'cached')
+
+    async def test_invalidation(self):
+        tx_bin, _ = self.test_data.load_tx_hf(13)
+        msg = await self.load(tx_bin)
+
+        msg.unlock_time = 1
+        self.assertIsNone(msg.get_enc_cache())
+        self.assertIsNotNone(msg.rct_signatures.p.get_enc_cache())
+        data = await self.dump(msg)
+        self.assertIsNotNone(msg.rct_signatures.get_enc_cache())
+        self.assertNotEqual(data, tx_bin)
+        self.assertEqual(await self.dump(msg), data)
+
+        # Nested invalidation propagates to the parents
+        msg.unlock_time = 0
+        await self.dump(msg)
+        self.assertIsNotNone(msg.get_enc_cache())
+        msg.rct_signatures.txnFee += 1
+        self.assertIsNone(msg.rct_signatures.get_enc_cache())
+        self.assertIsNone(msg.get_enc_cache())
+
+        msg.rct_signatures.txnFee -= 1
+        await self.dump(msg)
+        msg.vin[0].amount = 0
+        self.assertIsNone(msg.vin[0].get_enc_cache())
+        self.assertIsNone(msg.get_enc_cache())
+
+        # In-place change needs explicit invalidation
+        self.assertEqual(await self.dump(msg), tx_bin)
+        msg.vin[0].key_offsets[0] += 1
+        msg.vin[0].invalidate_enc_cache()
+        data = await self.dump(msg)
+        self.assertNotEqual(data, tx_bin)
+        for tp in self.CACHED:
+            tp.set_enc_cache(False)
+        self.assertEqual(await self.dump(msg), data)
+
+    async def test_nested_invalidation(self):
+        tx_bin, _ = self.test_data.load_tx_hf(13)
+        msg = await self.load(tx_bin)
+        self.assertEqual(await self.dump(msg), tx_bin)
+
+        # messages without own cache are tracked too
+        msg.vout[0].amount += 1
+        self.assertIsNone(msg.get_enc_cache())
+        data = await self.dump(msg)
+        self.assertNotEqual(data, tx_bin)
+        msg.vout[0].amount -= 1
+        self.assertEqual(await self.dump(msg), tx_bin)
+
+        msg.vout[0].target.key = bytearray(32)
+        self.assertNotEqual(await self.dump(msg), tx_bin)
+        msg = await self.load(tx_bin)
+        self.assertEqual(await self.dump(msg), tx_bin)
+
+        # nested in the cached prunable part, built by dump
+        msg.rct_signatures.p.CLSAGs[0].D = bytearray(32)
+        self.assertIsNone(msg.rct_signatures.p.get_enc_cache())
+        self.assertIsNone(msg.get_enc_cache())
+        data = await self.dump(msg)
+        self.assertNotEqual(data, tx_bin)
+        msg.rct_signatures.p.CLSAGs[0].D = bytearray(32)
+        self.assertEqual(await self.dump(msg), data)
+        msg.rct_signatures.outPk[0].mask = bytearray(32)
+        self.assertNotEqual(await self.dump(msg), data)
+
+        for tp in self.CACHED:
+            tp.set_enc_cache(False)
+        self.assertIs(xmr.TxOut.__setattr__, object.__setattr__)
+        self.assertIs(xmr.CtKey.__setattr__, object.__setattr__)
+
+    async def test_disabled(self):
+        for tp in self.CACHED:
+            tp.set_enc_cache(False)
+        msg = self.test_data.gen_transaction_prefix()
+        await self.dump(msg)
+        self.assertIsNone(msg.get_enc_cache())
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import tracemalloc
+import unittest
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+
+
+__author__ = 'dusanklinec'
+
+
+class SlowArchive(x.Archive):
+    FIXED_LAYOUT = False
+
+
+class XmrFixedLayoutTest(aiounittest.AsyncTestCase):
+    """Fixed-layout message codecs"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrFixedLayoutTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    async def dump(self, msg, msg_type=None, archive=x.Archive):
+        writer = x.MemoryReaderWriter()
+        await archive(writer, True).field(msg, msg_type)
+        return bytes(writer.get_buffer())
+
+    async def load(self, data, msg_type, archive=x.Archive):
+        reader = x.MemoryReaderWriter(bytearray(data))
+        res = await archive(reader, False).field(None, msg_type)
+        self.assertTrue(reader.is_empty())
+        return res
+
+    def test_detection(self):
+        self.assertEqual(x.fixed_layout(xmr.CtKey).size, 64)
+        self.assertEqual(x.fixed_layout(xmr.EcdhTuple).size, 64)
+        self.assertEqual(x.fixed_layout(xmr.MultisigLR).size, 64)
+        self.assertEqual(x.fixed_layout(xmr.AccountPublicAddress).size, 64)
+        self.assertEqual(x.fixed_layout(xmr.SubaddressIndex).size, 8)
+        self.assertEqual(x.fixed_layout(xmr.TransactionMetaData).size, 24)
+        self.assertTrue(x.fixed_layout(xmr.TransactionMetaData).ints_only)
+        self.assertIsNone(x.fixed_layout(xmr.TxinToKey))
+        self.assertIsNone(x.fixed_layout(xmr.TxOut))
+        self.assertIsNone(x.fixed_layout(xmr.TxDestinationEntry))
+
+    async def test_message(self):
+        msgs = [
+            (xmr.CtKey(dest=self.test_data.generate_ec_key(), mask=self.test_data.generate_ec_key()), None),
+            (xmr.SubaddressIndex(major=1, minor=2 ** 32 - 1), None),
+            (xmr.TransactionMetaData(tx_id=1, unlock_time=2 ** 64 - 1, block_id=3), None),
+            ([xmr.CtKey(dest=self.test_data.generate_ec_key(), mask=self.test_data.generate_ec_key())
+              for _ in range(3)], xmr.CtkeyV),
+            ([xmr.SubaddressIndex(major=i, minor=i + 1) for i in range(4)], x.ContainerType),
+        ]
+
+        for msg, msg_type in msgs:
+            if msg_type is x.ContainerType:
+                msg_type = type('SubaddressIndexV', (x.ContainerType,), {'ELEM_TYPE': xmr.SubaddressIndex})
+
+            data = await self.dump(msg, msg_type)
+            self.assertEqual(data, await self.dump(msg, msg_type, SlowArchive))
+
+            res = await self.load(data, msg_type if msg_type else msg.__class__)
+            self.assertEqual(res, msg)
+            self.assertEqual(res, await self.load(data, msg_type if msg_type else msg.__class__, SlowArchive))
+
+    def gen_prunable(self, inputs, mixin):
+        key = self.test_data.generate_ec_key
+        bp = xmr.Bulletproof(A=key(), S=key(), T1=key(), T2=key(), taux=key(), mu=key(),
+                             L=[key() for _ in range(7)], R=[key() for _ in range(7)], a=key(), b=key(), t=key())
+        mgs = [xmr.MgSig(ss=[[key(), key()] for _ in range(mixin + 1)], cc=key()) for _ in range(inputs)]
+        return xmr.RctSigPrunable(bulletproofs=[bp], MGs=mgs, pseudoOuts=[key() for _ in range(inputs)])
+
+    async def test_blob_vectors(self):
+        inputs, outputs, mixin = 2, 1, 3
+        msg = self.gen_prunable(inputs, mixin)
+
+        async def dump(archive):
+            writer = x.MemoryReaderWriter()
+            await msg.serialize_rctsig_prunable(archive(writer, True), xmr.RctType.Bulletproof2, inputs, outputs, mixin)
+            return bytes(writer.get_buffer())
+
+        async def load(data, archive):
+            reader = x.MemoryReaderWriter(bytearray(data))
+            res = xmr.RctSigPrunable()
+            await res.serialize_rctsig_prunable(archive(reader, False), xmr.RctType.Bulletproof2, inputs, outputs, mixin)
+            self.assertTrue(reader.is_empty())
+            return res
+
+        data = await dump(x.Archive)
+        self.assertEqual(data, await dump(SlowArchive))
+
+        res = await load(data, x.Archive)
+        self.assertEqual(res, msg)
+        self.assertEqual(res, await load(data, SlowArchive))
+        self.assertIsInstance(res.MGs[1].ss[3][1], bytearray)
+
+        msg.MGs[0].ss[0].append(self.test_data.generate_ec_key())
+        with self.assertRaises(ValueError):
+            await dump(x.Archive)
+
+    async def test_signatures_v1(self):
+        key = self.test_data.generate_ec_key
+        ring_sizes = [3, 1, 4]
+        msg = xmr.Transaction(version=1, unlock_time=0, extra=bytearray([1, 2, 3]), vout=[],
+                              vin=[xmr.TxinToKey(amount=10 + i, key_offsets=list(range(1, r + 1)), k_image=key())
+                                   for i, r in enumerate(ring_sizes)],
+                              signatures=[[xmr.Signature(c=key(), r=key()) for _ in range(r)] for r in ring_sizes])
+
+        data = await self.dump(msg, xmr.Transaction)
+        self.assertEqual(data, await self.dump(msg, xmr.Transaction, SlowArchive))
+
+        res = await self.load(data, xmr.Transaction)
+        self.assertEqual(res, msg)
+        self.assertEqual(res, await self.load(data, xmr.Transaction, SlowArchive))
+        self.assertEqual([len(sigs) for sigs in res.signatures], ring_sizes)
+        self.assertIsInstance(res.signatures[2][3].r, bytearray)
+
+        msg.signatures[1].append(xmr.Signature(c=key(), r=key()))
+        with self.assertRaises(ValueError):
+            await self.dump(msg, xmr.Transaction)
+
+    async def test_byte_vectors(self):
+        msg = self.test_data.gen_transaction_prefix()
+        data = await self.dump(msg, xmr.TransactionPrefix)
+        msg.extra = list(msg.extra)
+        self.assertEqual(data, await self.dump(msg, xmr.TransactionPrefix))
+        self.assertEqual(data, await self.dump(msg, xmr.TransactionPrefixExtraBlob))
+
+        res = await self.load(data, xmr.TransactionPrefix)
+        self.assertIsInstance(res.extra, bytearray)
+        self.assertEqual(res.extra, bytearray(range(31)))
+        self.assertEqual(res.extra, list(range(31)))
+        self.assertEqual(list(range(31)), res.extra)
+        self.assertNotEqual(res.extra, list(range(30)))
+        self.assertEqual(res, await self.load(data, xmr.TransactionPrefix, SlowArchive))
+
+        msg.extra[0] = 256
+        with self.assertRaises(x.helpers.ArchiveException):
+            await self.dump(msg, xmr.TransactionPrefix)
+
+    async def test_errors(self):
+        with self.assertRaises(x.helpers.ArchiveException):
+            await self.dump(xmr.CtKey(dest=bytearray(31), mask=bytearray(32)))
+        with self.assertRaises(x.helpers.ArchiveException):
+            await self.load(bytearray(63), xmr.CtKey)
+
+        # counts from garbage input, larger than the remaining data
+        huge = b'\xff' * 9 + b'\x01'
+        for data in (huge + bytes(64), b'\x80\x80\x04' + bytes(64 * 100)):
+            with self.assertRaises(x.helpers.ArchiveException):
+                await self.load(data, xmr.CtkeyV)
+            with self.assertRaises(x.helpers.ArchiveException):
+                await self.load(data, xmr.KeyV)
+
+        # the read buffer is bounded by the input, not by the declared count
+        tracemalloc.start()
+        try:
+            with self.assertRaises(x.helpers.ArchiveException):
+                await self.load(b'\x80\x80\x80\x08' + bytes(64), xmr.KeyV)  # 2**24 keys
+            self.assertLess(tracemalloc.get_traced_memory()[1], 1 << 20)
+        finally:
+            tracemalloc.stop()
+
+    async def test_byte_vector_errors(self):
+        # version, unlock_time, no inputs and outputs, then extra with 2**24 bytes declared
+        data = b'\x01\x00\x00\x00' + b'\x80\x80\x80\x08' + bytes(64)
+        tracemalloc.start()
+        try:
+            with self.assertRaises(x.helpers.ArchiveException):
+                await self.load(data, xmr.TransactionPrefix)
+            self.assertLess(tracemalloc.get_traced_memory()[1], 1 << 20)
+        finally:
+            tracemalloc.stop()
+
+    async def test_container_arg(self):
+        keys = [xmr.CtKey(dest=self.test_data.generate_ec_key(), mask=self.test_data.generate_ec_key())
+                for _ in range(3)]
+        data = await self.dump(keys, xmr.CtkeyV)
+        for archive in (x.Archive, SlowArchive):
+            ar = archive(x.MemoryReaderWriter(bytearray(data)), False)
+            container = [xmr.CtKey() for _ in range(3)]
+            res = await ar.container(container, xmr.CtkeyV)
+            self.assertIs(res, container)
+            self.assertEqual(res, keys)
+
+            ar = archive(x.MemoryReaderWriter(bytearray(data)), False)
+            self.assertEqual(await ar.container([], xmr.CtkeyV), keys)
+
+            # byte vector into a passed list is filled element-wise
+            ar = archive(x.MemoryReaderWriter(bytearray(b'\x03\x07\x08\x09')), False)
+            container = [0, 0, 0]
+            res = await ar.container(container, x.ContainerType, params=(x.UInt8,))
+            self.assertIs(res, container)
+            self.assertEqual(res, [7, 8, 9])
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
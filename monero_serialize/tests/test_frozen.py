@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import pickle
+import unittest
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import frozen
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+
+
+__author__ = 'dusanklinec'
+
+
+class XmrFrozenTest(aiounittest.AsyncTestCase):
+    """Frozen message tests"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrFrozenTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    def test_freeze(self):
+        msg = xmr.TxOut(amount=10, target=xmr.TxoutToKey(key=self.test_data.generate_ec_key()))
+        fmsg = frozen.freeze(msg)
+
+        self.assertIsInstance(fmsg, xmr.TxOut)
+        self.assertIsInstance(fmsg.target, xmr.TxoutToKey)
+        self.assertTrue(frozen.is_frozen(fmsg.target))
+        self.assertIsInstance(fmsg.target.key, bytes)
+        self.assertIs(frozen.freeze(fmsg), fmsg)
+        self.assertIs(frozen.frozen_type(xmr.TxOut), fmsg.__class__)
+
+        with self.assertRaises(AttributeError):
+            fmsg.amount = 11
+        with self.assertRaises(AttributeError):
+            fmsg.target.key = b'\x00' * 32
+
+        self.assertEqual(fmsg.digest(), frozen.hashlib.sha256(frozen.encode(msg)).digest())
+        self.assertEqual(frozen.thaw(fmsg), msg)
+        self.assertEqual(pickle.loads(pickle.dumps(fmsg)), fmsg)
+
+    def test_hash(self):
+        keys = [self.test_data.generate_ec_key() for _ in range(4)]
+        msgs = [xmr.CtKey(dest=keys[i], mask=keys[i + 1]) for i in range(3)]
+        frozen_msgs = [frozen.freeze(m) for m in msgs]
+        dups = [frozen.freeze(xmr.CtKey(dest=bytearray(m.dest), mask=bytearray(m.mask))) for m in msgs]
+
+        self.assertEqual(dups, frozen_msgs)
+        self.assertEqual(len(set(frozen_msgs + dups)), 3)
+        self.assertNotEqual(frozen_msgs[0], frozen_msgs[1])
+
+        lookup = {m: i for i, m in enumerate(frozen_msgs)}
+        self.assertEqual(lookup[dups[2]], 2)
+
+        # Same encoding, different type
+        addr = frozen.freeze(xmr.AccountPublicAddress(m_spend_public_key=keys[0], m_view_public_key=keys[1]))
+        self.assertEqual(addr.digest(), frozen_msgs[0].digest())
+        self.assertNotEqual(addr, frozen_msgs[0])
+
+    def test_hash_partial(self):
+        tx_bin, _ = self.test_data.load_tx_hf(15)
+        reader = x.MemoryReaderWriter(bytearray(tx_bin))
+        ar = x.Archive(reader, False, xmr.hf_versions(15))
+        tx = x.helpers.run_sync(ar.message(None, xmr.Transaction))
+
+        # decoded outPk entries have only the mask
+        out_pk = [frozen.freeze(pk) for pk in tx.rct_signatures.outPk]
+        self.assertFalse(hasattr(out_pk[0], 'dest'))
+        self.assertEqual(len(set(out_pk)), len(out_pk))
+        lookup = {pk: i for i, pk in enumerate(out_pk)}
+        for i, pk in enumerate(tx.rct_signatures.outPk):
+            dup = frozen.freeze(xmr.CtKey(mask=bytearray(pk.mask)))
+            self.assertEqual(dup, out_pk[i])
+            self.assertEqual(lookup[dup], i)
+
+        full = frozen.freeze(xmr.CtKey(dest=bytes(32), mask=out_pk[0].mask))
+        self.assertNotEqual(full, out_pk[0])
+        self.assertNotEqual(frozen.freeze(xmr.CtKey(dest=out_pk[0].mask)), out_pk[0])
+        self.assertEqual(full.digest(), frozen.hashlib.sha256(frozen.encode(full)).digest())
+
+    def test_freeze_tx(self):
+        tx_bin, _ = self.test_data.load_tx_hf(15)
+        reader = x.MemoryReaderWriter(bytearray(tx_bin))
+        ar = x.Archive(reader, False, xmr.hf_versions(15))
+        tx = x.helpers.run_sync(ar.message(None, xmr.Transaction))
+
+        ftx = frozen.freeze(tx)
+        self.assertIsInstance(ftx.vin, tuple)
+        self.assertEqual(frozen.encode(ftx, versions=xmr.hf_versions(15)), tx_bin)
+        self.assertEqual(len(set(ftx.vout)), len(tx.vout))
+        self.assertEqual(frozen.thaw(ftx), tx)
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import memprof
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+
+
+__author__ = 'dusanklinec'
+
+
+class XmrMemprofTest(aiounittest.AsyncTestCase):
+    """Memory profiler tests"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrMemprofTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    def test_field_sizes(self):
+        msg = self.test_data.gen_transaction_prefix()
+        total = memprof.deep_sizeof(msg)
+        sizes = memprof.field_sizes(msg)
+
+        self.assertEqual(sizes[''], total)
+        self.assertIn('.vin[0].k_image', sizes)
+        self.assertEqual(sizes['.vin[0].k_image'], sys.getsizeof(msg.vin[0].k_image))
+        self.assertEqual(sizes['.vout'], memprof.deep_sizeof(msg.vout))
+
+        agg = memprof.field_sizes(msg, aggregate=True)
+        self.assertIn('.vout[].target.key', agg)
+        self.assertEqual(agg['.vout[].target.key'], sum(sys.getsizeof(o.target.key) for o in msg.vout))
+
+        shallow = memprof.field_sizes(msg, max_depth=1)
+        self.assertEqual(shallow[''], total)
+        self.assertNotIn('.vin[0]', shallow)
+
+    def test_variant_walk(self):
+        inner = xmr.TxinGen(height=42)
+        msg = xmr.TxInV()
+        msg.set_variant('txin_gen', inner)
+        sizes = memprof.field_sizes(msg)
+        self.assertIn('.txin_gen', sizes)
+        self.assertEqual(sizes['.txin_gen'], memprof.deep_sizeof(inner))
+
+    async def test_decode_allocations(self):
+        msg = self.test_data.gen_transaction_prefix()
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True).message(msg)
+
+        msg2, stats = await memprof.decode_allocations(xmr.TransactionPrefix, writer.get_buffer())
+        self.assertEqual(msg, msg2)
+        self.assertEqual(stats.blob_size, len(writer.get_buffer()))
+        self.assertGreater(stats.peak, 0)
+        self.assertGreater(stats.retained, 0)
+        self.assertEqual(stats.deep_size, memprof.deep_sizeof(msg2))
+
+        types = memprof.collect_messages(msg2)
+        self.assertIn(xmr.TxinToKey, types)
+        self.assertIn(xmr.TxoutToKey, types)
+
+    async def test_decode_allocations_context(self):
+        tx_bin, _ = self.test_data.load_tx_hf(15)
+        reader = x.MemoryReaderWriter(bytearray(tx_bin))
+        tx = await x.Archive(reader, False, xmr.hf_versions(15)).message(None, xmr.Transaction)
+        inputs, outputs = len(tx.vin), len(tx.vout)
+
+        writer = x.MemoryReaderWriter()
+        await tx.rct_signatures.serialize_rctsig_base(x.Archive(writer, True), inputs, outputs)
+
+        async def decode(ar):
+            msg = xmr.RctSigBase()
+            await msg.serialize_rctsig_base(ar, inputs, outputs)
+            return msg
+
+        msg, stats = await memprof.decode_allocations(xmr.RctSigBase, writer.get_buffer(), decode_fnc=decode)
+        self.assertEqual(msg.outPk, tx.rct_signatures.outPk)
+        self.assertEqual(stats.msg_type, xmr.RctSigBase)
+        self.assertGreater(stats.retained, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import tracemalloc
+import unittest
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+
+
+__author__ = 'dusanklinec'
+
+
+class XmrReuseTest(aiounittest.AsyncTestCase):
+    """Decoding in the reuse mode"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrReuseTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    async def load(self, data, hf, msg=None, reuse=False):
+        reader = x.MemoryReaderWriter(bytearray(data))
+        ar = x.Archive(reader, False, xmr.hf_versions(hf), reuse=reuse)
+        res = await ar.message(msg, xmr.Transaction)
+        self.assertTrue(reader.is_empty())
+        return res
+
+    async def dump(self, msg, hf):
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True, xmr.hf_versions(hf)).message(msg)
+        return bytes(writer.get_buffer())
+
+    async def test_reuse_tx(self):
+        tx13, _ = self.test_data.load_tx_hf(13)
+        tx15, _ = self.test_data.load_tx_hf(15)
+
+        msg = await self.load(tx13, 13)
+        vin, vin0, k_image = msg.vin, msg.vin[0], msg.vin[0].k_image
+        clsags = msg.rct_signatures.p.CLSAGs
+
+        res = await self.load(tx15, 15, msg, reuse=True)
+        self.assertIs(res, msg)
+        self.assertEqual(await self.dump(msg, 15), tx15)
+        self.assertIs(msg.vin, vin)
+        self.assertIs(msg.vin[0], vin0)
+        self.assertIs(msg.vin[0].k_image, k_image)
+        self.assertIs(msg.rct_signatures.p.CLSAGs, clsags)
+        self.assertIsNone(getattr(msg.rct_signatures.p, 'bulletproofs', None))
+
+        await self.load(tx13, 13, msg, reuse=True)
+        self.assertEqual(await self.dump(msg, 13), tx13)
+        self.assertIs(msg.vin[0], vin0)
+
+    async def test_reuse_shapes(self):
+        msg = self.test_data.gen_transaction_prefix()
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True).message(msg)
+        data = bytes(writer.get_buffer())
+
+        prev = xmr.TransactionPrefix(vin=[xmr.TxinGen(height=1)] * 5, vout=[], extra=list(range(64)))
+        prev_vout = prev.vout
+
+        reader = x.MemoryReaderWriter()
+        ar = x.Archive(reader, False, reuse=True)
+        for _ in range(2):
+            reader.reset(bytearray(data))
+            ar.reset()
+            await ar.message(prev)
+            self.assertEqual(prev, msg)
+            self.assertIs(prev.vout, prev_vout)
+
+    async def test_reuse_byte_vector(self):
+        tx13, _ = self.test_data.load_tx_hf(13)
+        msg = await self.load(tx13, 13)
+        extra = msg.extra
+        self.assertIsInstance(extra, bytearray)
+
+        other = await self.load(tx13, 13)
+        other.extra = other.extra[:33]
+        data = await self.dump(other, 13)
+
+        await self.load(data, 13, msg, reuse=True)
+        self.assertIs(msg.extra, extra)
+        self.assertEqual(msg, await self.load(data, 13))
+        await self.load(tx13, 13, msg, reuse=True)
+        self.assertEqual(len(msg.extra), 131)
+        self.assertEqual(await self.dump(msg, 13), tx13)
+
+    async def test_reuse_lengths(self):
+        # byte vectors of varying lengths decoded into the same object, as in a stream of transactions
+        blobs = []
+        for ln in (31, 0, 200, 33, 31):
+            msg = self.test_data.gen_transaction_prefix()
+            msg.extra = list(range(ln))
+            msg.vout[1].target = xmr.TxoutToScript(keys=[bytearray(range(32))] * (ln % 3), script=list(range(ln // 2)))
+            writer = x.MemoryReaderWriter()
+            await x.Archive(writer, True).message(msg)
+            blobs.append(bytes(writer.get_buffer()))
+
+        prev = None
+        reader = x.MemoryReaderWriter()
+        ar = x.Archive(reader, False, reuse=True)
+        for data in blobs + blobs[::-1]:
+            reader.reset(bytearray(data))
+            ar.reset()
+            prev = await ar.message(prev, xmr.TransactionPrefix)
+            self.assertTrue(reader.is_empty())
+
+            fresh = await x.Archive(x.MemoryReaderWriter(bytearray(data)), False).message(None, xmr.TransactionPrefix)
+            self.assertEqual(prev, fresh)
+            self.assertEqual(len(prev.extra), len(fresh.extra))
+            self.assertEqual(prev.vout[1].target.script, fresh.vout[1].target.script)
+
+    async def test_reuse_blob(self):
+        async def load(data, msg):
+            ar = x.Archive(x.MemoryReaderWriter(bytearray(data)), False, reuse=True)
+            return await ar.message(msg, xmr.TransactionPrefixExtraBlob)
+
+        msg = self.test_data.gen_transaction_prefix()
+        for ln in (200000, 10, 0, 70000):
+            msg.extra = bytearray(i & 0xff for i in range(ln))
+            writer = x.MemoryReaderWriter()
+            await x.Archive(writer, True).message(msg, xmr.TransactionPrefixExtraBlob)
+            prev = await load(writer.get_buffer(), xmr.TransactionPrefixExtraBlob(extra=bytearray(5)))
+            self.assertEqual(prev.extra, msg.extra)
+
+        # extra with 2**24 bytes declared, the buffer grows with the data read only
+        data = b'\x01\x00\x00\x00' + b'\x80\x80\x80\x08' + bytes(64)
+        tracemalloc.start()
+        try:
+            with self.assertRaises(x.helpers.ArchiveException):
+                await load(data, xmr.TransactionPrefixExtraBlob(extra=bytearray(5)))
+            self.assertLess(tracemalloc.get_traced_memory()[1], 1 << 20)
+        finally:
+            tracemalloc.stop()
+
+    async def test_writer_reset(self):
+        writer = x.MemoryReaderWriter()
+        await writer.awrite(b'\x01' * 40)
+        buffer = writer.buffer
+        writer.reset()
+        self.assertEqual(bytes(writer.get_buffer()), b'\x01' * 40)
+        writer.truncate(0)
+        await writer.awrite(b'\x02' * 3)
+        self.assertEqual(bytes(writer.get_buffer()), b'\x02' * 3)
+        self.assertIs(writer.buffer, buffer)
+
+    async def test_reader_reset(self):
+        msg = self.test_data.gen_transaction_prefix()
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True).message(msg)
+
+        reader = x.MemoryReaderWriter(bytearray(writer.get_buffer()))
+        ar = x.Archive(reader, False, reuse=True)
+        prev = await ar.message(None, xmr.TransactionPrefix)
+        for _ in range(2):
+            reader.reset()
+            ar.reset()
+            self.assertFalse(reader.is_empty())
+            self.assertIs(await ar.message(prev, xmr.TransactionPrefix), prev)
+            self.assertTrue(reader.is_empty())
+            self.assertEqual(prev, msg)
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -13,6 +13,7 @@ from .test_data import XmrTestData
 from .. import xmrserialize as x
 from .. import xmrtypes as xmr
 from ..core.readwriter import MemoryReaderWriter
+from ..core.keccak import keccak_hash
 
 
 __author__ = 'dusanklinec'
@@ -61,6 +62,29 @@ class XmrTypesBaseTest(aiounittest.AsyncTestCase):
         self.assertEqual(msg.height, msg2.height)
         self.assertEqual(msg2, test_deser)
 
+    def test_message_slots(self):
+        """
+        Slots derived from MFIELDS, no per-instance dict
+        :return:
+        """
+        for msg_type in (xmr.TransactionPrefix, xmr.Transaction, xmr.BlockHeader, xmr.Block,
+                         xmr.TransferDetails, xmr.TxSourceEntry, xmr.PendingTransaction, xmr.TxConstructionData):
+            msg = msg_type()
+            self.assertFalse(hasattr(msg, '__dict__'))
+            self.assertEqual(set(x.cls_slots(msg_type)), set(f[0] for f in msg_type.f_specs()))
+
+        self.assertEqual(xmr.Transaction.__slots__, ('signatures', 'rct_signatures'))
+        self.assertIn('II', x.cls_slots(xmr.MgSig))
+        with self.assertRaises(AttributeError):
+            xmr.TransactionPrefix().unknown_field = 1
+
+        msg = self.test_data.gen_transaction_prefix()
+        msg2 = self.test_data.gen_transaction_prefix()
+        self.assertEqual(msg, msg2)
+        msg2.unlock_time += 1
+        self.assertNotEqual(msg, msg2)
+        self.assertIn('unlock_time', repr(msg2))
+
     async def test_ecpoint(self):
         """
         Ec point
@@ -413,6 +437,74 @@ class XmrTypesBaseTest(aiounittest.AsyncTestCase):
         self.assertEqual(len(msg.rct_signatures.p.pseudoOuts), 4)
         self.assertEqual(bytes(msg.rct_signatures.p.pseudoOuts[-1]), binascii.unhexlify(b'6e2dde4e065d98c807053fc75c8a6ebc684dc46f534d035cd7e8b28d6547a7ce'))
 
+    def test_variant_dispatch(self):
+        self.assertEqual(xmr.TxInV.fdef_by_code(0xff)[1], xmr.TxinGen)
+        self.assertEqual(xmr.TxInV.fdef_by_code(0x0, boost=True)[1], xmr.TxinGen)
+        self.assertEqual(xmr.TxInV.fdef_by_code(0x2)[1], xmr.TxinToKey)
+        self.assertIsNone(xmr.TxInV.fdef_by_code(0x7))
+        self.assertEqual(xmr.TxExtraField.fdef_by_name('tx_extra_nonce')[1], xmr.TxExtraNonce)
+        self.assertEqual(xmr.TxoutTargetV.fdef_by_elem(xmr.TxoutToKey())[0], 'txout_to_key')
+        self.assertIs(x.variant_dispatch(xmr.TxInV), x.variant_dispatch(xmr.TxInV))
+
+        class TxinToKeyEx(xmr.TxinToKey):
+            pass
+        self.assertEqual(xmr.TxInV.fdef_by_elem(TxinToKeyEx())[1], xmr.TxinToKey)
+        with self.assertRaises(ValueError):
+            xmr.TxInV.fdef_by_elem(xmr.TxOut())
+
+    async def test_prepare_container(self):
+        ar = x.Archive(x.MemoryReaderWriter(), False)
+        self.assertEqual(await ar.prepare_container(3, None, xmr.CLSAG), [None] * 3)
+
+        msg = xmr.CLSAG(s=[bytearray(32)])
+        await ar.prepare_container(2, x.eref(msg, 's'), xmr.KeyV)
+        self.assertEqual(msg.s, [bytearray(32), None])
+
+        tx_bin, _ = self.test_data.load_tx_hf(13)
+        ar = x.Archive(x.MemoryReaderWriter(bytearray(tx_bin)), False, xmr.hf_versions(13))
+        msg = await ar.message(None, xmr.Transaction)
+        self.assertIsInstance(msg.rct_signatures.p.pseudoOuts[0], bytearray)
+        self.assertIsInstance(msg.rct_signatures.p.CLSAGs[0].s[0], bytearray)
+        self.assertIsInstance(msg.rct_signatures.outPk[0], xmr.CtKey)
+
+    async def test_pre_mlsag_hash(self):
+        """
+        Pre MLSAG hash, streamed vs. assembled from the serialized parts
+        :return:
+        """
+        txs = []
+        for hf in (13, 15):
+            tx_bin, _ = self.test_data.load_tx_hf(hf)
+            reader = x.MemoryReaderWriter(bytearray(tx_bin))
+            txs.append(await x.Archive(reader, False, xmr.hf_versions(hf)).message(None, xmr.Transaction))
+        for rct_type in (xmr.RctType.Full, xmr.RctType.Simple, xmr.RctType.Bulletproof):
+            txs.append(self.test_data.gen_rct_transaction(rct_type, inputs=3, outputs=2))
+
+        expected = []
+        for tx in txs:
+            rv = tx.rct_signatures
+            writer = x.MemoryReaderWriter()
+            await x.Archive(writer, True).message(tx, xmr.TransactionPrefix)
+            rv.message = keccak_hash(writer.get_buffer())
+
+            writer = x.MemoryReaderWriter()
+            await rv.serialize_rctsig_base(x.Archive(writer, True), len(tx.vin), len(tx.vout))
+            p = rv.p
+            if rv.type == xmr.RctType.BulletproofPlus:
+                kv = [k for bp in p.bulletproofs_plus for k in [bp.A, bp.A1, bp.B, bp.r1, bp.s1, bp.d1] + bp.L + bp.R]
+            elif xmr.is_rct_bp(rv.type):
+                kv = [k for bp in p.bulletproofs
+                      for k in [bp.A, bp.S, bp.T1, bp.T2, bp.taux, bp.mu] + bp.L + bp.R + [bp.a, bp.b, bp.t]]
+            else:
+                kv = [k for r in p.rangeSigs for k in r.asig.s0 + r.asig.s1 + [r.asig.ee] + r.Ci]
+            self.assertGreater(len(kv), 0)
+
+            expected.append(keccak_hash(rv.message + keccak_hash(writer.get_buffer()) + keccak_hash(b''.join(kv))))
+            self.assertEqual(await rv.get_pre_mlsag_hash(), expected[-1])
+
+        self.assertEqual(await xmr.get_pre_mlsag_hashes([(tx.rct_signatures, len(tx.vin), len(tx.vout)) for tx in txs]),
+                         expected)
+
 
 if __name__ == "__main__":
     unittest.main()  # pragma: no cover
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import binascii
+import unittest
+from unittest import mock
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+from .. import xmrhash
+from ..core.int_serialize import dump_uvarint_b
+from ..core.keccak import keccak_hash
+
+
+__author__ = 'dusanklinec'
+
+
+GENESIS_TX = binascii.unhexlify(
+    '013c01ff0001ffffffffffff03029b2e4c0281c0b02e7c53291a94d1d0cbff8883f8024f5142ee494ffbbd08807121017767aafcde9be00dcfd098715ebcf7f410daebc582fda69d24a28e9d0bc890d1')
+GENESIS_TX_HASH = binascii.unhexlify('c88ce9783b4f11190d7b9c17a69c1c52200f9faaee8e98dd07e6811175177139')
+GENESIS_ID = binascii.unhexlify('418015bb9ae982a1975da7d79277c2705727a56894ba0fb246adaabb1f4632e3')
+
+
+def ref_tree_hash(hashes):
+    """
+    Reference tree hash, tree_hash() of Monero crypto/tree-hash.c on lists
+    """
+    count = len(hashes)
+    if count == 1:
+        return hashes[0]
+    if count == 2:
+        return keccak_hash(hashes[0] + hashes[1])
+    cnt = 1
+    while cnt * 2 < count:
+        cnt *= 2
+    ints = hashes[:2 * cnt - count]
+    rest = hashes[2 * cnt - count:]
+    ints += [keccak_hash(rest[i] + rest[i + 1]) for i in range(0, len(rest), 2)]
+    while len(ints) > 2:
+        ints = [keccak_hash(ints[i] + ints[i + 1]) for i in range(0, len(ints), 2)]
+    return keccak_hash(ints[0] + ints[1])
+
+
+class XmrHashTest(aiounittest.AsyncTestCase):
+    """Transaction and block hashing"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrHashTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    async def load(self, data, msg_type, hf=15):
+        reader = x.MemoryReaderWriter(bytearray(data))
+        return await x.Archive(reader, False, xmr.hf_versions(hf)).message(None, msg_type)
+
+    async def dump(self, msg, msg_type=None, hf=15):
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True, xmr.hf_versions(hf)).field(msg, msg_type)
+        return bytes(writer.get_buffer())
+
+    def gen_block(self, ntxs):
+        return xmr.Block(major_version=1, minor_version=0, timestamp=0, prev_id=bytes(32), nonce=10000,
+                         miner_tx=None, tx_hashes=[bytes(self.test_data.generate_ec_key()) for _ in range(ntxs)])
+
+    def test_transaction_hash(self):
+        blobs, hashes = zip(*[self.test_data.load_tx_hf(hf) for hf in (13, 15)])
+        self.assertEqual(xmrhash.transaction_hashes(blobs + (GENESIS_TX,)), list(hashes) + [GENESIS_TX_HASH])
+
+        with self.assertRaises(ValueError):
+            xmrhash.transaction_hash(blobs[0] + b'\x00')
+        self.assertEqual(xmrhash.transaction_hash(b'\x00' + GENESIS_TX, offset=1), GENESIS_TX_HASH)
+
+    def test_tree_hash(self):
+        hashes = [keccak_hash(bytes([i])) for i in range(17)]
+        for count in range(1, len(hashes) + 1):
+            expected = ref_tree_hash(hashes[:count])
+            self.assertEqual(xmrhash.tree_hash(b''.join(hashes[:count])), expected)
+            self.assertEqual(xmrhash.tree_hash(hashes[:count]), expected)
+
+        self.assertEqual(xmrhash.tree_hash(hashes[:3]),
+                         keccak_hash(hashes[0] + keccak_hash(hashes[1] + hashes[2])))
+        with self.assertRaises(ValueError):
+            xmrhash.tree_hash(b'')
+        with self.assertRaises(ValueError):
+            xmrhash.tree_hash(bytes(33))
+
+    def test_tree_branch(self):
+        hashes = [keccak_hash(bytes([i])) for i in range(17)]
+        for count in range(1, len(hashes) + 1):
+            branch = xmrhash.tree_branch(b''.join(hashes[:count]))
+            self.assertEqual(xmrhash.tree_hash_from_branch(hashes[0], branch), ref_tree_hash(hashes[:count]))
+            self.assertEqual(xmrhash.tree_branch([bytes(32)] + hashes[1:count]), branch)
+            self.assertEqual(xmrhash.tree_hash_from_branch(hashes[5], branch),
+                             ref_tree_hash([hashes[5]] + hashes[1:count]))
+
+    async def gen_miner_block(self, ntxs, reserved=8):
+        key = self.test_data.generate_ec_key
+        extra = bytearray([xmr.TxExtraPubKey.VARIANT_CODE]) + key()
+        if reserved:
+            extra += bytearray([xmr.TxExtraNonce.VARIANT_CODE, reserved]) + bytes(reserved)
+        block = self.gen_block(ntxs)
+        block.major_version = block.minor_version = 16
+        block.miner_tx = xmr.Transaction(
+            version=2, unlock_time=70, vin=[xmr.TxinGen(height=10)], extra=extra,
+            vout=[xmr.TxOut(amount=600000000000, target=xmr.TxoutToTaggedKey(key=key(), view_tag=b'\x01'))],
+            rct_signatures=xmr.RctSig(type=xmr.RctType.Null))
+        return block
+
+    async def test_block_template(self):
+        hasher = xmrhash.BlockHasher()
+        for ntxs in (0, 1, 6):
+            block = await self.gen_miner_block(ntxs)
+            template = await xmrhash.BlockTemplate.from_block(block)
+            block_id, blob = await hasher.hash_block(block)
+            self.assertEqual((template.block_id, bytes(template.hashing_blob)), (block_id, blob))
+            self.assertEqual(template.block_blob, await self.dump(block, xmr.Block))
+            self.assertEqual((template.nonce, template.extra_nonce), (10000, bytes(8)))
+
+            worker = template.copy().set_nonce(0xdeadbeef).set_extra_nonce(b'\x01\x02', offset=2)
+            block.nonce = 0xdeadbeef
+            block.miner_tx.extra[-6:-4] = b'\x01\x02'
+            self.assertEqual(worker.block_id, (await hasher.hash_block(block))[0])
+            self.assertEqual(worker.block_blob, await self.dump(block, xmr.Block))
+            self.assertEqual(worker.extra_nonce, bytes(2) + b'\x01\x02' + bytes(4))
+            self.assertEqual(template.block_id, block_id)
+
+            from_blob = xmrhash.BlockTemplate.from_blob(worker.block_blob)
+            self.assertEqual(from_blob.hashing_blob, worker.hashing_blob)
+            self.assertEqual(from_blob.reserved_offset, worker.reserved_offset)
+
+            with self.assertRaises(ValueError):
+                worker.set_extra_nonce(bytes(7), offset=2)
+
+        block = await self.gen_miner_block(2, reserved=0)
+        template = await xmrhash.BlockTemplate.from_block(block)
+        self.assertIsNone(template.extra_nonce)
+        with self.assertRaises(ValueError):
+            template.set_extra_nonce(b'\x01')
+        with self.assertRaises(ValueError):
+            xmrhash.BlockTemplate.from_blob(template.block_blob + b'\x00')
+
+    async def test_block_id(self):
+        hasher = xmrhash.BlockHasher()
+        genesis = self.gen_block(0)
+        genesis.miner_tx = await self.load(GENESIS_TX, xmr.Transaction)
+        block_id, blob = await hasher.hash_block(genesis)
+        self.assertEqual(block_id, GENESIS_ID)
+        self.assertEqual(xmrhash.block_id(blob), GENESIS_ID)
+
+        genesis_blob = await self.dump(genesis, xmr.Block)
+        self.assertEqual(hasher.hash_block_blob(genesis_blob), (block_id, blob))
+
+        blocks = []
+        for ntxs in (1, 2, 5):
+            block = self.gen_block(ntxs)
+            block.miner_tx = genesis.miner_tx
+            block.nonce = ntxs
+            blocks.append(block)
+
+        res = await hasher.hash_blocks(blocks)
+        self.assertEqual(hasher.hash_block_blobs([await self.dump(b, xmr.Block) for b in blocks]), res)
+        for block, (block_id, blob) in zip(blocks, res):
+            header = await self.dump(block, xmr.BlockHeader)
+            root = ref_tree_hash([GENESIS_TX_HASH] + block.tx_hashes)
+            self.assertEqual(blob, header + root + bytes([len(block.tx_hashes) + 1]))
+            self.assertEqual(block_id, keccak_hash(bytes([len(blob)]) + blob))
+
+    async def test_block_202612(self):
+        hasher = xmrhash.BlockHasher()
+        block = self.gen_block(3)
+        block.miner_tx = await self.load(GENESIS_TX, xmr.Transaction)
+        block.miner_tx.vin[0].height = xmrhash.BLOCK_202612_HEIGHT
+        block_blob = await self.dump(block, xmr.Block)
+        template = xmrhash.BlockTemplate.from_blob(block_blob)
+        block_id, blob = await hasher.hash_block(block)
+        self.assertEqual(block_id, keccak_hash(dump_uvarint_b(len(blob)) + blob))
+        self.assertEqual(template.block_id, block_id)
+
+        # the block with the 202612 blob gets the hard coded ID
+        with mock.patch.object(xmrhash, 'BLOCK_202612_BLOB_HASH', keccak_hash(block_blob)):
+            self.assertEqual((await hasher.hash_block(block))[0], xmrhash.BLOCK_202612_ID)
+            self.assertEqual(hasher.hash_block_blob(block_blob), (xmrhash.BLOCK_202612_ID, blob))
+            self.assertEqual(template.block_id, xmrhash.BLOCK_202612_ID)
+            self.assertNotEqual(template.copy().set_nonce(1).block_id, xmrhash.BLOCK_202612_ID)
+
+        # other block hashing to the 202612 ID is rejected
+        with mock.patch.object(xmrhash, 'BLOCK_202612_ID', block_id):
+            with self.assertRaises(ValueError):
+                await hasher.hash_block(block)
+            with self.assertRaises(ValueError):
+                hasher.hash_block_blob(block_blob)
+            block.miner_tx.vin[0].height += 1
+            self.assertNotEqual((await hasher.hash_block(block))[0], block_id)
+
+        self.assertEqual(xmrhash.block_id_exception(block_id, block_blob, 1), block_id)
+        self.assertEqual(xmrhash.block_id_exception(block_id, block_blob, None), block_id)
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import struct
+import tempfile
+import unittest
+from unittest import mock
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+from .. import xmrindex
+from .. import xmrscan
+
+
+__author__ = 'dusanklinec'
+
+
+class XmrIndexTest(aiounittest.AsyncTestCase):
+    """Array-backed indices"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrIndexTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    def numpy_modes(self):
+        return (False, True) if xmrindex.np is not None else (False,)
+
+    def test_key_image_set(self):
+        keys = [os.urandom(32) for _ in range(200)] + [bytes(32), b'\x01' + bytes(31), bytes(31) + b'\x01']
+        for use_numpy in self.numpy_modes():
+            kis = xmrindex.KeyImageSet(b''.join(keys[:100]), use_numpy=use_numpy)
+            kis.update(keys[50:])
+            kis.add(keys[0])
+            self.assertEqual(len(kis), len(keys))
+            self.assertEqual(list(kis), sorted(keys))
+            for k in keys:
+                self.assertIn(k, kis)
+            self.assertNotIn(b'\xff' * 32, kis)
+            self.assertNotIn(b'\x00', kis)
+
+            query = keys[::7] + [b'\xff' * 32, bytes(30) + b'\x01\x00']
+            self.assertEqual(list(kis.contains_many(query)), [True] * len(keys[::7]) + [False, False])
+            self.assertEqual(list(xmrindex.KeyImageSet(use_numpy=use_numpy).contains_many(query[:2])), [False] * 2)
+
+            clone = xmrindex.KeyImageSet.from_bytes(kis.to_bytes(), use_numpy=not use_numpy)
+            self.assertEqual(clone.to_bytes(), kis.to_bytes())
+            with self.assertRaises(ValueError):
+                kis.update(b'\x01' * 33)
+
+    async def load_txs(self):
+        res = []
+        for hf in (13, 15):
+            blob, _ = self.test_data.load_tx_hf(hf)
+            reader = x.MemoryReaderWriter(bytearray(blob))
+            res.append((blob, await x.Archive(reader, False, xmr.hf_versions(hf)).message(None, xmr.Transaction)))
+        return res
+
+    async def test_ring_offsets(self):
+        txs = await self.load_txs()
+        flat, bounds = xmrscan.scan_ring_offsets([blob for blob, _ in txs])
+        self.assertEqual((flat, bounds), xmrindex.ring_offsets([tx for _, tx in txs]))
+        self.assertEqual(xmrindex.split_offsets(flat, bounds), [inp.key_offsets for _, tx in txs for inp in tx.vin])
+
+        expected = []
+        for _, tx in txs:
+            for inp in tx.vin:
+                acc = 0
+                for off in inp.key_offsets:
+                    acc += off
+                    expected.append(acc)
+
+        for use_numpy in self.numpy_modes():
+            absolute = xmrindex.relative_to_absolute(flat, bounds, use_numpy=use_numpy)
+            self.assertEqual(list(absolute), expected)
+            self.assertEqual(list(xmrindex.absolute_to_relative(absolute, bounds, use_numpy=use_numpy)), list(flat))
+
+            empty = xmrindex.relative_to_absolute([], [0], use_numpy=use_numpy)
+            self.assertEqual(list(empty), [])
+            self.assertEqual(list(xmrindex.absolute_to_relative([5, 7, 3], [0, 2, 2, 3, 3], use_numpy=use_numpy)),
+                             [5, 2, 3])
+            self.assertEqual(list(xmrindex.relative_to_absolute([5, 2, 3], [0, 2, 2, 3, 3], use_numpy=use_numpy)),
+                             [5, 7, 3])
+
+            # invalid offsets fail the same way with and without NumPy
+            with self.assertRaises(OverflowError):
+                xmrindex.relative_to_absolute([2 ** 63, 2 ** 63], [0, 2], use_numpy=use_numpy)
+            with self.assertRaises(OverflowError):
+                xmrindex.absolute_to_relative([5, 7, 3], [0, 3], use_numpy=use_numpy)
+            self.assertEqual(list(xmrindex.relative_to_absolute([2 ** 64 - 1, 1], [0, 1, 2], use_numpy=use_numpy)),
+                             [2 ** 64 - 1, 1])
+
+    async def test_ring_index(self):
+        txs = await self.load_txs()
+        txids = [bytes([i + 1]) * 32 for i in range(len(txs))]
+        expected = {}
+        for tx_no, (_, tx) in enumerate(txs):
+            for input_idx, inp in enumerate(tx.vin):
+                acc = 0
+                for off in inp.key_offsets:
+                    acc += off
+                    expected.setdefault(acc, []).append((txids[tx_no], input_idx))
+
+        block = xmr.Block(tx_hashes=txids[1:])
+        for use_numpy in self.numpy_modes():
+            idx = xmrindex.RingIndex(use_numpy=use_numpy)
+            self.assertEqual(idx.add_transaction(txids[0], txs[0][0]), sum(len(inp.key_offsets) for inp in txs[0][1].vin))
+            idx.add_block(block, [txs[1][1]])
+            self.assertEqual(len(idx), sum(len(v) for v in expected.values()))
+            for key, refs in expected.items():
+                self.assertEqual(sorted(idx.lookup(key)), sorted(refs))
+            self.assertEqual(idx.lookup(1), [])
+
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'ring.idx')
+                idx.save(path)
+                loaded = xmrindex.RingIndex.load(path, use_numpy=use_numpy)
+                for key, refs in expected.items():
+                    self.assertEqual(sorted(loaded.lookup(key)), sorted(refs))
+
+                # append after load, memory mapped arrays are replaced on compaction
+                key = max(expected)
+                loaded.add_transaction(b'\xff' * 32, xmr.TransactionPrefix(vin=[xmr.TxinToKey(amount=0, key_offsets=[key])]))
+                loaded.add_transaction(b'\xfe' * 32, xmr.TransactionPrefix(vin=[xmr.TxinToKey(amount=5, key_offsets=[key])]))
+                self.assertEqual(sorted(loaded.lookup(key)), sorted(expected[key] + [(b'\xff' * 32, 0)]))
+                self.assertEqual(loaded.tx_count, 4)
+
+                # saving back to the mapped file
+                loaded.save(path)
+                self.assertEqual(sorted(loaded.lookup(key)), sorted(expected[key] + [(b'\xff' * 32, 0)]))
+                reloaded = xmrindex.RingIndex.load(path, use_numpy=use_numpy)
+                reloaded.save(path)
+                for k in expected:
+                    self.assertEqual(reloaded.lookup(k), loaded.lookup(k))
+                self.assertEqual(os.listdir(tmpdir), ['ring.idx'])
+
+                # arrays are little-endian as the header, independent of the host
+                with open(path, 'rb') as fh:
+                    data = fh.read()
+                offset = xmrindex.RingIndex._HEADER.size + reloaded.tx_count * 32
+                nkeys = len(reloaded.keys)
+                self.assertEqual(data[offset:offset + nkeys * 8], struct.pack('<%dQ' % nkeys, *reloaded.keys))
+                self.assertEqual(data[-len(reloaded.ref_input) * 4:],
+                                 struct.pack('<%dI' % len(reloaded.ref_input), *reloaded.ref_input))
+                with mock.patch.object(xmrindex, '_BIG_ENDIAN', not xmrindex._BIG_ENDIAN):
+                    swapped_path = os.path.join(tmpdir, 'swapped.idx')
+                    reloaded.save(swapped_path)
+                    swapped = xmrindex.RingIndex.load(swapped_path, use_numpy=use_numpy)
+                    for k in expected:
+                        self.assertEqual(swapped.lookup(k), loaded.lookup(k))
+                    del swapped
+                os.unlink(swapped_path)
+                del loaded, reloaded
+
+            with self.assertRaises(ValueError):
+                idx.add_block(block, [])
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
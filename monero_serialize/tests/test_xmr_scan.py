@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import unittest
+
+import aiounittest
+
+from .test_data import XmrTestData
+from .. import xmrserialize as x
+from .. import xmrtypes as xmr
+from .. import xmrscan
+from ..core.keccak import keccak_hash
+
+
+__author__ = 'dusanklinec'
+
+
+class XmrScanTest(aiounittest.AsyncTestCase):
+    """Structural scanning of serialized blobs"""
+
+    def __init__(self, *args, **kwargs):
+        super(XmrScanTest, self).__init__(*args, **kwargs)
+        self.test_data = XmrTestData()
+
+    def setUp(self):
+        self.test_data.reset()
+
+    async def load(self, data, msg_type, hf=15):
+        reader = x.MemoryReaderWriter(bytearray(data))
+        return await x.Archive(reader, False, xmr.hf_versions(hf)).message(None, msg_type)
+
+    async def dump(self, msg, msg_type=None, hf=15):
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True, xmr.hf_versions(hf)).field(msg, msg_type)
+        return bytes(writer.get_buffer())
+
+    async def gen_extra(self, padding=0):
+        key = self.test_data.generate_ec_key
+        fields = [
+            xmr.TxExtraPubKey(pub_key=key()),
+            xmr.TxExtraNonce(nonce=b'\x01' + bytes(range(8))),
+            xmr.TxExtraMergeMiningTag(field_len=33, depth=3, merkle_root=key()),
+            xmr.TxExtraAdditionalPubKeys(data=[key(), key()]),
+            xmr.TxExtraMysteriousMinergate(data=b'minergate'),
+            xmr.TxExtraNonce(nonce=b'\x00' + bytes(range(32))),
+        ]
+        data = await self.dump(fields, xmr.TxExtraFields)
+        return data[1:] + b'\x00' * padding  # without the field count
+
+    async def test_parse_extra(self):
+        extra = await self.gen_extra(padding=10)
+        for views in (False, True):
+            res = xmrscan.parse_extra(bytearray(extra), views=views)
+            self.assertTrue(res.complete)
+            self.assertEqual(bytes(res.pub_key), bytes(range(32)))
+            self.assertEqual([bytes(k) for k in res.additional_pub_keys], [bytes(range(i, i + 32)) for i in (2, 3)])
+            self.assertEqual(len(res.nonces), 2)
+            self.assertEqual(bytes(res.encrypted_payment_id), bytes(range(8)))
+            self.assertEqual([extra[o:o + len(n)] for o, n in zip(res.nonce_offsets, res.nonces)],
+                             [bytes(n) for n in res.nonces])
+            self.assertEqual(bytes(res.payment_id), bytes(range(32)))
+            self.assertIsInstance(res.pub_key, memoryview if views else bytes)
+
+        tx, _ = self.test_data.load_tx_hf(15)
+        msg = await self.load(tx, xmr.Transaction)
+        res = xmrscan.parse_extras([msg, msg.extra])
+        self.assertEqual(res[0].pub_key, bytes(msg.extra[1:33]))
+        self.assertEqual(len(res[1].additional_pub_keys), 3)
+        self.assertIsNone(res[1].payment_id)
+
+    async def test_parse_extra_malformed(self):
+        extra = await self.gen_extra()
+        res = xmrscan.parse_extra(extra[:-5])
+        self.assertFalse(res.complete)
+        self.assertEqual(len(res.nonces), 1)
+        self.assertEqual(len(res.additional_pub_keys), 2)
+
+        self.assertFalse(xmrscan.parse_extra(extra + b'\x00\x01').complete)
+        self.assertFalse(xmrscan.parse_extra(extra + b'\x00' * 300).complete)
+        self.assertFalse(xmrscan.parse_extra(b'\x05' + extra).complete)
+        self.assertFalse(xmrscan.parse_extra(b'\x02\x80').complete)
+
+    async def gen_block(self, txs=3):
+        key = self.test_data.generate_ec_key
+        miner_tx = xmr.Transaction(
+            version=2, unlock_time=60, vin=[xmr.TxinGen(height=1000)],
+            vout=[xmr.TxOut(amount=600000000000, target=xmr.TxoutToTaggedKey(key=key(), view_tag=b'\x2a'))],
+            extra=await self.gen_extra(), rct_signatures=xmr.RctSig(type=xmr.RctType.Null))
+        return xmr.Block(major_version=16, minor_version=16, timestamp=1660000000, prev_id=key(), nonce=0x12345678,
+                         miner_tx=miner_tx, tx_hashes=[key() for _ in range(txs)])
+
+    async def gen_tagged_tx(self):
+        tx, _ = self.test_data.load_tx_hf(15)
+        msg = await self.load(tx, xmr.Transaction)
+        for i, out in enumerate(msg.vout):
+            out.target = xmr.TxoutToTaggedKey(key=out.target.key, view_tag=bytes([i + 7]))
+        return msg, await self.dump(msg, xmr.Transaction)
+
+    async def test_scan_transaction(self):
+        for hf in (13, 15):
+            tx, _ = self.test_data.load_tx_hf(hf)
+            msg = await self.load(tx, xmr.Transaction, hf)
+            offsets = []
+            layout = xmrscan.scan_transaction(tx, key_offsets=offsets)
+            self.assertEqual(layout.version, msg.version)
+            self.assertEqual(layout.rct_type, msg.rct_signatures.type)
+            self.assertEqual(layout.fee, msg.rct_signatures.txnFee)
+            self.assertEqual([inp[1] for inp in layout.inputs], [inp.amount for inp in msg.vin])
+            self.assertEqual(offsets, [o for inp in msg.vin for o in inp.key_offsets])
+            self.assertEqual(tx[layout.inputs[-1][3]:][:32], msg.vin[-1].k_image)
+            self.assertEqual(tx[layout.extra[0]:layout.extra[1]], msg.extra)
+            self.assertEqual(layout.prefix_end, len(await self.dump(msg, xmr.TransactionPrefix, hf)))
+            self.assertLess(layout.base_end, len(tx))
+
+        with self.assertRaises(xmrscan.ScanError):
+            xmrscan.scan_transaction(tx[:layout.base_end - 1])
+        with self.assertRaises(xmrscan.ScanError):
+            xmrscan.scan_transaction(tx[:5])
+
+    async def test_scan_outputs(self):
+        msg, tx = await self.gen_tagged_tx()
+        recs = xmrscan.scan_outputs(tx, tx_index=5)
+        self.assertEqual(len(recs), len(msg.vout))
+        for i, rec in enumerate(recs):
+            self.assertEqual((rec.tx_index, rec.output_index, rec.amount), (5, i, 0))
+            self.assertEqual(rec.key, msg.vout[i].target.key)
+            self.assertEqual(rec.view_tag, i + 7)
+            self.assertEqual(rec.commitment, msg.rct_signatures.outPk[i].mask)
+            self.assertEqual(rec.enc_amount, msg.rct_signatures.ecdhInfo[i].amount[:8])
+            self.assertIs(rec.extra, recs[0].extra)
+        self.assertEqual(rec.extra.pub_key, msg.extra[1:33])
+
+        block = await self.gen_block()
+        blob = await self.dump(block, xmr.Block)
+        recs = xmrscan.scan_outputs(blob, is_block=True, views=True)
+        self.assertEqual(len(recs), 1)
+        self.assertEqual((recs[0].amount, recs[0].view_tag, recs[0].commitment), (600000000000, 0x2a, None))
+        self.assertEqual(recs[0].key, block.miner_tx.vout[0].target.key)
+
+        cols = xmrscan.scan_outputs_columns([tx, tx])
+        self.assertEqual(len(cols), 2 * len(msg.vout))
+        self.assertEqual(list(cols.tx_index), [0, 0, 0, 1, 1, 1])
+        self.assertEqual(list(cols.output_index), [0, 1, 2, 0, 1, 2])
+        self.assertEqual(cols.view_tags, bytearray([7, 8, 9, 7, 8, 9]))
+        self.assertEqual(cols.key(4), msg.vout[1].target.key)
+        self.assertEqual(cols.commitment(5), msg.rct_signatures.outPk[2].mask)
+        self.assertEqual(cols.enc_amount(3), msg.rct_signatures.ecdhInfo[0].amount[:8])
+        self.assertEqual(len(cols.extras), 2)
+
+    async def test_scan_block(self):
+        block = await self.gen_block(txs=4)
+        blob = await self.dump(block, xmr.Block)
+        layout = xmrscan.scan_block(blob)
+        self.assertEqual((layout.major_version, layout.timestamp, layout.tx_count), (16, 1660000000, 4))
+        self.assertEqual(blob[layout.prev_id:layout.prev_id + 32], block.prev_id)
+        self.assertEqual(blob[layout.nonce:layout.header_end], (0x12345678).to_bytes(4, 'little'))
+        self.assertEqual(blob[layout.header_end:layout.miner_tx_end], await self.dump(block.miner_tx, xmr.Transaction))
+        self.assertEqual(blob[layout.tx_hashes + 32:layout.tx_hashes + 64], block.tx_hashes[1])
+        self.assertEqual(layout.end, len(blob))
+
+    async def test_parse_block_header(self):
+        blocks = [await self.gen_block(txs=i) for i in (0, 1, 5)]
+        blobs = [await self.dump(block, xmr.Block) for block in blocks]
+        for views in (False, True):
+            for block, blob, rec in zip(blocks, blobs, xmrscan.parse_block_headers(blobs, views=views)):
+                self.assertEqual(await self.dump(rec.header, xmr.BlockHeader), await self.dump(block, xmr.BlockHeader))
+                self.assertEqual(rec.header.nonce, 0x12345678)
+                self.assertEqual(blob[rec.miner_tx[0]:rec.miner_tx[1]], await self.dump(block.miner_tx, xmr.Transaction))
+                self.assertEqual(bytes(rec.tx_hashes), b''.join(block.tx_hashes))
+                self.assertEqual([bytes(rec.tx_hash(i)) for i in range(rec.tx_count)], block.tx_hashes)
+                self.assertIsInstance(rec.tx_hashes, memoryview if views else bytes)
+                self.assertEqual(rec.end, len(blob))
+
+        with self.assertRaises(xmrscan.ScanError):
+            xmrscan.parse_block_header(blobs[2][:-1])
+        with self.assertRaises(xmrscan.ScanError):
+            xmrscan.parse_block_header(blobs[2][:50])
+
+    async def test_view_tag_index(self):
+        msg, tx = await self.gen_tagged_tx()
+        tx13, _ = self.test_data.load_tx_hf(13)
+        blobs = [tx, tx13, tx]
+        for use_numpy in ((False, True) if xmrscan.np is not None else (False,)):
+            idx = xmrscan.ViewTagIndex.from_blobs(blobs, use_numpy=use_numpy)
+            self.assertEqual(len(idx), 9)
+            self.assertEqual(list(idx.tx_index), [0, 0, 0, 1, 1, 1, 2, 2, 2])
+            self.assertEqual(list(idx.output_index), [0, 1, 2] * 3)
+            self.assertEqual(bytes(idx.view_tags), bytes([7, 8, 9, 0, 0, 0, 7, 8, 9]))
+
+            expected = bytes([1, 8, 1, 1, 1, 1, 1, 1, 1])
+            self.assertEqual(list(idx.match(expected)), [1, 3, 4, 5])
+            self.assertEqual(list(idx.matching_txs(expected)), [0, 1])
+            self.assertEqual(list(idx.matching_txs(list(expected[:6]) + [1, 1, 9])), [0, 1, 2])
+            with self.assertRaises(ValueError):
+                idx.match(expected[1:])
+
+    async def test_scan_key_images(self):
+        tx13, _ = self.test_data.load_tx_hf(13)
+        tx15, _ = self.test_data.load_tx_hf(15)
+        msg13 = await self.load(tx13, xmr.Transaction, 13)
+        msg15 = await self.load(tx15, xmr.Transaction)
+
+        self.assertEqual(xmrscan.scan_key_images(tx15), b''.join(inp.k_image for inp in msg15.vin))
+        kis, tx_index = xmrscan.scan_key_images_batch([tx13, tx15])
+        self.assertEqual(kis, b''.join(inp.k_image for inp in msg13.vin + msg15.vin))
+        self.assertEqual(list(tx_index), [0] * len(msg13.vin) + [1] * len(msg15.vin))
+
+        blob = await self.dump(await self.gen_block(), xmr.Block)
+        self.assertEqual(xmrscan.scan_key_images(blob, is_block=True), b'')
+        with self.assertRaises(xmrscan.ScanError):
+            xmrscan.scan_key_images(tx15[:100])
+
+    async def test_split_transaction(self):
+        cases = []
+        for hf in (13, 15):
+            tx, _ = self.test_data.load_tx_hf(hf)
+            cases.append((await self.load(tx, xmr.Transaction, hf), tx))
+        for rct_type in range(xmr.RctType.Full, xmr.RctType.BulletproofPlus + 1):
+            msg = self.test_data.gen_rct_transaction(rct_type)
+            cases.append((msg, await self.dump(msg, xmr.Transaction)))
+
+        for msg, tx in cases:
+            writer = x.MemoryReaderWriter()
+            ar = x.Archive(writer, True, xmr.hf_versions(15))
+            await msg.rct_signatures.serialize_rctsig_base(ar, len(msg.vin), len(msg.vout))
+            base = bytes(writer.get_buffer())
+
+            sections = xmrscan.split_transaction(tx)
+            self.assertEqual(tx[:sections.prefix[1]], await self.dump(msg, xmr.TransactionPrefix))
+            self.assertEqual(tx[sections.base[0]:sections.base[1]], base)
+            self.assertEqual(sections.prunable[0], sections.base[1])
+            self.assertEqual(sections.end, len(tx))
+
+            with self.assertRaises(xmrscan.ScanError):
+                xmrscan.split_transaction(tx[:-1])
+            with self.assertRaises(xmrscan.ScanError):
+                xmrscan.split_transaction(tx + b'\x00')
+
+        v1 = xmr.Transaction(version=1, unlock_time=0, vin=[xmr.TxinToKey(amount=1, key_offsets=[1, 2], k_image=bytes(32))],
+                             vout=[], extra=bytearray(), signatures=[[xmr.Signature(c=bytes(32), r=bytes(32))] * 2])
+        blob = await self.dump(v1, xmr.Transaction)
+        miner_tx = await self.dump((await self.gen_block()).miner_tx, xmr.Transaction)
+        sections = xmrscan.split_transactions([blob, miner_tx + b'\x00'], strict=False)
+        self.assertEqual((sections[0].base, sections[0].prunable), ((len(blob) - 128,) * 2, (len(blob) - 128, len(blob))))
+        self.assertEqual(sections[1].prunable, (len(miner_tx),) * 2)
+
+    async def test_prune_transaction(self):
+        blobs, hashes = zip(*[self.test_data.load_tx_hf(hf) for hf in (13, 15)])
+        for blob, tx_hash, (pruned, prunable_hash) in zip(blobs, hashes, xmrscan.prune_transactions(blobs)):
+            msg = await self.load(blob, xmr.Transaction)
+            prefix = await self.dump(msg, xmr.TransactionPrefix)
+            self.assertIsInstance(pruned, memoryview)
+            self.assertEqual(bytes(pruned[:len(prefix)]), prefix)
+            self.assertEqual(bytes(pruned), blob[:len(pruned)])
+
+            txid = keccak_hash(keccak_hash(prefix) + keccak_hash(pruned[len(prefix):]) + prunable_hash)
+            self.assertEqual(txid, tx_hash)
+
+        msg = self.test_data.gen_rct_transaction(xmr.RctType.Full)
+        blob = await self.dump(msg, xmr.Transaction)
+        sections = xmrscan.split_transaction(blob)
+        pruned, prunable_hash = xmrscan.prune_transaction(blob, sections=sections)
+        self.assertEqual(len(pruned), sections.base[1])
+        self.assertEqual(prunable_hash, keccak_hash(blob[sections.base[1]:]))
+
+        v1 = xmr.Transaction(version=1, unlock_time=0, vin=[xmr.TxinToKey(amount=1, key_offsets=[1], k_image=bytes(32))],
+                             vout=[], extra=bytearray(), signatures=[[xmr.Signature(c=bytes(32), r=bytes(32))]])
+        blob = await self.dump(v1, xmr.Transaction)
+        pruned, prunable_hash = xmrscan.prune_transaction(blob)
+        self.assertEqual((len(pruned), prunable_hash), (len(blob) - 64, None))
+
+    async def test_tx_patcher(self):
+        tx_bin, _ = self.test_data.load_tx_hf(15)
+        patcher = xmrscan.TxPatcher(tx_bin)
+        msg = await self.load(tx_bin, xmr.Transaction)
+        self.assertEqual(await patcher.patch(msg.rct_signatures.p), tx_bin)
+        self.assertEqual(patcher.blob, tx_bin)
+
+        # new signatures, same structure
+        key = self.test_data.generate_ec_key
+        for sig in msg.rct_signatures.p.CLSAGs:
+            sig.s = [key() for _ in sig.s]
+            sig.c1 = key()
+        msg.rct_signatures.p.pseudoOuts = [key() for _ in msg.rct_signatures.p.pseudoOuts]
+        blob = await patcher.patch(msg.rct_signatures.p)
+        self.assertIsInstance(blob, bytes)
+        self.assertEqual(blob, await self.dump(msg, xmr.Transaction))
+        self.assertEqual(blob[:patcher.prunable_offset], tx_bin[:patcher.prunable_offset])
+        self.assertEqual(patcher.sections.end, len(blob))
+
+        # returned blobs stay valid when the next patch resizes the buffer
+        first = blob
+        msg.rct_signatures.p.bulletproofs_plus[0].V = []
+        msg.rct_signatures.p.bulletproofs_plus[0].L.append(key())
+        msg.rct_signatures.p.bulletproofs_plus[0].R.append(key())
+        longer = await patcher.patch(msg.rct_signatures.p)
+        self.assertEqual(len(longer), len(first) + 64)
+        self.assertEqual(longer, await self.dump(msg, xmr.Transaction))
+        self.assertEqual(first[:patcher.prunable_offset], longer[:patcher.prunable_offset])
+
+        msg.rct_signatures.p.CLSAGs[0].s.append(key())
+        with self.assertRaises(ValueError):
+            await patcher.patch(msg.rct_signatures.p)
+        msg.rct_signatures.p.CLSAGs.pop()
+        with self.assertRaises(ValueError):
+            await patcher.patch(msg.rct_signatures.p)
+
+        for rct_type in (xmr.RctType.Full, xmr.RctType.Simple, xmr.RctType.Bulletproof2):
+            msg = self.test_data.gen_rct_transaction(rct_type, inputs=3)
+            patcher = await xmrscan.TxPatcher.from_transaction(msg)
+            msg.rct_signatures.p.MGs[0].cc = key()
+            self.assertEqual(bytes(await patcher.patch(msg.rct_signatures.p)), await self.dump(msg, xmr.Transaction))
+
+            msg.rct_signatures.p.MGs[0].ss[0].append(key())
+            with self.assertRaises(ValueError):
+                await patcher.patch(msg.rct_signatures.p)
+
+        with self.assertRaises(ValueError):
+            xmrscan.TxPatcher(await self.dump((await self.gen_block()).miner_tx, xmr.Transaction))
+
+    async def test_validate(self):
+        tx, _ = self.test_data.load_tx_hf(15)
+        blobs = [tx, self.test_data.load_tx_hf(13)[0]]
+        for rct_type in range(xmr.RctType.Null, xmr.RctType.BulletproofPlus + 1):
+            msg = self.test_data.gen_rct_transaction(rct_type) if rct_type else (await self.gen_block()).miner_tx
+            blobs.append(await self.dump(msg, xmr.Transaction))
+        self.assertEqual(xmrscan.validate_transactions(blobs), [None] * len(blobs))
+        self.assertIsNone(xmrscan.validate_block(await self.dump(await self.gen_block(), xmr.Block)))
+
+        def error(blob, **kwargs):
+            err = xmrscan.validate_transaction(blob, **kwargs)
+            self.assertIsInstance(err, xmrscan.ScanError)
+            return str(err)
+
+        for size in range(len(tx)):
+            self.assertIn('Truncated', error(tx[:size]))
+        self.assertIn('Trailing data', error(tx + b'\x00'))
+        self.assertIn('too large', error(tx, max_size=len(tx) - 1))
+        self.assertIn('Non-canonical varint', error(tx[:1] + b'\x80\x00' + tx[2:]))
+        self.assertIn('Varint overflow', error(tx[:1] + b'\xff' * 9 + b'\x7f' + tx[2:]))
+        self.assertIn('Unsupported transaction version', error(b'\x03' + tx[1:]))
+        self.assertIn('Unknown input variant', error(tx[:3] + b'\x01' + tx[4:]))
+
+        sections = xmrscan.split_transaction(tx)
+        base = sections.base[0]
+        self.assertIn('Unknown RCT type', error(tx[:base] + b'\x09' + tx[base + 1:]))
+
+        msg = self.test_data.gen_rct_transaction(xmr.RctType.CLSAG, outputs=1)
+        msg.rct_signatures.p.bulletproofs *= 2
+        self.assertIn('Too many bulletproofs', error(await self.dump(msg, xmr.Transaction)))
+
+        block = await self.dump(await self.gen_block(), xmr.Block)
+        self.assertIn('Trailing data', str(xmrscan.validate_block(block + b'\x00')))
+        self.assertIn('Truncated', str(xmrscan.validate_block(block[:-1])))
+        self.assertIn('too large', str(xmrscan.validate_block(block, max_size=100)))
+
+        # corrupted blobs are rejected with ScanError, never with another exception
+        rnd = random.Random(42)
+        for _ in range(300):
+            data = bytearray(tx)
+            for _ in range(rnd.randint(1, 4)):
+                data[rnd.randrange(len(data))] = rnd.randrange(256)
+            self.assertIn(type(xmrscan.validate_transaction(data)), (type(None), xmrscan.ScanError))
+
+
+if __name__ == "__main__":
+    unittest.main()  # pragma: no cover
@@ -120,6 +120,7 @@ class Archive(x.Archive):
     """
     Boost symmetric serialization archive
     """
+    ENC_CACHE_FORMAT = None  # encoding cache not supported
 
     def __init__(self, iobj, writing=True, versions=None, **kwargs):
         super().__init__(iobj, writing, **kwargs)
@@ -613,7 +614,7 @@ class Archive(x.Archive):
             await self._dump_field(getattr(elem, elem.variant_elem), elem.variant_elem_type)
 
         else:
-            fdef = elem_type.find_fdef(elem_type.f_specs(), elem)
+            fdef = elem_type.fdef_by_elem(elem)
             vcode = fdef[1].BOOST_VARIANT_CODE if hasattr(fdef[1], 'BOOST_VARIANT_CODE') else fdef[1].VARIANT_CODE
             await dump_uvarint(self.iobj, vcode)
             await self._dump_field(elem, fdef[1])
@@ -635,18 +636,14 @@ class Archive(x.Archive):
             elem = elem_type() if elem is None else elem
 
         tag = await load_uvarint(self.iobj)
-        for field in elem_type.f_specs():
-            ftype = field[1]
-            vcode = ftype.BOOST_VARIANT_CODE if hasattr(ftype, 'BOOST_VARIANT_CODE') else ftype.VARIANT_CODE
-            if vcode != tag:
-                continue
-
-            fvalue = await self._load_field(ftype, field[2:], elem if not is_wrapped else None)
-            if is_wrapped:
-                elem.set_variant(field[0], fvalue)
-            return elem if is_wrapped else fvalue
-
-        raise ValueError('Unknown tag: %s, path: %s' % (tag, self.tracker))
+        field = elem_type.fdef_by_code(tag, boost=True)
+        if field is None:
+            raise ValueError('Unknown tag: %s, path: %s' % (tag, self.tracker))
+
+        fvalue = await self._load_field(field[1], field[2:], elem if not is_wrapped else None)
+        if is_wrapped:
+            elem.set_variant(field[0], fvalue)
+        return elem if is_wrapped else fvalue
 
     async def root(self):
         """
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Transaction and block hashing.
+
+Transaction hashes, Monero tree hash, block hashing blobs and block IDs,
+computed from BC serialized blobs (structural scan, see xmrscan) or from messages.
+Hashing functions accept a hasher factory with the hashlib interface,
+Keccak-256 is used by default.
+'''
+
+import struct
+
+from . import xmrserialize as x
+from . import xmrtypes as xmr
+from . import xmrscan
+from .core.fixed_layout import fixed_blob_layout
+from .core.int_serialize import dump_uvarint_b
+from .core.keccak import keccak_256
+
+
+HASH_SIZE = xmr.Hash.SIZE
+NULL_HASH = bytes(HASH_SIZE)
+
+# Block 202612 keeps the ID it was accepted with (tree hash of its 514 transactions computed
+# by the old buggy tree-hash.c). Monero get_block_hash identifies the block by the hash of the whole blob.
+BLOCK_202612_HEIGHT = 202612
+BLOCK_202612_BLOB_HASH = bytes.fromhex('3a8a2b3a29b50fc86ff73dd087ea43c6f0d6b8f936c849194d5c84c737903966')
+BLOCK_202612_ID = bytes.fromhex('bbd604d2ba11ba27935e006ed39c9bfdd99b76bf4a50654bc1e1e61217962698')
+
+
+def _hash(hasher, *data):
+    h = hasher()
+    for d in data:
+        h.update(d)
+    return h.digest()
+
+
+def transaction_hash(blob, offset=0, hasher=None, sections=None, strict=True):
+    """
+    Returns the transaction hash (txid) of the serialized transaction.
+    v1: H(blob), v2: H(H(prefix) || H(RCT base) || H(RCT prunable)), prunable hash is null for RCT Null.
+    :param blob:
+    :param offset: start of the transaction in the blob
+    :param hasher: hasher factory, Keccak-256 by default
+    :param sections: TxSections of the transaction, split if None
+    :param strict: if True, the transaction has to span the rest of the blob
+    :return: bytes
+    """
+    hasher = hasher or keccak_256
+    sections = xmrscan.split_transaction(blob, offset, strict) if sections is None else sections
+    view = memoryview(blob)
+    if sections.layout is not None and sections.layout.version == 1:
+        return _hash(hasher, view[sections.prefix[0]:sections.end])
+
+    prefix = _hash(hasher, view[sections.prefix[0]:sections.prefix[1]])
+    base = _hash(hasher, view[sections.base[0]:sections.base[1]])
+    is_null = sections.layout is not None and sections.layout.rct_type in (None, xmr.RctType.Null)
+    prunable = NULL_HASH if is_null else _hash(hasher, view[sections.prunable[0]:sections.prunable[1]])
+    return _hash(hasher, prefix, base, prunable)
+
+
+def transaction_hashes(blobs, hasher=None):
+    """
+    Batch mode of transaction_hash
+    :param blobs:
+    :param hasher:
+    :return: list of hashes
+    """
+    return [transaction_hash(blob, hasher=hasher) for blob in blobs]
+
+
+def tree_hash_count(count):
+    """
+    Largest power of two smaller than count, the number of leaves after the first tree hash round
+    :param count: number of hashes, at least 3
+    :return:
+    """
+    pw = 2
+    while pw < count:
+        pw <<= 1
+    return pw >> 1
+
+
+def tree_hash(hashes, hasher=None):
+    """
+    Monero tree hash (merkle root) of the hashes.
+    :param hashes: packed hashes (bytes-like, multiple of 32 B) or a list of hashes
+    :param hasher: hasher factory, Keccak-256 by default
+    :return: bytes
+    """
+    hasher = hasher or keccak_256
+    buf = memoryview(hashes if not isinstance(hashes, (list, tuple)) else b''.join(hashes)).cast('B')
+    count, rem = divmod(len(buf), HASH_SIZE)
+    if count == 0 or rem:
+        raise ValueError('Tree hash of %s bytes' % len(buf))
+    if count == 1:
+        return bytes(buf)
+    if count == 2:
+        return _hash(hasher, buf)
+
+    cnt = tree_hash_count(count)
+    i = 2 * cnt - count
+    ints = bytearray(buf[:i * HASH_SIZE])
+    for _ in range(i, cnt):
+        ints += _hash(hasher, buf[i * HASH_SIZE:(i + 2) * HASH_SIZE])
+        i += 2
+
+    while cnt > 2:
+        cnt >>= 1
+        for j in range(cnt):
+            ints[j * HASH_SIZE:(j + 1) * HASH_SIZE] = _hash(hasher, ints[2 * j * HASH_SIZE:(2 * j + 2) * HASH_SIZE])
+    return _hash(hasher, ints[:2 * HASH_SIZE])
+
+
+def tree_branch(hashes, hasher=None):
+    """
+    Returns sibling hashes on the path of the first hash to the tree hash root.
+    The first hash is always the left child, tree_hash is H(...H(H(first || b[0]) || b[1])... || b[-1]).
+    :param hashes: packed hashes (bytes-like, multiple of 32 B) or a list of hashes, the first one is not used
+    :param hasher:
+    :return: list of hashes
+    """
+    hasher = hasher or keccak_256
+    buf = memoryview(hashes if not isinstance(hashes, (list, tuple)) else b''.join(hashes)).cast('B')
+    count, rem = divmod(len(buf), HASH_SIZE)
+    if count == 0 or rem:
+        raise ValueError('Tree hash of %s bytes' % len(buf))
+    if count == 1:
+        return []
+    if count == 2:
+        return [bytes(buf[HASH_SIZE:])]
+
+    cnt = tree_hash_count(count)
+    i = 2 * cnt - count
+    branch = [bytes(buf[HASH_SIZE:2 * HASH_SIZE])] if i == 0 else []
+    ints = bytearray(buf[:i * HASH_SIZE])
+    for _ in range(i, cnt):
+        ints += _hash(hasher, buf[i * HASH_SIZE:(i + 2) * HASH_SIZE])
+        i += 2
+
+    while cnt > 2:
+        branch.append(bytes(ints[HASH_SIZE:2 * HASH_SIZE]))
+        cnt >>= 1
+        for j in range(1, cnt):
+            ints[j * HASH_SIZE:(j + 1) * HASH_SIZE] = _hash(hasher, ints[2 * j * HASH_SIZE:(2 * j + 2) * HASH_SIZE])
+    branch.append(bytes(ints[HASH_SIZE:2 * HASH_SIZE]))
+    return branch
+
+
+def tree_hash_from_branch(first, branch, hasher=None):
+    """
+    Returns the tree hash root from the first hash and its branch (see tree_branch)
+    :param first:
+    :param branch:
+    :param hasher:
+    :return: bytes
+    """
+    hasher = hasher or keccak_256
+    root = bytes(first)
+    for sibling in branch:
+        root = _hash(hasher, root, sibling)
+    return root
+
+
+def block_hashing_blob(header, miner_tx_hash, tx_hashes, hasher=None):
+    """
+    Returns the block hashing blob: header || tree hash(miner tx hash, tx hashes) || varint(1 + len(tx_hashes))
+    :param header: serialized BlockHeader
+    :param miner_tx_hash:
+    :param tx_hashes: packed tx hashes
+    :param hasher:
+    :return: bytes
+    """
+    ntxs = len(tx_hashes) // HASH_SIZE + 1
+    root = tree_hash(bytes(miner_tx_hash) + tx_hashes, hasher)
+    return bytes(header) + root + dump_uvarint_b(ntxs)
+
+
+def block_id(hashing_blob, hasher=None):
+    """
+    Returns the block ID, H(varint(len(hashing blob)) || hashing blob).
+    The block 202612 exception is applied by block_id_exception() / BlockHasher, it needs the whole block blob.
+    :param hashing_blob:
+    :param hasher:
+    :return: bytes
+    """
+    return _hash(hasher or keccak_256, dump_uvarint_b(len(hashing_blob)), hashing_blob)
+
+
+def block_id_exception(res, block_blob, height=None, hasher=None):
+    """
+    Applies the block 202612 exception of Monero calculate_block_hash to the computed block ID.
+    Blocks with the miner tx of a single txin_gen of other height are not checked.
+    :param res: block ID computed from the hashing blob
+    :param block_blob: serialized block
+    :param height: txin_gen height of the miner tx, None if the miner tx is not a single txin_gen
+    :param hasher:
+    :return: block ID, raises ValueError for a block with the block 202612 ID but a different blob
+    """
+    if height is not None and height != BLOCK_202612_HEIGHT:
+        return res
+    if _hash(hasher or keccak_256, block_blob) == BLOCK_202612_BLOB_HASH:
+        return BLOCK_202612_ID
+    if res == BLOCK_202612_ID:
+        raise ValueError('Block with the block 202612 ID but incorrect block blob')
+    return res
+
+
+def _miner_tx_height(inputs):
+    """
+    Height of the single txin_gen input (TxinGen messages or scanned TxLayout.inputs), None otherwise
+    """
+    if len(inputs) != 1:
+        return None
+    if isinstance(inputs[0], tuple):
+        return inputs[0][1] if inputs[0][0] == xmr.TxinGen.VARIANT_CODE else None
+    return inputs[0].height if isinstance(inputs[0], xmr.TxinGen) else None
+
+
+class BlockHasher(object):
+    """
+    Block hashing engine, computes block hashing blobs and block IDs of Block messages or serialized blocks.
+    BlockHeader and the miner transaction are serialized once per block, tx hashes are packed
+    to one buffer for the tree hash. The writer and archive are reused across blocks.
+    Block IDs include the block 202612 exception, see block_id_exception().
+    """
+
+    def __init__(self, hasher=None, versions=None):
+        self.hasher = hasher or keccak_256
+        self.versions = versions
+        self.writer = x.MemoryReaderWriter()
+        self.archive = x.Archive(self.writer, True, versions)
+        self.hash_layout = fixed_blob_layout(xmr.Hash)
+
+    async def _dump(self, msg, msg_type):
+        self.writer.reset()
+        self.writer.truncate(0)
+        self.archive.reset()
+        await self.archive.message(msg, msg_type)
+        return bytes(self.writer.get_buffer())
+
+    async def header_blob(self, block):
+        """
+        Serialized BlockHeader of the block
+        :param block:
+        :return: bytes
+        """
+        return await self._dump(block, xmr.BlockHeader)
+
+    async def miner_tx_blob(self, block):
+        """
+        Serialized miner transaction of the block
+        :param block:
+        :return: bytes
+        """
+        return await self._dump(block.miner_tx, xmr.Transaction)
+
+    async def miner_tx_hash(self, block):
+        """
+        Hash of the miner transaction of the block
+        :param block:
+        :return: bytes
+        """
+        return transaction_hash(await self.miner_tx_blob(block), hasher=self.hasher)
+
+    def pack_hashes(self, tx_hashes):
+        """
+        HashVector as one contiguous buffer
+        :param tx_hashes:
+        :return: bytearray
+        """
+        return self.hash_layout.encode_vector(tx_hashes or [])
+
+    async def hashing_blob(self, block):
+        """
+        Block hashing blob of the Block message
+        :param block:
+        :return: bytes
+        """
+        header = await self.header_blob(block)
+        miner_tx_hash = await self.miner_tx_hash(block)
+        return block_hashing_blob(header, miner_tx_hash, self.pack_hashes(block.tx_hashes), self.hasher)
+
+    async def hash_block(self, block):
+        """
+        Returns (block ID, hashing blob) of the Block message
+        :param block:
+        :return:
+        """
+        blob = await self.hashing_blob(block)
+        res = block_id(blob, self.hasher)
+        height = _miner_tx_height(block.miner_tx.vin)
+        if height is None or height == BLOCK_202612_HEIGHT:
+            res = block_id_exception(res, await self._dump(block, xmr.Block), height, self.hasher)
+        return res, blob
+
+    async def hash_blocks(self, blocks):
+        """
+        Batch mode of hash_block
+        :param blocks:
+        :return: list of (block ID, hashing blob)
+        """
+        return [await self.hash_block(block) for block in blocks]
+
+    def hash_block_blob(self, blob, offset=0):
+        """
+        Returns (block ID, hashing blob) of the serialized block, structural scan only
+        :param blob:
+        :param offset:
+        :return:
+        """
+        view = memoryview(blob)
+        layout = xmrscan.scan_block(view, offset)
+        miner_tx_hash = transaction_hash(view, hasher=self.hasher, sections=xmrscan.tx_sections(layout.miner_tx))
+        tx_hashes = view[layout.tx_hashes:layout.end]
+        blob = block_hashing_blob(view[offset:layout.header_end], miner_tx_hash, tx_hashes, self.hasher)
+        res = block_id(blob, self.hasher)
+
+        height = _miner_tx_height(layout.miner_tx.inputs)
+        if height is None or height == BLOCK_202612_HEIGHT:
+            res = block_id_exception(res, view[offset:layout.end], height, self.hasher)
+        return res, blob
+
+    def hash_block_blobs(self, blobs):
+        """
+        Batch mode of hash_block_blob
+        :param blobs:
+        :return: list of (block ID, hashing blob)
+        """
+        return [self.hash_block_blob(blob) for blob in blobs]
+
+
+class BlockTemplate(object):
+    """
+    Block hashing template for mining.
+
+    Keeps the serialized header, miner transaction and packed tx hashes, with the offsets
+    of BlockHeader.nonce and of the reserved extra nonce bytes (data of the first TxExtraNonce
+    in the miner tx extra). Patching the nonce rehashes just the hashing blob, patching the
+    extra nonce rehashes the miner tx prefix and the tree root over the precomputed branch.
+    """
+    NONCE_SIZE = x.UInt32.WIDTH
+
+    def __init__(self, header, miner_tx, tx_hashes=b'', hasher=None):
+        """
+        :param header: serialized BlockHeader
+        :param miner_tx: serialized miner transaction
+        :param tx_hashes: packed tx hashes
+        :param hasher:
+        """
+        self.hasher = hasher or keccak_256
+        self.miner_tx = bytearray(miner_tx)
+        self.tx_hashes = bytes(tx_hashes)
+        self.tx_count = len(self.tx_hashes) // HASH_SIZE + 1
+
+        sections = xmrscan.split_transaction(self.miner_tx)
+        layout = sections.layout
+        self.height = _miner_tx_height(layout.inputs)
+        self.prefix_end = sections.prefix[1]
+        self.base_hashes = None  # H(RCT base) || prunable hash, None for v1
+        if layout.version != 1:
+            view = memoryview(self.miner_tx)
+            is_null = layout.rct_type in (None, xmr.RctType.Null)
+            self.base_hashes = _hash(self.hasher, view[sections.base[0]:sections.base[1]]) + (
+                NULL_HASH if is_null else _hash(self.hasher, view[sections.prunable[0]:sections.prunable[1]]))
+
+        extra = xmrscan.parse_extra(memoryview(self.miner_tx)[layout.extra[0]:layout.extra[1]], views=True)
+        self.reserved_offset = self.reserved_size = None  # in the miner tx
+        if extra.nonces:
+            self.reserved_offset = layout.extra[0] + extra.nonce_offsets[0]
+            self.reserved_size = len(extra.nonces[0])
+
+        self.branch = tree_branch(NULL_HASH + self.tx_hashes, self.hasher)
+        self.nonce_offset = len(header) - self.NONCE_SIZE  # in the header and hashing blob
+        self.root_offset = len(header)
+        self.hashing_blob = bytearray(header) + NULL_HASH + dump_uvarint_b(self.tx_count)
+        self.miner_tx_hash = None
+        self._update_root()
+
+    @classmethod
+    async def from_block(cls, block, hasher=None, versions=None):
+        """
+        Template of the Block message
+        :param block:
+        :param hasher:
+        :param versions:
+        :return: BlockTemplate
+        """
+        engine = BlockHasher(hasher, versions)
+        header = await engine.header_blob(block)
+        miner_tx = await engine.miner_tx_blob(block)
+        return cls(header, miner_tx, engine.pack_hashes(block.tx_hashes), hasher)
+
+    @classmethod
+    def from_blob(cls, blob, hasher=None):
+        """
+        Template of the serialized block
+        :param blob:
+        :param hasher:
+        :return: BlockTemplate
+        """
+        view = memoryview(blob)
+        layout = xmrscan.scan_block(view)
+        if layout.end != len(view):
+            raise xmrscan.ScanError('Trailing data after block', layout.end)
+        return cls(view[:layout.header_end], view[layout.header_end:layout.miner_tx_end],
+                   view[layout.tx_hashes:layout.end], hasher)
+
+    def copy(self):
+        """
+        Copy of the template with own mutable buffers, e.g., per worker
+        :return: BlockTemplate
+        """
+        res = self.__class__.__new__(self.__class__)
+        for attr in ('hasher', 'tx_hashes', 'tx_count', 'height', 'prefix_end', 'base_hashes', 'reserved_offset',
+                     'reserved_size', 'branch', 'nonce_offset', 'root_offset', 'miner_tx_hash'):
+            setattr(res, attr, getattr(self, attr))
+        res.miner_tx = bytearray(self.miner_tx)
+        res.hashing_blob = bytearray(self.hashing_blob)
+        return res
+
+    def _update_root(self):
+        view = memoryview(self.miner_tx)
+        if self.base_hashes is None:
+            self.miner_tx_hash = _hash(self.hasher, view)
+        else:
+            self.miner_tx_hash = _hash(self.hasher, _hash(self.hasher, view[:self.prefix_end]), self.base_hashes)
+        root = tree_hash_from_branch(self.miner_tx_hash, self.branch, self.hasher)
+        self.hashing_blob[self.root_offset:self.root_offset + HASH_SIZE] = root
+
+    @property
+    def nonce(self):
+        return struct.unpack_from('<I', self.hashing_blob, self.nonce_offset)[0]
+
+    def set_nonce(self, nonce):
+        """
+        Patches BlockHeader.nonce, the tree root is kept
+        :param nonce:
+        :return: self
+        """
+        struct.pack_into('<I', self.hashing_blob, self.nonce_offset, nonce)
+        return self
+
+    @property
+    def extra_nonce(self):
+        if self.reserved_offset is None:
+            return None
+        return bytes(self.miner_tx[self.reserved_offset:self.reserved_offset + self.reserved_size])
+
+    def set_extra_nonce(self, data, offset=0):
+        """
+        Patches bytes of the reserved extra nonce, rehashes the miner tx and the tree root
+        :param data:
+        :param offset: offset in the reserved area
+        :return: self
+        """
+        if self.reserved_offset is None:
+            raise ValueError('Miner tx has no extra nonce')
+        if offset < 0 or offset + len(data) > self.reserved_size:
+            raise ValueError('Extra nonce does not fit the reserved size: %s' % self.reserved_size)
+        start = self.reserved_offset + offset
+        self.miner_tx[start:start + len(data)] = data
+        self._update_root()
+        return self
+
+    @property
+    def block_id(self):
+        res = block_id(self.hashing_blob, self.hasher)
+        if self.height is None or self.height == BLOCK_202612_HEIGHT:
+            res = block_id_exception(res, self.block_blob, self.height, self.hasher)
+        return res
+
+    @property
+    def block_blob(self):
+        """
+        Serialized block
+        :return: bytes
+        """
+        return b''.join((self.hashing_blob[:self.root_offset], self.miner_tx,
+                         dump_uvarint_b(len(self.tx_hashes) // HASH_SIZE), self.tx_hashes))
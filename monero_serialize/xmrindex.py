@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Compact array-backed indices over scanned blockchain data.
+
+Keys are kept packed in contiguous buffers instead of per-key Python objects,
+NumPy is used when available.
+'''
+
+import array
+import bisect
+import heapq
+import itertools
+import mmap
+import operator
+import os
+import struct
+import sys
+import tempfile
+
+from . import xmrscan
+from . import xmrtypes as xmr
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+KEY_SIZE = 32
+_BIG_ENDIAN = sys.byteorder == 'big'
+
+
+class _PackedKeys(object):
+    """
+    Read-only sequence view of packed fixed size keys, for bisect
+    """
+    __slots__ = ('buf', 'size')
+
+    def __init__(self, buf, size=KEY_SIZE):
+        self.buf = buf
+        self.size = size
+
+    def __len__(self):
+        return len(self.buf) // self.size
+
+    def __getitem__(self, i):
+        return self.buf[i * self.size:(i + 1) * self.size]
+
+
+def _packed(keys):
+    """
+    Returns bytes of packed keys from a packed buffer or an iterable of keys
+    """
+    if isinstance(keys, (bytes, bytearray, memoryview)):
+        keys = bytes(keys)
+    else:
+        keys = b''.join(bytes(k) for k in keys)
+    if len(keys) % KEY_SIZE:
+        raise ValueError('Keys have to be %s bytes long' % KEY_SIZE)
+    return keys
+
+
+class KeyImageSet(object):
+    """
+    Set of 32 B key images stored as one sorted packed buffer, membership by binary search.
+    With NumPy, keys are an 'S32' array and bulk operations are vectorized.
+
+    Bulk insert (update) sorts the batch and merges it into the stored keys,
+    O(n + m log(n + m)), prefer batches over single add() calls.
+    """
+    __slots__ = ('use_numpy', 'data')
+
+    def __init__(self, keys=None, use_numpy=None):
+        """
+        :param keys: packed key buffer or iterable of keys
+        :param use_numpy: None to use NumPy when available
+        """
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self.data = np.zeros(0, dtype='S%d' % KEY_SIZE) if self.use_numpy else b''
+        if keys is not None:
+            self.update(keys)
+
+    def __len__(self):
+        return len(self.data) if self.use_numpy else len(self.data) // KEY_SIZE
+
+    def __iter__(self):
+        view = _PackedKeys(self.to_bytes())
+        return (view[i] for i in range(len(view)))
+
+    def __contains__(self, key):
+        key = bytes(key)
+        if len(key) != KEY_SIZE:
+            return False
+        if self.use_numpy:
+            idx = np.searchsorted(self.data, np.bytes_(key))
+            return bool(idx < len(self.data) and self.data[idx].ljust(KEY_SIZE, b'\0') == key)
+        view = _PackedKeys(self.data)
+        idx = bisect.bisect_left(view, key)
+        return idx < len(view) and view[idx] == key
+
+    def to_bytes(self):
+        """
+        Returns the sorted packed keys
+        """
+        return self.data.tobytes() if self.use_numpy else self.data
+
+    @classmethod
+    def from_bytes(cls, data, use_numpy=None):
+        return cls(data, use_numpy)
+
+    def update(self, keys):
+        """
+        Bulk insert
+        :param keys: packed key buffer or iterable of keys
+        :return:
+        """
+        keys = _packed(keys)
+        if not keys:
+            return self
+        if self.use_numpy:
+            new = np.frombuffer(keys, dtype='S%d' % KEY_SIZE)
+            self.data = np.unique(np.concatenate((self.data, new)))
+        else:
+            view = _PackedKeys(keys)
+            new = sorted(set(view[i] for i in range(len(view))))
+
+            # linear merge, runs of the stored keys between the new ones are copied at once
+            old, data = _PackedKeys(self.data), memoryview(self.data)
+            res, pos = bytearray(), 0
+            for key in new:
+                idx = bisect.bisect_left(old, key, pos)
+                res += data[pos * KEY_SIZE:idx * KEY_SIZE]
+                pos = idx
+                if idx == len(old) or old[idx] != key:
+                    res += key
+            res += data[pos * KEY_SIZE:]
+            data.release()
+            self.data = bytes(res)
+        return self
+
+    def add(self, key):
+        return self.update([key])
+
+    def contains_many(self, keys):
+        """
+        Bulk membership test
+        :param keys: packed key buffer or iterable of keys
+        :return: list of bool, or NumPy bool array
+        """
+        keys = _packed(keys)
+        if self.use_numpy:
+            query = np.frombuffer(keys, dtype='S%d' % KEY_SIZE)
+            if len(self.data) == 0:
+                return np.zeros(len(query), dtype=np.bool_)
+            idx = np.minimum(np.searchsorted(self.data, query), len(self.data) - 1)
+            return self.data[idx] == query
+        view = _PackedKeys(keys)
+        return [view[i] in self for i in range(len(view))]
+
+
+#
+# Ring member offsets
+#
+
+
+def _check_segments_sorted(flat, bounds, msg):
+    """
+    Raises OverflowError (as array('Q') of the pure Python path) if the NumPy offsets decrease within a segment
+    """
+    if len(flat) < 2:
+        return
+    inner = np.ones(len(flat) - 1, dtype=np.bool_)
+    starts = bounds[1:-1][(bounds[1:-1] > 0) & (bounds[1:-1] < len(flat))]
+    inner[starts - 1] = False
+    if np.any(inner & (flat[1:] < flat[:-1])):
+        raise OverflowError(msg)
+
+
+def ring_offsets(txs):
+    """
+    Collects key_offsets of all TxinToKey inputs of the decoded transactions
+    :param txs: iterable of Transaction / TransactionPrefix
+    :return: (flat array of offsets, bounds array), offsets of input i are flat[bounds[i]:bounds[i + 1]]
+    """
+    flat, bounds = array.array('Q'), array.array('Q', [0])
+    for tx in txs:
+        for inp in tx.vin:
+            offsets = getattr(inp, 'key_offsets', None)
+            if offsets is not None:
+                flat.extend(offsets)
+                bounds.append(len(flat))
+    return flat, bounds
+
+
+def relative_to_absolute(flat, bounds, use_numpy=None):
+    """
+    Converts relative (wire) key offsets to absolute output indices, per input segment
+    :param flat: flat offsets of all inputs
+    :param bounds: segment boundaries, len(inputs) + 1 elements
+    :param use_numpy: None to use NumPy when available
+    :return: flat absolute offsets, NumPy uint64 array or array.array('Q')
+    """
+    use_numpy = np is not None if use_numpy is None else use_numpy
+    if use_numpy:
+        flat = np.asarray(flat, dtype=np.uint64)
+        bounds = np.asarray(bounds, dtype=np.intp)
+        if len(flat) == 0:
+            return flat.copy()
+        csum = np.cumsum(flat, dtype=np.uint64)
+        starts = np.minimum(bounds[:-1], len(flat) - 1)  # empty segments are repeated 0 times
+        base = csum[starts] - flat[starts]  # sum before the segment, wraps modulo 2**64
+        res = csum - np.repeat(base, np.diff(bounds))
+        _check_segments_sorted(res, bounds, 'Absolute offsets overflow 64 bits')
+        return res
+
+    res = array.array('Q')
+    for start, end in zip(bounds, itertools.islice(bounds, 1, None)):
+        res.extend(itertools.accumulate(flat[start:end]))
+    return res
+
+
+def absolute_to_relative(flat, bounds, use_numpy=None):
+    """
+    Converts absolute output indices to relative (wire) key offsets, per input segment
+    :param flat: flat absolute offsets of all inputs, sorted within segments
+    :param bounds: segment boundaries, len(inputs) + 1 elements
+    :param use_numpy: None to use NumPy when available
+    :return: flat relative offsets, NumPy uint64 array or array.array('Q')
+    """
+    use_numpy = np is not None if use_numpy is None else use_numpy
+    if use_numpy:
+        flat = np.asarray(flat, dtype=np.uint64)
+        bounds = np.asarray(bounds, dtype=np.intp)
+        _check_segments_sorted(flat, bounds, 'Absolute offsets are not sorted within the input')
+        res = flat.copy()
+        res[1:] -= flat[:-1]
+        starts = bounds[:-1][bounds[:-1] < bounds[1:]]
+        res[starts] = flat[starts]
+        return res
+
+    res = array.array('Q')
+    for start, end in zip(bounds, itertools.islice(bounds, 1, None)):
+        prev = 0
+        for val in flat[start:end]:
+            res.append(val - prev)
+            prev = val
+    return res
+
+
+def split_offsets(flat, bounds):
+    """
+    Returns list of per-input offset lists, e.g., to set TxinToKey.key_offsets
+    """
+    return [list(flat[start:end]) for start, end in zip(bounds, itertools.islice(bounds, 1, None))]
+
+
+#
+# Reverse ring membership index
+#
+
+
+def _tx_inputs(tx):
+    """
+    Returns list of (amount, relative key offsets) of TxinToKey inputs (None for other inputs)
+    of the Transaction object or serialized transaction
+    """
+    if hasattr(tx, 'vin'):
+        return [(inp.amount, inp.key_offsets) if hasattr(inp, 'key_offsets') else None for inp in tx.vin]
+
+    flat = array.array('Q')
+    layout = xmrscan.TxLayout()
+    try:
+        xmrscan.scan_inputs(memoryview(tx), 0, layout, flat)
+    except IndexError:
+        raise xmrscan.ScanError('Truncated data', len(tx))
+
+    res, pos = [], 0
+    for code, amount, ring, _ in layout.inputs:
+        res.append((amount, flat[pos:pos + ring]) if code == xmr.TxinToKey.VARIANT_CODE else None)
+        pos += ring
+    return res
+
+
+class RingIndex(object):
+    """
+    Reverse ring membership index: global output index -> [(txid, input index)].
+    Only inputs with the given amount are indexed (0: RingCT outputs, pre-RCT indices are per amount).
+
+    Compacted part is a sparse CSR: sorted output indices (keys), row pointers (indptr) and
+    per reference transaction number (ref_tx, into the packed txids) and input index (ref_input).
+    Arrays are stored little-endian, same as the file header.
+    Appends go to pending arrays in O(inputs), compaction sorts the pending run and merges it into
+    the CSR on the first lookup / save. The saved file is memory mapped by load().
+    """
+    MAGIC = b'XMRRING1'
+    _HEADER = struct.Struct('<8sQQQQ')  # magic, amount, txids, keys, refs
+
+    def __init__(self, amount=0, use_numpy=None):
+        self.amount = amount
+        self.use_numpy = np is not None if use_numpy is None else use_numpy
+        self.txids = bytearray()
+        self.keys = array.array('Q')
+        self.indptr = array.array('Q', [0])
+        self.ref_tx = array.array('I')
+        self.ref_input = array.array('I')
+        self._pending = (array.array('Q'), array.array('I'), array.array('I'))
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.ref_tx) + len(self._pending[0])
+
+    @property
+    def tx_count(self):
+        return len(self.txids) // KEY_SIZE
+
+    def txid(self, tx_no):
+        return bytes(self.txids[tx_no * KEY_SIZE:(tx_no + 1) * KEY_SIZE])
+
+    def add_transaction(self, txid, tx):
+        """
+        Indexes the ring members of the transaction inputs
+        :param txid: 32 B transaction hash
+        :param tx: Transaction object or serialized transaction
+        :return: number of references added
+        """
+        if len(txid) != KEY_SIZE:
+            raise ValueError('Invalid txid')
+        if isinstance(self.txids, memoryview):
+            self.txids = bytearray(self.txids)
+
+        tx_no = self.tx_count
+        keys, ref_tx, ref_input = self._pending
+        size = len(keys)
+        for input_idx, inp in enumerate(_tx_inputs(tx)):
+            if inp is None or inp[0] != self.amount:
+                continue
+            keys.extend(itertools.accumulate(inp[1]))
+            ref_tx.extend([tx_no] * len(inp[1]))
+            ref_input.extend([input_idx] * len(inp[1]))
+        self.txids += txid
+        return len(keys) - size
+
+    def add_block(self, block, txs):
+        """
+        Indexes transactions of the block, txids are taken from the block tx_hashes
+        :param block: Block object or serialized block
+        :param txs: transactions of the block (objects or blobs), in the tx_hashes order
+        :return: number of references added
+        """
+        if hasattr(block, 'tx_hashes'):
+            tx_hashes = [bytes(h) for h in block.tx_hashes]
+        else:
+            layout = xmrscan.scan_block(memoryview(block))
+            tx_hashes = [bytes(block[layout.tx_hashes + i * KEY_SIZE:layout.tx_hashes + (i + 1) * KEY_SIZE])
+                         for i in range(layout.tx_count)]
+
+        if len(tx_hashes) != len(txs):
+            raise ValueError('Transactions do not match block tx_hashes')
+        return sum(self.add_transaction(txid, tx) for txid, tx in zip(tx_hashes, txs))
+
+    def compact(self):
+        """
+        Merges pending references into the CSR arrays
+        """
+        keys, ref_tx, ref_input = self._pending
+        if not keys:
+            return self
+
+        old_keys = self._row_keys()
+        if self.use_numpy:
+            # only the pending run is sorted, existing references stay before new ones with the same key
+            new_keys = np.frombuffer(keys, dtype=np.uint64)
+            order = np.argsort(new_keys, kind='stable')
+            new_keys = new_keys[order]
+            pos = np.searchsorted(old_keys, new_keys, side='right')
+            all_keys = np.insert(old_keys, pos, new_keys)
+            all_tx = np.insert(np.asarray(self.ref_tx, dtype=np.uint32), pos,
+                               np.frombuffer(ref_tx, dtype=np.uint32)[order])
+            all_input = np.insert(np.asarray(self.ref_input, dtype=np.uint32), pos,
+                                  np.frombuffer(ref_input, dtype=np.uint32)[order])
+            starts = np.flatnonzero(np.concatenate(([True], all_keys[1:] != all_keys[:-1])))
+            self.keys = array.array('Q', all_keys[starts].tobytes())
+            self.indptr = array.array('Q', np.append(starts, len(all_keys)).astype(np.uint64).tobytes())
+            self.ref_tx = array.array('I', all_tx.tobytes())
+            self.ref_input = array.array('I', all_input.tobytes())
+
+        else:
+            by_key = operator.itemgetter(0)
+            new_refs = sorted(zip(keys, ref_tx, ref_input), key=by_key)
+            all_keys, all_tx, all_input = array.array('Q'), array.array('I'), array.array('I')
+            row_keys, indptr = array.array('Q'), array.array('Q')
+            for key, tx_no, input_idx in heapq.merge(zip(old_keys, self.ref_tx, self.ref_input), new_refs, key=by_key):
+                if not row_keys or row_keys[-1] != key:
+                    row_keys.append(key)
+                    indptr.append(len(all_tx))
+                all_tx.append(tx_no)
+                all_input.append(input_idx)
+            indptr.append(len(all_tx))
+            self.keys, self.indptr, self.ref_tx, self.ref_input = row_keys, indptr, all_tx, all_input
+
+        self._pending = (array.array('Q'), array.array('I'), array.array('I'))
+        return self
+
+    def _row_keys(self):
+        """
+        Expanded CSR row key of each reference
+        """
+        if self.use_numpy:
+            counts = np.diff(np.asarray(self.indptr, dtype=np.int64))
+            return np.repeat(np.asarray(self.keys, dtype=np.uint64), counts)
+        counts = [self.indptr[i + 1] - self.indptr[i] for i in range(len(self.keys))]
+        return array.array('Q', itertools.chain.from_iterable(itertools.repeat(k, c) for k, c in zip(self.keys, counts)))
+
+    def lookup(self, global_index):
+        """
+        Returns list of (txid, input index) of the inputs referencing the output
+        :param global_index:
+        :return:
+        """
+        self.compact()
+        idx = bisect.bisect_left(self.keys, global_index)
+        if idx >= len(self.keys) or self.keys[idx] != global_index:
+            return []
+        return [(self.txid(self.ref_tx[i]), self.ref_input[i]) for i in range(self.indptr[idx], self.indptr[idx + 1])]
+
+    def save(self, path):
+        """
+        Writes the compacted index to the file: header || txids || keys || indptr || ref_tx || ref_input
+        The file is written to a temporary file in the same directory and then replaces the target,
+        so an index loaded (memory mapped) from the same path stays valid.
+        """
+        self.compact()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                fh.write(self._HEADER.pack(self.MAGIC, self.amount, self.tx_count, len(self.keys), len(self.ref_tx)))
+                fh.write(self.txids)
+                for part, fmt in ((self.keys, 'Q'), (self.indptr, 'Q'), (self.ref_tx, 'I'), (self.ref_input, 'I')):
+                    if _BIG_ENDIAN:
+                        part = array.array(fmt, part)
+                        part.byteswap()
+                    fh.write(part)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, use_numpy=None):
+        """
+        Memory maps the index saved by save(), arrays are read-only views until the next compaction
+        (copies on big-endian hosts)
+        :param path:
+        :param use_numpy:
+        :return: RingIndex
+        """
+        with open(path, 'rb') as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, amount, ntx, nkeys, nrefs = cls._HEADER.unpack_from(mm, 0)
+        if magic != cls.MAGIC:
+            raise ValueError('Invalid ring index file')
+
+        res = cls(amount, use_numpy)
+        res._mmap = mm
+        view = memoryview(mm)
+        offset = cls._HEADER.size
+        parts = []
+        for size, fmt in ((ntx * KEY_SIZE, 'B'), (nkeys * 8, 'Q'), ((nkeys + 1) * 8, 'Q'), (nrefs * 4, 'I'),
+                          (nrefs * 4, 'I')):
+            part = view[offset:offset + size].cast(fmt)
+            if _BIG_ENDIAN and fmt != 'B':
+                part = array.array(fmt, part.tobytes())
+                part.byteswap()
+            parts.append(part)
+            offset += size
+        if offset > len(mm):
+            raise ValueError('Truncated ring index file')
+        res.txids, res.keys, res.indptr, res.ref_tx, res.ref_input = parts
+        return res
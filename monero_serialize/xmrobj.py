@@ -152,6 +152,10 @@ async def load_container(obj, container_type, params=None, container=None, field
                                       eref(res, i) if container else None)
         if not container:
             res.append(fvalue)
+
+    # byte vectors are represented as ByteVector (bytearray), same as in the binary archive
+    if not container and isinstance(elem_type, type) and x.fixed_bytes_layout(elem_type):
+        res = x.ByteVector(res)
     return res
 
 
@@ -244,7 +248,7 @@ async def dump_variant(obj, elem, elem_type=None, params=None, field_archiver=No
         }
 
     else:
-        fdef = elem_type.find_fdef(elem_type.f_specs(), elem)
+        fdef = elem_type.fdef_by_elem(elem)
         return {
             fdef[0]: await field_archiver(None, elem, fdef[1])
         }
@@ -268,16 +272,15 @@ async def load_variant(obj, elem, elem_type=None, params=None, field_archiver=No
         elem = elem_type() if elem is None else elem
 
     fname = list(obj.keys())[0]
-    for field in elem_type.f_specs():
-        if field[0] != fname:
-            continue
+    field = elem_type.fdef_by_name(fname)
+    if field is None:
+        raise ValueError('Unknown tag: %s' % fname)
 
-        fvalue = await field_archiver(obj[fname], field[1], field[2:], elem if not is_wrapped else None)
-        if is_wrapped:
-            elem.set_variant(field[0], fvalue)
+    fvalue = await field_archiver(obj[fname], field[1], field[2:], elem if not is_wrapped else None)
+    if is_wrapped:
+        elem.set_variant(field[0], fvalue)
 
-        return elem if is_wrapped else fvalue
-    raise ValueError('Unknown tag: %s' % fname)
+    return elem if is_wrapped else fvalue
 
 
 async def dump_field(obj, elem, elem_type, params=None):
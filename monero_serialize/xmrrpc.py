@@ -1231,7 +1231,7 @@ class Modeler(object):
 
         else:
             try:
-                fdef = elem_type.find_fdef(elem_type.f_specs(), elem)
+                fdef = elem_type.fdef_by_elem(elem)
                 self.tracker.push_variant(fdef[1])
                 fvalue = {
                     fdef[0]: await self._dump_field(elem, fdef[1], obj=obj)
@@ -1261,23 +1261,22 @@ class Modeler(object):
             elem = elem_type() if elem is None else elem
 
         fname = list(obj.keys())[0]
-        for field in elem_type.f_specs():
-            if field[0] != fname:
-                continue
+        field = elem_type.fdef_by_name(fname)
+        if field is None:
+            raise ValueError('Unknown tag: %s' % fname)
 
-            try:
-                self.tracker.push_variant(field[1])
-                fvalue = await self._load_field(field[1], field[2:], elem if not is_wrapped else None, obj=obj[fname])
-                self.tracker.pop()
+        try:
+            self.tracker.push_variant(field[1])
+            fvalue = await self._load_field(field[1], field[2:], elem if not is_wrapped else None, obj=obj[fname])
+            self.tracker.pop()
 
-            except Exception as e:
-                raise helpers.ArchiveException(e, tracker=self.tracker) from e
+        except Exception as e:
+            raise helpers.ArchiveException(e, tracker=self.tracker) from e
 
-            if is_wrapped:
-                elem.set_variant(field[0], fvalue)
+        if is_wrapped:
+            elem.set_variant(field[0], fvalue)
 
-            return elem if is_wrapped else fvalue
-        raise ValueError('Unknown tag: %s' % fname)
+        return elem if is_wrapped else fvalue
 
     async def message(self, msg, msg_type=None, obj=None):
         """
@@ -0,0 +1,1103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+'''
+Structural scanning of BC serialized blobs.
+
+Extracts the data needed by wallet scanning / indexing directly from
+the serialized bytes in one linear pass, without building the message
+object trees. Wire format knowledge (variant codes, sizes) is taken from
+the xmrtypes schemas.
+'''
+
+import array
+
+from . import xmrserialize as x
+from . import xmrtypes as xmr
+from .core.int_serialize import load_uvarint_b_off
+from .core.keccak import keccak_256
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+TX_EXTRA_NONCE_PAYMENT_ID = 0x00
+TX_EXTRA_NONCE_ENCRYPTED_PAYMENT_ID = 0x01
+
+_KEY_SIZE = xmr.ECPublicKey.SIZE
+
+
+class ScanError(ValueError):
+    """
+    Malformed blob, offset is the position of the offending element
+    """
+    def __init__(self, msg, offset=None):
+        super().__init__(msg if offset is None else '%s, offset: %s' % (msg, offset))
+        self.offset = offset
+
+
+_UVARINT_MAX = (1 << 64) - 1
+
+
+def read_uvarint(buf, offset):
+    """
+    Reads uvarint from the buffer, ScanError if truncated, not in the canonical (shortest) form
+    or not fitting 64 bits, as the Monero varint reader.
+    :param buf:
+    :param offset:
+    :return: (value, offset after the varint)
+    """
+    try:
+        value, end = load_uvarint_b_off(buf, offset)
+    except IndexError:
+        raise ScanError('Truncated varint', offset)
+    if end - offset > 1 and buf[end - 1] == 0:
+        raise ScanError('Non-canonical varint', offset)
+    if value > _UVARINT_MAX:
+        raise ScanError('Varint overflow', offset)
+    return value, end
+
+
+def read_span(buf, offset, size):
+    """
+    Returns end of the span of size bytes, ScanError if it does not fit the buffer
+    """
+    end = offset + size
+    if size < 0 or end > len(buf):
+        raise ScanError('Truncated data, %s bytes expected' % size, offset)
+    return end
+
+
+class TxExtraInfo(object):
+    """
+    Fields of tx extra used by the wallet scanning.
+    Values are bytes, or memoryviews into the extra buffer if parsed with views.
+    nonce_offsets are offsets of the nonces data in the extra.
+    complete is False if the parsing stopped on a malformed field, fields parsed before are kept.
+    """
+    __slots__ = ('pub_keys', 'additional_pub_keys', 'nonces', 'nonce_offsets', 'complete')
+
+    def __init__(self, pub_keys=None, additional_pub_keys=None, nonces=None, complete=True, nonce_offsets=None):
+        self.pub_keys = pub_keys if pub_keys is not None else []
+        self.additional_pub_keys = additional_pub_keys if additional_pub_keys is not None else []
+        self.nonces = nonces if nonces is not None else []
+        self.nonce_offsets = nonce_offsets if nonce_offsets is not None else []
+        self.complete = complete
+
+    @property
+    def pub_key(self):
+        """
+        The tx public key, first TxExtraPubKey
+        """
+        return self.pub_keys[0] if self.pub_keys else None
+
+    def _nonce_id(self, tag, size):
+        for nonce in self.nonces:
+            if len(nonce) == size + 1 and nonce[0] == tag:
+                return nonce[1:]
+        return None
+
+    @property
+    def payment_id(self):
+        return self._nonce_id(TX_EXTRA_NONCE_PAYMENT_ID, 32)
+
+    @property
+    def encrypted_payment_id(self):
+        return self._nonce_id(TX_EXTRA_NONCE_ENCRYPTED_PAYMENT_ID, 8)
+
+    def __repr__(self):
+        return '<TxExtraInfo pub_keys: %s, additional: %s, nonces: %s, complete: %s>' % (
+            len(self.pub_keys), len(self.additional_pub_keys), len(self.nonces), self.complete)
+
+
+def parse_extra(extra, views=False):
+    """
+    Tolerant one pass parser of the tx extra (TxExtraFields), collects the tx public keys,
+    additional public keys and nonces. Parsing stops on the first malformed or unknown field.
+
+    :param extra: bytes-like extra
+    :param views: if True, values are memoryviews into extra, otherwise bytes
+    :return: TxExtraInfo
+    """
+    buf = memoryview(extra) if views else bytes(extra)
+    res = TxExtraInfo()
+    offset = 0
+    size = len(buf)
+    try:
+        while offset < size:
+            tag = buf[offset]
+            offset += 1
+
+            if tag == xmr.TxExtraPubKey.VARIANT_CODE:
+                end = read_span(buf, offset, _KEY_SIZE)
+                res.pub_keys.append(buf[offset:end])
+
+            elif tag == xmr.TxExtraNonce.VARIANT_CODE:
+                nsize, offset = read_uvarint(buf, offset)
+                end = read_span(buf, offset, nsize)
+                res.nonces.append(buf[offset:end])
+                res.nonce_offsets.append(offset)
+
+            elif tag == xmr.TxExtraAdditionalPubKeys.VARIANT_CODE:
+                count, offset = read_uvarint(buf, offset)
+                end = read_span(buf, offset, count * _KEY_SIZE)
+                res.additional_pub_keys += [buf[i:i + _KEY_SIZE] for i in range(offset, end, _KEY_SIZE)]
+
+            elif tag in (xmr.TxExtraMergeMiningTag.VARIANT_CODE, xmr.TxExtraMysteriousMinergate.VARIANT_CODE):
+                fsize, offset = read_uvarint(buf, offset)
+                end = read_span(buf, offset, fsize)
+
+            elif tag == xmr.TxExtraPadding.VARIANT_CODE:
+                # padding spans the rest of extra, zeros only
+                if size - offset >= xmr.TxExtraPadding.TX_EXTRA_PADDING_MAX_COUNT or any(buf[offset:]):
+                    raise ScanError('Padding error', offset)
+                end = size
+
+            else:
+                raise ScanError('Unknown extra field: %s' % tag, offset - 1)
+            offset = end
+
+    except ScanError:
+        res.complete = False
+    return res
+
+
+def parse_extras(txs, views=False):
+    """
+    Batch mode of parse_extra
+    :param txs: iterable of extra buffers or transactions (objects with extra)
+    :param views:
+    :return: list of TxExtraInfo
+    """
+    return [parse_extra(getattr(tx, 'extra', tx), views) for tx in txs]
+
+
+#
+# Transaction / block layout
+#
+
+
+_HASH_SIZE = xmr.Hash.SIZE
+_NONCE_SIZE = x.UInt32.WIDTH
+_AMOUNT8_SIZE = xmr.Hash8.SIZE
+_ECDH_SIZE = xmr.ECKey.SIZE * 2
+
+_IN_GEN = xmr.TxinGen.VARIANT_CODE
+_IN_KEY = xmr.TxinToKey.VARIANT_CODE
+_IN_EMPTY = (xmr.TxinToScript.VARIANT_CODE, xmr.TxinToScriptHash.VARIANT_CODE)
+
+_OUT_KEY = xmr.TxoutToKey.VARIANT_CODE
+_OUT_TAGGED_KEY = xmr.TxoutToTaggedKey.VARIANT_CODE
+_OUT_SCRIPT_HASH = xmr.TxoutToScriptHash.VARIANT_CODE
+_OUT_SCRIPT = xmr.TxoutToScript.VARIANT_CODE
+
+_RCT_TYPES = xmr.RCT_TYPES
+_RCT_ECDH8_TYPES = (xmr.RctType.Bulletproof2, xmr.RctType.CLSAG, xmr.RctType.BulletproofPlus)
+_RANGE_SIG_SIZE = (2 * xmr.Key64.SIZE + 1 + xmr.Key64.SIZE) * _KEY_SIZE  # BoroSig s0, s1, ee + Ci
+
+
+class TxLayout(object):
+    """
+    Structure of a serialized transaction, offsets are absolute positions in the scanned buffer.
+
+    inputs: list of (variant code, amount or height, ring size, k_image offset or None)
+    outputs: list of (amount, variant code, key / hash offset or None, view tag offset or None)
+    extra: (start, end) of the extra bytes
+    base_end: end of the RCT base (v2) or of the signatures (v1)
+    ecdh_size: size of one ecdhInfo entry, 8 (amount only) or 64
+    end: end of the transaction, None if the RCT prunable part was not scanned
+    """
+    __slots__ = ('start', 'version', 'unlock_time', 'inputs', 'outputs', 'extra', 'prefix_end',
+                 'rct_type', 'fee', 'pseudo_outs', 'ecdh', 'ecdh_size', 'out_pk', 'base_end', 'end')
+
+    def __init__(self, start=0):
+        self.start = start
+        self.version = None
+        self.unlock_time = None
+        self.inputs = []
+        self.outputs = []
+        self.extra = None
+        self.prefix_end = None
+        self.rct_type = None
+        self.fee = None
+        self.pseudo_outs = None
+        self.ecdh = None
+        self.ecdh_size = None
+        self.out_pk = None
+        self.base_end = None
+        self.end = None
+
+    @property
+    def mixin(self):
+        """
+        Mixin as used by serialize_rctsig_prunable
+        """
+        return self.inputs[0][2] - 1 if self.inputs and self.inputs[0][0] == _IN_KEY else 0
+
+    def __repr__(self):
+        return '<TxLayout v%s inputs: %s, outputs: %s, rct: %s, prefix: %s-%s, base end: %s>' % (
+            self.version, len(self.inputs), len(self.outputs), self.rct_type,
+            self.start, self.prefix_end, self.base_end)
+
+
+def scan_inputs(buf, offset, layout, key_offsets=None):
+    """
+    Scans version, unlock_time and inputs of TransactionPrefix
+    :param buf:
+    :param offset:
+    :param layout: TxLayout to fill
+    :param key_offsets: if list, relative key offsets of all inputs are appended to it
+    :return: offset after the inputs
+    """
+    layout.version, offset = read_uvarint(buf, offset)
+    if layout.version == 0 or layout.version > xmr.CURRENT_TRANSACTION_VERSION:
+        raise ScanError('Unsupported transaction version: %s' % layout.version, layout.start)
+    layout.unlock_time, offset = read_uvarint(buf, offset)
+
+    count, offset = read_uvarint(buf, offset)
+    read_span(buf, offset, count)  # at least one byte per input
+    inputs = layout.inputs
+    for _ in range(count):
+        code = buf[offset]
+        offset += 1
+        if code == _IN_KEY:
+            amount, offset = read_uvarint(buf, offset)
+            ring, offset = read_uvarint(buf, offset)
+            read_span(buf, offset, ring)
+            for _ in range(ring):
+                koff, offset = read_uvarint(buf, offset)
+                if key_offsets is not None:
+                    key_offsets.append(koff)
+            inputs.append((code, amount, ring, offset))
+            offset = read_span(buf, offset, _KEY_SIZE)
+        elif code == _IN_GEN:
+            height, offset = read_uvarint(buf, offset)
+            inputs.append((code, height, 0, None))
+        elif code in _IN_EMPTY:
+            inputs.append((code, 0, 0, None))
+        else:
+            raise ScanError('Unknown input variant: %s' % code, offset - 1)
+    return offset
+
+
+def scan_prefix(buf, offset=0, layout=None, key_offsets=None):
+    """
+    Scans TransactionPrefix
+    :param buf:
+    :param offset:
+    :param layout: TxLayout to fill, new one if None
+    :param key_offsets: if list, relative key offsets of all inputs are appended to it
+    :return: TxLayout
+    """
+    layout = TxLayout(offset) if layout is None else layout
+    offset = scan_inputs(buf, offset, layout, key_offsets)
+
+    count, offset = read_uvarint(buf, offset)
+    read_span(buf, offset, 2 * count)  # at least amount and tag per output
+    outputs = layout.outputs
+    for _ in range(count):
+        amount, offset = read_uvarint(buf, offset)
+        code = buf[offset]
+        offset += 1
+        if code == _OUT_KEY:
+            outputs.append((amount, code, offset, None))
+            offset = read_span(buf, offset, _KEY_SIZE)
+        elif code == _OUT_TAGGED_KEY:
+            outputs.append((amount, code, offset, offset + _KEY_SIZE))
+            offset = read_span(buf, offset, _KEY_SIZE + xmr.ViewTag.SIZE)
+        elif code == _OUT_SCRIPT_HASH:
+            outputs.append((amount, code, offset, None))
+            offset = read_span(buf, offset, _HASH_SIZE)
+        elif code == _OUT_SCRIPT:
+            outputs.append((amount, code, None, None))
+            nkeys, offset = read_uvarint(buf, offset)
+            offset = read_span(buf, offset, nkeys * _KEY_SIZE)
+            nscript, offset = read_uvarint(buf, offset)
+            offset = read_span(buf, offset, nscript)
+        else:
+            raise ScanError('Unknown output variant: %s' % code, offset - 1)
+
+    size, offset = read_uvarint(buf, offset)
+    layout.extra = (offset, read_span(buf, offset, size))
+    layout.prefix_end = layout.extra[1]
+    return layout
+
+
+def scan_rct_base(buf, layout):
+    """
+    Scans the v1 signatures or the RCT base (serialize_rctsig_base) following the prefix
+    :param buf:
+    :param layout: TxLayout with the prefix scanned
+    :return: TxLayout
+    """
+    offset = layout.prefix_end
+    if layout.version == 1:
+        nsigs = sum(inp[2] for inp in layout.inputs)
+        layout.base_end = layout.end = read_span(buf, offset, nsigs * 2 * _KEY_SIZE)
+        return layout
+
+    if len(layout.inputs) == 0:
+        layout.base_end = layout.end = offset
+        return layout
+
+    read_span(buf, offset, 1)
+    layout.rct_type = rct_type = buf[offset]
+    offset += 1
+    if rct_type == xmr.RctType.Null:
+        layout.base_end = layout.end = offset
+        return layout
+    if rct_type not in _RCT_TYPES:
+        raise ScanError('Unknown RCT type: %s' % rct_type, offset - 1)
+
+    layout.fee, offset = read_uvarint(buf, offset)
+    if rct_type == xmr.RctType.Simple:
+        layout.pseudo_outs = offset
+        offset = read_span(buf, offset, len(layout.inputs) * _KEY_SIZE)
+
+    outputs = len(layout.outputs)
+    layout.ecdh_size = _AMOUNT8_SIZE if rct_type in _RCT_ECDH8_TYPES else _ECDH_SIZE
+    layout.ecdh = offset
+    offset = read_span(buf, offset, outputs * layout.ecdh_size)
+    layout.out_pk = offset
+    layout.base_end = read_span(buf, offset, outputs * _KEY_SIZE)
+    return layout
+
+
+def _skip_key_vectors(buf, offset, count):
+    """
+    Skips count size prefixed key vectors (KeyV)
+    """
+    for _ in range(count):
+        size, offset = read_uvarint(buf, offset)
+        offset = read_span(buf, offset, size * _KEY_SIZE)
+    return offset
+
+
+def scan_rct_prunable(buf, layout):
+    """
+    Skips the RCT prunable part (serialize_rctsig_prunable) following the RCT base, sets layout.end
+    :param buf:
+    :param layout: TxLayout with the RCT base scanned
+    :return: TxLayout
+    """
+    if layout.end is not None:
+        return layout
+
+    offset = layout.base_end
+    rct_type = layout.rct_type
+    inputs, outputs, mixin = len(layout.inputs), len(layout.outputs), layout.mixin
+    if rct_type == xmr.RctType.BulletproofPlus:
+        nbp, offset = read_uvarint(buf, offset)
+        if nbp > outputs:
+            raise ScanError('Too many bulletproofs: %s' % nbp, offset)
+        for _ in range(nbp):
+            offset = read_span(buf, offset, 6 * _KEY_SIZE)  # A, A1, B, r1, s1, d1
+            offset = _skip_key_vectors(buf, offset, 2)  # L, R
+
+    elif xmr.is_rct_bp(rct_type):
+        if rct_type == xmr.RctType.Bulletproof:
+            offset = read_span(buf, offset, x.UInt32.WIDTH)
+            nbp = int.from_bytes(buf[offset - x.UInt32.WIDTH:offset], 'little')
+        else:
+            nbp, offset = read_uvarint(buf, offset)
+        if nbp > outputs:
+            raise ScanError('Too many bulletproofs: %s' % nbp, offset)
+        for _ in range(nbp):
+            offset = read_span(buf, offset, 6 * _KEY_SIZE)  # A, S, T1, T2, taux, mu
+            offset = _skip_key_vectors(buf, offset, 2)  # L, R
+            offset = read_span(buf, offset, 3 * _KEY_SIZE)  # a, b, t
+
+    else:
+        offset = read_span(buf, offset, outputs * _RANGE_SIG_SIZE)
+
+    if rct_type in (xmr.RctType.CLSAG, xmr.RctType.BulletproofPlus):
+        offset = read_span(buf, offset, inputs * (mixin + 3) * _KEY_SIZE)  # s, c1, D
+    else:
+        is_full = rct_type == xmr.RctType.Full
+        mg_elements = inputs if not is_full else 1
+        mg_ss2_elements = 1 + (1 if not is_full else inputs)
+        offset = read_span(buf, offset, mg_elements * ((mixin + 1) * mg_ss2_elements + 1) * _KEY_SIZE)
+
+    if xmr.is_rct_bp(rct_type):
+        offset = read_span(buf, offset, inputs * _KEY_SIZE)  # pseudoOuts
+    layout.end = offset
+    return layout
+
+
+def scan_transaction(buf, offset=0, key_offsets=None, prunable=False):
+    """
+    Scans transaction prefix and the signatures / RCT base, optionally skips the RCT prunable part.
+    :param buf:
+    :param offset:
+    :param key_offsets: if list, relative key offsets of all inputs are appended to it
+    :param prunable: if True, the prunable part is scanned and layout.end is set
+    :return: TxLayout
+    """
+    try:
+        layout = scan_prefix(buf, offset, key_offsets=key_offsets)
+        scan_rct_base(buf, layout)
+        return scan_rct_prunable(buf, layout) if prunable else layout
+    except IndexError:
+        raise ScanError('Truncated data', len(buf))
+
+
+class TxSections(object):
+    """
+    Byte ranges (start, end) of the transaction sections.
+    v2: prefix, RCT base (serialize_rctsig_base), RCT prunable (serialize_rctsig_prunable, empty for Null).
+    v1: prefix, empty base, signatures as the prunable section.
+    """
+    __slots__ = ('prefix', 'base', 'prunable', 'layout')
+
+    def __init__(self, prefix, base, prunable, layout=None):
+        self.prefix = prefix
+        self.base = base
+        self.prunable = prunable
+        self.layout = layout
+
+    @property
+    def end(self):
+        return self.prunable[1]
+
+    def __repr__(self):
+        return '<TxSections prefix: %s, base: %s, prunable: %s>' % (self.prefix, self.base, self.prunable)
+
+
+def split_transaction(blob, offset=0, strict=True):
+    """
+    Returns byte ranges of the prefix, RCT base and RCT prunable sections of the serialized transaction.
+    Structural scan only, counts and length prefixes are read, nothing is decoded.
+    :param blob:
+    :param offset: start of the transaction in the blob
+    :param strict: if True, the transaction has to span the rest of the blob
+    :return: TxSections
+    """
+    layout = scan_transaction(memoryview(blob), offset, prunable=True)
+    if strict and layout.end != len(blob):
+        raise ScanError('Trailing data after transaction', layout.end)
+    return tx_sections(layout)
+
+
+def tx_sections(layout):
+    """
+    Returns TxSections of the scanned transaction, the prunable part has to be scanned (layout.end set)
+    :param layout: TxLayout
+    :return: TxSections
+    """
+    prefix = (layout.start, layout.prefix_end)
+    if layout.version == 1:
+        return TxSections(prefix, (layout.prefix_end, layout.prefix_end), (layout.prefix_end, layout.end), layout)
+    return TxSections(prefix, (layout.prefix_end, layout.base_end), (layout.base_end, layout.end), layout)
+
+
+def split_transactions(blobs, strict=True):
+    """
+    Batch mode of split_transaction
+    :param blobs:
+    :param strict:
+    :return: list of TxSections
+    """
+    return [split_transaction(blob, 0, strict) for blob in blobs]
+
+
+def prune_transaction(blob, hasher=None, sections=None):
+    """
+    Returns the pruned transaction blob (prefix + RCT base, v1: prefix) and the hash of the prunable section.
+    The pruned blob is a memoryview of the blob, the prunable section is hashed directly
+    from the blob, nothing is copied or decoded.
+
+    :param blob:
+    :param hasher: hasher factory with hashlib interface, Keccak-256 by default
+    :param sections: TxSections of the blob, split if None
+    :return: (memoryview, prunable hash), the hash is None for v1 transactions
+    """
+    sections = split_transaction(blob) if sections is None else sections
+    view = memoryview(blob)
+    pruned = view[sections.prefix[0]:sections.base[1]]
+    if sections.layout is not None and sections.layout.version == 1:
+        return pruned, None
+
+    h = (hasher or keccak_256)()
+    h.update(view[sections.prunable[0]:sections.prunable[1]])
+    return pruned, h.digest()
+
+
+def prune_transactions(blobs, hasher=None):
+    """
+    Batch mode of prune_transaction
+    :param blobs:
+    :param hasher:
+    :return: list of (memoryview, prunable hash)
+    """
+    return [prune_transaction(blob, hasher) for blob in blobs]
+
+
+def _check_prunable(prunable, layout):
+    """
+    Checks the RctSigPrunable matches the structural counts (inputs, outputs, mixin) of the transaction
+    """
+    rct_type = layout.rct_type
+    inputs, outputs, mixin = len(layout.inputs), len(layout.outputs), layout.mixin
+    if not xmr.is_rct_bp(rct_type) and len(prunable.rangeSigs) != outputs:
+        raise ValueError('rangeSigs size mismatch')
+    if xmr.is_rct_bp(rct_type) and len(prunable.pseudoOuts) != inputs:
+        raise ValueError('pseudoOuts size mismatch')
+
+    if rct_type in (xmr.RctType.CLSAG, xmr.RctType.BulletproofPlus):
+        if len(prunable.CLSAGs) != inputs:
+            raise ValueError('CLSAGs size mismatch')
+        if any(len(sig.s) != mixin + 1 for sig in prunable.CLSAGs):
+            raise ValueError('CLSAGs[i].s size mismatch')
+    else:
+        is_full = rct_type == xmr.RctType.Full
+        if len(prunable.MGs) != (inputs if not is_full else 1):
+            raise ValueError('MGs size mismatch')
+        mg_ss2_elements = 1 + (1 if not is_full else inputs)
+        for mg in prunable.MGs:
+            if len(mg.ss) != mixin + 1 or any(len(ss) != mg_ss2_elements for ss in mg.ss):
+                raise ValueError('MGs size mismatch')
+
+
+class TxPatcher(object):
+    """
+    Serialized transaction with a replaceable RCT prunable section.
+
+    Prefix and RCT base bytes are kept as serialized, patch() re-encodes only the
+    RctSigPrunable after them, into the same reusable buffer. Useful when signing
+    changes just the signatures (CLSAGs / MGs, pseudoOuts) of a transaction.
+    """
+
+    def __init__(self, blob, versions=None):
+        self.sections = split_transaction(blob)
+        self.layout = layout = self.sections.layout
+        if layout.version == 1 or layout.rct_type in (None, xmr.RctType.Null):
+            raise ValueError('Transaction has no RCT prunable section')
+
+        self.prunable_offset = self.sections.prunable[0]
+        self.writer = x.MemoryReaderWriter(bytearray(blob))
+        self.archive = x.Archive(self.writer, True, versions)
+
+    @classmethod
+    async def from_transaction(cls, tx, versions=None):
+        """
+        Serializes the transaction once, returns its patcher
+        :param tx:
+        :param versions:
+        :return: TxPatcher
+        """
+        writer = x.MemoryReaderWriter()
+        await x.Archive(writer, True, versions).message(tx, xmr.Transaction)
+        return cls(writer.get_buffer(), versions)
+
+    @property
+    def blob(self):
+        """
+        Serialized transaction, bytes copy of the patcher buffer.
+        No views of the buffer are handed out, so it can be resized by the next patch().
+        """
+        with self.writer.get_buffer() as view:
+            return bytes(view)
+
+    async def patch(self, prunable):
+        """
+        Replaces the RCT prunable section with the serialized prunable, prefix and base are not touched.
+        :param prunable: RctSigPrunable, its counts have to match the transaction
+        :return: serialized transaction, bytes
+        """
+        layout = self.layout
+        _check_prunable(prunable, layout)
+
+        self.writer.truncate(self.prunable_offset)
+        self.archive.reset()
+        await prunable.serialize_rctsig_prunable(self.archive, layout.rct_type, len(layout.inputs),
+                                                 len(layout.outputs), layout.mixin)
+        self.sections.prunable = (self.prunable_offset, self.writer.woffset)
+        return self.blob
+
+
+class BlockLayout(object):
+    """
+    Structure of a serialized block, offsets are absolute positions in the scanned buffer.
+    miner_tx is the TxLayout of the miner transaction, tx_hashes is the offset of the packed hashes.
+    """
+    __slots__ = ('start', 'major_version', 'minor_version', 'timestamp', 'prev_id', 'nonce',
+                 'header_end', 'miner_tx', 'miner_tx_end', 'tx_hashes', 'tx_count', 'end')
+
+    def __init__(self, start=0):
+        self.start = start
+        self.major_version = None
+        self.minor_version = None
+        self.timestamp = None
+        self.prev_id = None
+        self.nonce = None
+        self.header_end = None
+        self.miner_tx = None
+        self.miner_tx_end = None
+        self.tx_hashes = None
+        self.tx_count = None
+        self.end = None
+
+    def __repr__(self):
+        return '<BlockLayout v%s.%s ts: %s, txs: %s, header end: %s, end: %s>' % (
+            self.major_version, self.minor_version, self.timestamp, self.tx_count, self.header_end, self.end)
+
+
+def scan_block_header(buf, offset=0, layout=None):
+    """
+    Scans BlockHeader, prev_id and nonce are offsets
+    :param buf:
+    :param offset:
+    :param layout:
+    :return: BlockLayout
+    """
+    layout = BlockLayout(offset) if layout is None else layout
+    layout.major_version, offset = read_uvarint(buf, offset)
+    layout.minor_version, offset = read_uvarint(buf, offset)
+    layout.timestamp, offset = read_uvarint(buf, offset)
+    layout.prev_id = offset
+    layout.nonce = read_span(buf, offset, _HASH_SIZE)
+    layout.header_end = read_span(buf, layout.nonce, _NONCE_SIZE)
+    return layout
+
+
+def scan_block(buf, offset=0):
+    """
+    Scans the block: header, miner transaction (prefix + RCT base, type Null) and tx hashes
+    :param buf:
+    :param offset:
+    :return: BlockLayout
+    """
+    layout = scan_block_header(buf, offset)
+    layout.miner_tx = scan_transaction(buf, layout.header_end)
+    if layout.miner_tx.rct_type not in (None, xmr.RctType.Null):
+        raise ScanError('Miner tx has to be RCT Null', layout.header_end)
+
+    layout.miner_tx_end = layout.miner_tx.base_end
+    layout.tx_count, offset = read_uvarint(buf, layout.miner_tx_end)
+    layout.tx_hashes = offset
+    layout.end = read_span(buf, offset, layout.tx_count * _HASH_SIZE)
+    return layout
+
+
+class BlockHeaderRecord(object):
+    """
+    Block decoded for the header sync: header is the decoded BlockHeader,
+    miner_tx the (start, end) range of the serialized miner transaction,
+    tx_hashes the packed tx hashes (bytes, or a memoryview into the blob if parsed with views).
+    """
+    __slots__ = ('header', 'miner_tx', 'tx_hashes', 'tx_count', 'end')
+
+    def __init__(self, header=None, miner_tx=None, tx_hashes=None, tx_count=0, end=None):
+        self.header = header
+        self.miner_tx = miner_tx
+        self.tx_hashes = tx_hashes
+        self.tx_count = tx_count
+        self.end = end
+
+    def tx_hash(self, idx):
+        return self.tx_hashes[idx * _HASH_SIZE:(idx + 1) * _HASH_SIZE]
+
+    def __repr__(self):
+        return '<BlockHeaderRecord v%s ts: %s, miner tx: %s, txs: %s>' % (
+            self.header.major_version, self.header.timestamp, self.miner_tx, self.tx_count)
+
+
+def parse_block_header(blob, offset=0, views=False):
+    """
+    Header-only block decoding: BlockHeader is decoded, the miner transaction
+    is skipped structurally (byte range only) and tx hashes are kept packed.
+    :param blob:
+    :param offset:
+    :param views: if True, tx_hashes is a memoryview into the blob, otherwise bytes
+    :return: BlockHeaderRecord
+    """
+    buf = memoryview(blob)
+    try:
+        layout = scan_block(buf, offset)
+    except IndexError:
+        raise ScanError('Truncated data', len(buf))
+
+    nonce = int.from_bytes(buf[layout.nonce:layout.header_end], 'little')
+    header = xmr.BlockHeader(major_version=layout.major_version, minor_version=layout.minor_version,
+                             timestamp=layout.timestamp, prev_id=bytearray(buf[layout.prev_id:layout.nonce]),
+                             nonce=nonce)
+    tx_hashes = buf[layout.tx_hashes:layout.end]
+    return BlockHeaderRecord(header, (layout.header_end, layout.miner_tx_end),
+                             tx_hashes if views else bytes(tx_hashes), layout.tx_count, layout.end)
+
+
+def parse_block_headers(blobs, views=False):
+    """
+    Batch mode of parse_block_header
+    :param blobs:
+    :param views:
+    :return: list of BlockHeaderRecord
+    """
+    return [parse_block_header(blob, 0, views) for blob in blobs]
+
+
+#
+# Output scanning
+#
+
+
+class OutputRecord(object):
+    """
+    Output data needed by the view key scanning.
+
+    key: one-time output key, view_tag: int or None for untagged outputs,
+    commitment: outPk mask (None for non-RCT outputs), enc_amount: ecdhInfo amount, 8 bytes
+    for BP2+ types, 32 bytes for older RCT types, None for non-RCT outputs.
+    extra: TxExtraInfo of the transaction, shared by all outputs of the transaction.
+    """
+    __slots__ = ('tx_index', 'output_index', 'amount', 'key', 'view_tag', 'commitment', 'enc_amount', 'extra')
+
+    def __init__(self, tx_index=0, output_index=0, amount=0, key=None, view_tag=None,
+                 commitment=None, enc_amount=None, extra=None):
+        self.tx_index = tx_index
+        self.output_index = output_index
+        self.amount = amount
+        self.key = key
+        self.view_tag = view_tag
+        self.commitment = commitment
+        self.enc_amount = enc_amount
+        self.extra = extra
+
+    def __repr__(self):
+        return '<OutputRecord %s:%s amount: %s, view_tag: %s>' % (
+            self.tx_index, self.output_index, self.amount, self.view_tag)
+
+
+def _tx_blob(buf, offset=0, is_block=False):
+    """
+    Returns (buffer, TxLayout) of the transaction or miner transaction of the block
+    """
+    buf = memoryview(buf)
+    if is_block:
+        return buf, scan_block(buf, offset).miner_tx
+    return buf, scan_transaction(buf, offset)
+
+
+def layout_outputs(buf, layout, tx_index=0, views=False):
+    """
+    Returns list of OutputRecord of the scanned transaction
+    :param buf:
+    :param layout: TxLayout
+    :param tx_index:
+    :param views: if True, keys are memoryviews into buf, otherwise bytes
+    :return:
+    """
+    conv = (lambda v: v) if views else bytes
+    extra = parse_extra(buf[layout.extra[0]:layout.extra[1]], views)
+    ecdh, ecdh_size = layout.ecdh, layout.ecdh_size
+    amount_size = min(ecdh_size or 0, _KEY_SIZE)
+    res = []
+    for idx, (amount, code, key_off, tag_off) in enumerate(layout.outputs):
+        if code not in (_OUT_KEY, _OUT_TAGGED_KEY):
+            continue
+        rec = OutputRecord(tx_index, idx, amount, conv(buf[key_off:key_off + _KEY_SIZE]),
+                           buf[tag_off] if tag_off is not None else None, extra=extra)
+        if ecdh is not None:
+            pk = layout.out_pk + idx * _KEY_SIZE
+            amt = ecdh + idx * ecdh_size + (ecdh_size - amount_size)
+            rec.commitment = conv(buf[pk:pk + _KEY_SIZE])
+            rec.enc_amount = conv(buf[amt:amt + amount_size])
+        res.append(rec)
+    return res
+
+
+def scan_outputs(blob, tx_index=0, is_block=False, views=False):
+    """
+    Extracts output records of the serialized transaction, or the miner transaction of the block
+    :param blob:
+    :param tx_index:
+    :param is_block:
+    :param views: if True, keys are memoryviews into the blob, otherwise bytes
+    :return: list of OutputRecord
+    """
+    buf, layout = _tx_blob(blob, 0, is_block)
+    return layout_outputs(buf, layout, tx_index, views)
+
+
+class OutputColumns(object):
+    """
+    Columnar output records of a batch of transactions.
+    Integer columns are arrays, keys / commitments are packed in one bytearray (32 B per output),
+    enc_amounts has 8 B per output (zeros for non-RCT outputs, first 8 B of the 32 B amount
+    for types before Bulletproof2, use scan_outputs for those), view_tags one byte per output,
+    has_view_tag marks tagged outputs. extras is TxExtraInfo per transaction of the batch.
+    """
+    __slots__ = ('tx_index', 'output_index', 'amount', 'keys', 'view_tags', 'has_view_tag',
+                 'commitments', 'enc_amounts', 'extras')
+
+    def __init__(self):
+        self.tx_index = array.array('I')
+        self.output_index = array.array('I')
+        self.amount = array.array('Q')
+        self.keys = bytearray()
+        self.view_tags = bytearray()
+        self.has_view_tag = bytearray()
+        self.commitments = bytearray()
+        self.enc_amounts = bytearray()
+        self.extras = []
+
+    def __len__(self):
+        return len(self.tx_index)
+
+    def key(self, i):
+        return self.keys[i * _KEY_SIZE:(i + 1) * _KEY_SIZE]
+
+    def commitment(self, i):
+        return self.commitments[i * _KEY_SIZE:(i + 1) * _KEY_SIZE]
+
+    def enc_amount(self, i):
+        return self.enc_amounts[i * _AMOUNT8_SIZE:(i + 1) * _AMOUNT8_SIZE]
+
+    def append_layout(self, buf, layout, tx_index):
+        """
+        Appends outputs of the scanned transaction
+        """
+        ecdh, ecdh_size, out_pk = layout.ecdh, layout.ecdh_size, layout.out_pk
+        self.extras.append(parse_extra(buf[layout.extra[0]:layout.extra[1]]))
+        for idx, (amount, code, key_off, tag_off) in enumerate(layout.outputs):
+            if code not in (_OUT_KEY, _OUT_TAGGED_KEY):
+                continue
+            self.tx_index.append(tx_index)
+            self.output_index.append(idx)
+            self.amount.append(amount)
+            self.keys += buf[key_off:key_off + _KEY_SIZE]
+            self.view_tags.append(buf[tag_off] if tag_off is not None else 0)
+            self.has_view_tag.append(tag_off is not None)
+            if ecdh is None:
+                self.commitments += bytes(_KEY_SIZE)
+                self.enc_amounts += bytes(_AMOUNT8_SIZE)
+            else:
+                pk = out_pk + idx * _KEY_SIZE
+                amt = ecdh + idx * ecdh_size + (ecdh_size - min(ecdh_size, _KEY_SIZE))
+                self.commitments += buf[pk:pk + _KEY_SIZE]
+                self.enc_amounts += buf[amt:amt + _AMOUNT8_SIZE]
+        return self
+
+
+def scan_outputs_columns(blobs, is_block=False):
+    """
+    Extracts output records of a batch of serialized transactions (or blocks) as columns.
+    tx_index is the index of the blob in the batch.
+    :param blobs:
+    :param is_block:
+    :return: OutputColumns
+    """
+    res = OutputColumns()
+    for tx_index, blob in enumerate(blobs):
+        buf, layout = _tx_blob(blob, 0, is_block)
+        res.append_layout(buf, layout, tx_index)
+    return res
+
+
+#
+# View tag prefilter
+#
+
+
+class ViewTagIndex(object):
+    """
+    (tx_index, output_index, view_tag) of the key outputs of a batch of transactions.
+    Columns are NumPy arrays if NumPy is available (and not disabled), array.array otherwise.
+    tagged marks outputs with a view tag, untagged outputs always pass the filter.
+    """
+    __slots__ = ('tx_index', 'output_index', 'view_tags', 'tagged', 'use_numpy')
+
+    def __init__(self, tx_index, output_index, view_tags, tagged, use_numpy=False):
+        self.tx_index = tx_index
+        self.output_index = output_index
+        self.view_tags = view_tags
+        self.tagged = tagged
+        self.use_numpy = use_numpy
+
+    def __len__(self):
+        return len(self.tx_index)
+
+    @classmethod
+    def from_blobs(cls, blobs, is_block=False, use_numpy=None):
+        """
+        Builds the index from serialized transactions (or blocks, miner tx outputs).
+        tx_index is the index of the blob in the batch.
+        :param blobs:
+        :param is_block:
+        :param use_numpy: None to use NumPy when available
+        :return:
+        """
+        tx_index, output_index = array.array('I'), array.array('I')
+        view_tags, tagged = bytearray(), bytearray()
+        for tx_idx, blob in enumerate(blobs):
+            buf, layout = _tx_blob(blob, 0, is_block)
+            for idx, (_, code, _, tag_off) in enumerate(layout.outputs):
+                if code == _OUT_TAGGED_KEY:
+                    view_tags.append(buf[tag_off])
+                    tagged.append(1)
+                elif code == _OUT_KEY:
+                    view_tags.append(0)
+                    tagged.append(0)
+                else:
+                    continue
+                tx_index.append(tx_idx)
+                output_index.append(idx)
+
+        use_numpy = np is not None if use_numpy is None else use_numpy
+        if use_numpy:
+            return cls(np.frombuffer(tx_index, dtype=np.uint32), np.frombuffer(output_index, dtype=np.uint32),
+                       np.frombuffer(view_tags, dtype=np.uint8), np.frombuffer(tagged, dtype=np.bool_), True)
+        return cls(tx_index, output_index, view_tags, tagged, False)
+
+    def match(self, expected):
+        """
+        Returns positions of the outputs whose view tag equals the expected tag, untagged outputs included.
+        :param expected: expected view tag per output, bytes-like or array of len(self)
+        :return: array of positions
+        """
+        if len(expected) != len(self):
+            raise ValueError('Expected tags size mismatch')
+        if self.use_numpy:
+            expected = np.frombuffer(expected, dtype=np.uint8) if isinstance(expected, (bytes, bytearray)) \
+                else np.asarray(expected, dtype=np.uint8)
+            return np.flatnonzero((self.view_tags == expected) | ~self.tagged)
+        return array.array('I', [i for i, (tag, exp, tagged) in enumerate(zip(self.view_tags, expected, self.tagged))
+                                 if tag == exp or not tagged])
+
+    def matching_txs(self, expected):
+        """
+        Returns sorted indices of transactions with at least one matching output, to be fully decoded
+        :param expected:
+        :return:
+        """
+        pos = self.match(expected)
+        if self.use_numpy:
+            return np.unique(self.tx_index[pos])
+        return sorted(set(self.tx_index[i] for i in pos))
+
+
+#
+# Key images
+#
+
+
+def _scan_key_images_into(buf, res, is_block=False):
+    layout = TxLayout()
+    try:
+        offset = scan_block_header(buf).header_end if is_block else 0
+        scan_inputs(buf, offset, layout)
+    except IndexError:
+        raise ScanError('Truncated data', len(buf))
+
+    for code, _, _, ki_off in layout.inputs:
+        if code == _IN_KEY:
+            res += buf[ki_off:ki_off + _KEY_SIZE]
+    return res
+
+
+def scan_key_images(blob, is_block=False):
+    """
+    Extracts key images of the TxinToKey inputs, only the inputs are scanned.
+    :param blob: serialized transaction (or block, miner tx)
+    :param is_block:
+    :return: bytearray of packed 32 B key images
+    """
+    res = bytearray()
+    _scan_key_images_into(memoryview(blob), res, is_block)
+    return res
+
+
+def scan_key_images_batch(blobs, is_block=False):
+    """
+    Batch mode of scan_key_images
+    :param blobs:
+    :param is_block:
+    :return: (bytearray of packed key images, array of tx_index per key image)
+    """
+    res = bytearray()
+    tx_index = array.array('I')
+    for idx, blob in enumerate(blobs):
+        size = len(res)
+        _scan_key_images_into(memoryview(blob), res, is_block)
+        tx_index.extend([idx] * ((len(res) - size) // _KEY_SIZE))
+    return res, tx_index
+
+
+def scan_ring_offsets(blobs, is_block=False):
+    """
+    Extracts relative key offsets of all TxinToKey inputs of the serialized transactions.
+    Offsets are written by the scanner straight to one flat array.
+    :param blobs:
+    :param is_block:
+    :return: (flat array('Q') of relative offsets, bounds array('Q') with len(inputs) + 1 elements),
+             offsets of input i are flat[bounds[i]:bounds[i + 1]], see xmrindex.relative_to_absolute
+    """
+    flat, bounds = array.array('Q'), array.array('Q', [0])
+    for blob in blobs:
+        buf = memoryview(blob)
+        layout = TxLayout()
+        try:
+            offset = scan_block_header(buf).header_end if is_block else 0
+            scan_inputs(buf, offset, layout, flat)
+        except IndexError:
+            raise ScanError('Truncated data', len(buf))
+        for code, _, ring, _ in layout.inputs:
+            if code == _IN_KEY:
+                bounds.append(bounds[-1] + ring)
+    return flat, bounds
+
+
+#
+# Validation
+#
+
+
+def validate_transaction(blob, max_size=None):
+    """
+    Validate-only structural pass over the serialized transaction, nothing is decoded.
+    Checks variant codes, declared counts against the remaining bytes, fixed sizes, the transaction
+    version and RCT type, canonical varints, bulletproof counts and trailing data.
+    :param blob:
+    :param max_size: maximal transaction size in bytes
+    :return: None if the blob is well formed, ScanError describing the first problem otherwise
+    """
+    if max_size is not None and len(blob) > max_size:
+        return ScanError('Transaction too large: %s B' % len(blob), max_size)
+    try:
+        split_transaction(blob)
+    except ScanError as e:
+        return e
+    return None
+
+
+def validate_transactions(blobs, max_size=None):
+    """
+    Batch mode of validate_transaction
+    :param blobs:
+    :param max_size:
+    :return: list of None / ScanError
+    """
+    return [validate_transaction(blob, max_size) for blob in blobs]
+
+
+def validate_block(blob, max_size=None):
+    """
+    Validate-only structural pass over the serialized block: header, miner transaction
+    (RCT Null) and tx hashes, see validate_transaction
+    :param blob:
+    :param max_size: maximal block size in bytes
+    :return: None if the blob is well formed, ScanError describing the first problem otherwise
+    """
+    if max_size is not None and len(blob) > max_size:
+        return ScanError('Block too large: %s B' % len(blob), max_size)
+    try:
+        buf = memoryview(blob)
+        layout = scan_block(buf)
+        if layout.end != len(buf):
+            return ScanError('Trailing data after block', layout.end)
+    except IndexError:
+        return ScanError('Truncated data', len(blob))
+    except ScanError as e:
+        return e
+    return None
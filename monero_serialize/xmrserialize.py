@@ -38,8 +38,9 @@ import sys
 
 from . import helpers
 from .protobuf import const, load_uvarint, dump_uvarint
-from .core.readwriter import MemoryReaderWriter
+from .core.readwriter import MemoryReaderWriter, RecordingReaderWriter
 from .core.base_types import *
+from .core.fixed_layout import ByteVector, FixedLayout, FixedBytesLayout, fixed_layout, fixed_blob_layout, fixed_bytes_layout
 from .core.erefs import has_elem, set_elem, get_elem, ElemRefArr, ElemRefObj, eref, is_elem_ref
 from .core.int_serialize import *
 from .core.message_types import *
@@ -74,8 +75,16 @@ class Archive(object):
     In order to use the archive for both ways we have to use so-called field references
     as we cannot directly modify given element as a parameter (value-passing) as its performed
     in C++ code. see: eref(), get_elem(), set_elem()
+
+    Reuse mode (loading only, reuse=True): loading into a previously decoded object tree
+    overwrites the objects in place. Messages of the same type, lists and bytearrays
+    are reused, new objects are allocated only when the shapes differ.
     """
-    def __init__(self, iobj, writing=True, versions=None, **kwargs):
+    ENC_CACHE_FORMAT = 'bc'  # encoding cache key prefix, None disables the cache
+    FIXED_LAYOUT = True  # use precompiled codecs for fixed-layout messages
+    READ_CHUNK = 1 << 16  # bulk reads larger than this are done in chunks
+
+    def __init__(self, iobj, writing=True, versions=None, reuse=False, **kwargs):
         self.writing = writing
         self.iobj = iobj
         self.tracker = helpers.Tracker()
@@ -83,6 +92,75 @@ class Archive(object):
         # Using boost versioning also for BC format.
         self.version_settings = versions  # type: VersionSetting
 
+        # Encoding cache, stack of the cached messages being serialized
+        self._enc_stack = []
+        self._enc_versions = None
+
+        # Reuse mode, (id(msg), field) -> previous field value
+        self.reuse = reuse and not writing
+        self._reuse_pool = {}
+        self._reuse_depth = 0
+
+    def reset(self, iobj=None):
+        """
+        Resets the archive state so it can be used for the next message.
+        :param iobj: new reader / writer, current one is kept if None
+        :return:
+        """
+        self.iobj = iobj if iobj is not None else self.iobj
+        self.tracker = helpers.Tracker()
+        self._enc_stack = []
+        self._reuse_pool.clear()
+        self._reuse_depth = 0
+
+    def _reuse_stash(self, msg):
+        """
+        Moves field values of the message to the reuse pool, leaving the message empty.
+        Fields not loaded again are thus unset as in a freshly constructed message.
+        :param msg:
+        :return:
+        """
+        fields = [f for f in cls_slots(msg.__class__) if hasattr(msg, f)]
+        fields += list(getattr(msg, '__dict__', ()))
+        for f in fields:
+            val = getattr(msg, f)
+            if isinstance(val, (list, bytearray, MessageType, VariantType)):
+                self._reuse_pool[(id(msg), f)] = val
+            delattr(msg, f)
+        return msg
+
+    def _reuse_container(self, container, size, elem_type=None):
+        """
+        Truncates the container to the size, kept message elements
+        of the element type are emptied for reuse, other messages are dropped.
+        :param container:
+        :param size:
+        :param elem_type:
+        :return:
+        """
+        del container[size:]
+        if elem_type is None or not is_type(elem_type, MessageType):
+            return container
+        for i, elem in enumerate(container):
+            if elem.__class__ is elem_type:
+                self._reuse_stash(elem)
+            else:
+                container[i] = None
+        return container
+
+    def _reuse_elem(self, elem):
+        """
+        Returns the element referenced by the elem ref, in reuse mode
+        the previous field value is taken from the pool and set back.
+        :param elem:
+        :return:
+        """
+        val = get_elem(elem)
+        if val is not None or not self.reuse or not is_elem_ref(elem) or elem[0] != ElemRefObj:
+            return val
+        val = self._reuse_pool.pop((id(elem[1]), elem[2]), None)
+        return val if val is None else set_elem(elem, val)
+
     def _cur_version(self, tw, elem=None):
         has_version = False
         if elem:
@@ -135,19 +213,26 @@ class Archive(object):
 
     async def prepare_container(self, size, container, elem_type=None):
         """
-        Prepares container for serialization
+        Prepares container for serialization.
+        On load, the capacity is reserved with None placeholders, no element objects are constructed.
+        Elements are constructed when loaded (field(), prepare_message()).
+
         :param size:
         :param container:
+        :param elem_type:
         :return:
         """
         if not self.writing:
             if container is None:
-                return gen_elem_array(size, elem_type)
+                return [None] * size
 
-            fvalue = get_elem(container)
-            if fvalue is None:
+            fvalue = self._reuse_elem(container)
+            if not isinstance(fvalue, list):
                 fvalue = []
-            fvalue += gen_elem_array(max(0, size - len(fvalue)), elem_type)
+            if self.reuse:
+                self._reuse_container(fvalue, size, elem_type)
+            if size > len(fvalue):
+                fvalue += [None] * (size - len(fvalue))
             set_elem(container, fvalue)
             return fvalue
 
@@ -160,6 +245,10 @@ class Archive(object):
         """
         if self.writing:
             return
+        if self.reuse:
+            prev = self._reuse_elem(msg)
+            if prev is not None and prev.__class__ is msg_type:
+                return set_elem(msg, self._reuse_stash(prev))
         return set_elem(msg, msg_type())
 
     async def uvarint(self, elem):
@@ -214,6 +303,10 @@ class Archive(object):
             return await dump_blob(
                 self.iobj, elem=elem, elem_type=elem_type, params=params
             )
+        elif self.reuse:
+            return await load_blob_into(
+                self.iobj, elem_type=elem_type, elem=elem if isinstance(elem, bytearray) else None
+            )
         else:
             return await load_blob(
                 self.iobj, elem_type=elem_type, params=params, elem=elem
@@ -336,19 +429,133 @@ class Archive(object):
         :return:
         """
         elem_type = msg_type if msg_type is not None else msg.__class__
+        if self.reuse:
+            return await self._message_reuse(msg, elem_type, use_version)
+
         msg = elem_type() if msg is None else msg
-        if hasattr(elem_type, "serialize_archive"):
-            version = await self.version(elem_type, None, elem=msg) if use_version is None else use_version
+        return await self._message(msg, elem_type, use_version)
+
+    async def _message(self, msg, msg_type, use_version=None):
+        if hasattr(msg_type, "serialize_archive"):
+            version = await self.version(msg_type, None, elem=msg) if use_version is None else use_version
+            if getattr(msg.__class__, 'ENC_CACHE', False):
+                return await self.enc_cached(msg, (msg_type, version), msg.serialize_archive, self, version=version)
             return await msg.serialize_archive(self, version=version)
 
-        mtype = msg.__class__ if msg_type is None else msg_type
-        fields = mtype.f_specs()
-        if hasattr(mtype, "serialize_archive"):
-            raise ValueError("Cannot directly load, has to use archive with %s" % mtype)
+        layout = fixed_layout(msg_type) if self.FIXED_LAYOUT else None
+        if layout is not None:
+            fnc, fields = self._message_fixed, layout
+        else:
+            fnc, fields = self.message_fields, msg_type.f_specs()
+
+        if getattr(msg.__class__, 'ENC_CACHE', False):
+            await self.enc_cached(msg, (msg_type,), fnc, msg, fields)
+            return msg
 
-        await self.message_fields(msg, fields)
+        await fnc(msg, fields)
         return msg
 
+    async def _message_fixed(self, msg, layout):
+        """
+        Loads/dumps fixed-layout message with a single read / write
+        :param msg:
+        :param layout:
+        :type layout: FixedLayout
+        :return:
+        """
+        try:
+            if self.writing:
+                await self.iobj.awrite(layout.encode(msg))
+            else:
+                buf = await self._read_exact(layout.size)
+                layout.decode(buf, msg=msg)
+            return msg
+        except Exception as e:
+            raise helpers.ArchiveException(e, tracker=self.tracker) from e
+
+    async def _read_exact(self, size):
+        """
+        Reads exactly size bytes. Sizes computed from untrusted counts are read in bounded chunks,
+        so missing data fails on the end of the input instead of allocating the whole size upfront.
+        :param size:
+        :return: bytearray
+        """
+        if size <= self.READ_CHUNK:
+            buf = bytearray(size)
+            nread = await self.iobj.areadinto(buf)
+            if nread != size:
+                raise ValueError('Invalid buffer size read, nread: %s vs expecting: %s' % (nread, size))
+            return buf
+
+        buf = bytearray()
+        while len(buf) < size:
+            chunk = bytearray(min(self.READ_CHUNK, size - len(buf)))
+            nread = await self.iobj.areadinto(chunk)
+            if nread != len(chunk):
+                raise ValueError('Invalid buffer size read, nread: %s vs expecting: %s' % (len(buf) + nread, size))
+            buf += chunk
+        return buf
+
+    async def _message_reuse(self, msg, msg_type, use_version=None):
+        """
+        Loads message in the reuse mode. Previous field values of the message
+        are moved to the reuse pool, the pool is cleared after the root message is loaded.
+        """
+        if msg is None or not isinstance(msg, msg_type):
+            msg = msg_type()
+        else:
+            self._reuse_stash(msg)
+
+        self._reuse_depth += 1
+        try:
+            return await self._message(msg, msg_type, use_version)
+        finally:
+            self._reuse_depth -= 1
+            if self._reuse_depth == 0:
+                self._reuse_pool.clear()
+
+    def _enc_cache_key(self, key):
+        if self._enc_versions is None:
+            self._enc_versions = frozenset(self.version_settings.db.items()) if self.version_settings else ()
+        return (self.ENC_CACHE_FORMAT, self._enc_versions) + tuple(key)
+
+    async def enc_cached(self, msg, key, fnc, *args, **kwargs):
+        """
+        Serializes the message with the fnc using the encoding cache of the message.
+        If the message has the encoding cached for the key, the bytes are written
+        directly (on dump). Otherwise the serialized bytes are recorded and stored
+        to the message cache (both dump and load).
+
+        :param msg: message with the encoding cache enabled
+        :param key: tuple identifying the serialization of the message (type, version, params)
+        :param fnc: serialization coroutine function
+        :return: result of the fnc
+        """
+        if self.ENC_CACHE_FORMAT is None or not getattr(msg.__class__, 'ENC_CACHE', False):
+            return await fnc(*args, **kwargs)
+
+        key = self._enc_cache_key(key)
+        parent = self._enc_stack[-1] if self._enc_stack else None
+        data = msg.get_enc_cache(key) if self.writing else None
+        if data is not None:
+            await self.iobj.awrite(data)
+            msg.set_enc_cache_data(key, None, parent)
+            return msg
+
+        iobj = self.iobj
+        self.iobj = RecordingReaderWriter(iobj)
+        self._enc_stack.append(msg)
+        try:
+            res = await fnc(*args, **kwargs)
+            data = bytes(self.iobj.record)
+        finally:
+            self._enc_stack.pop()
+            self.iobj = iobj
+
+        msg.set_enc_cache_data(key, data, parent)
+        msg.link_enc_cache()
+        return res
+
     async def message_field(self, msg, field, fvalue=None):
         """
         Dumps/Loads message field
@@ -437,6 +644,8 @@ class Archive(object):
         """
         elem_type = elem_type if elem_type else elem.__class__
         fvalue = None
+        if self.reuse:
+            self._reuse_elem(elem)
 
         etype = self._get_type(elem_type)
         if self._is_type(etype, UVarintType):
@@ -540,6 +749,12 @@ class Archive(object):
         await self._dump_container_size(writer, len(container), container_type)
 
         elem_type = container_elem_type(container_type, params)
+        layout = self._container_layout(elem_type, params)
+        if layout is not None:
+            try:
+                return await writer.awrite(layout.encode_vector(container))
+            except Exception as e:
+                raise helpers.ArchiveException(e, tracker=self.tracker) from e
 
         for idx, elem in enumerate(container):
             try:
@@ -570,10 +785,34 @@ class Archive(object):
             if container_type.FIX_SIZE
             else await load_uvarint(reader)
         )
+        elem_type = container_elem_type(container_type, params)
+        layout = self._container_layout(elem_type, params)
+        if self.reuse and isinstance(container, bytearray) and isinstance(layout, FixedBytesLayout):
+            # byte vector from the previous decode, resized in place to the new length
+            try:
+                container[:] = await self._read_exact(c_len)
+            except Exception as e:
+                raise helpers.ArchiveException(e, tracker=self.tracker) from e
+            return container
+
+        if self.reuse and isinstance(container, list):
+            if isinstance(layout, FixedBytesLayout):
+                container = None
+            else:
+                return await self._load_container_into(reader, container, c_len, container_type, params)
+
         if container and get_elem(container) and c_len != len(container):
             raise ValueError("Size mismatch")
 
-        elem_type = container_elem_type(container_type, params)
+        if layout is not None and (container is None or isinstance(container, bytearray)):
+            try:
+                buf = await self._read_exact(c_len * layout.size)
+                if isinstance(container, bytearray):
+                    return layout.decode_vector_into(buf, container)
+                return layout.decode_vector(buf, c_len)
+            except Exception as e:
+                raise helpers.ArchiveException(e, tracker=self.tracker) from e
+
         res = container if container else []
         for i in range(c_len):
             try:
@@ -592,6 +831,80 @@ class Archive(object):
                 res.append(fvalue)
         return res
 
+    def _container_layout(self, elem_type, params=None):
+        """
+        Returns fixed layout of the container elements for the bulk path, None if not applicable
+        """
+        if (params and len(params) > 1) or not isinstance(elem_type, type):
+            return None
+        if issubclass(elem_type, IntType):
+            return fixed_bytes_layout(elem_type)  # byte vectors are always compact
+        if not self.FIXED_LAYOUT:
+            return None
+        if issubclass(elem_type, MessageType):
+            return fixed_layout(elem_type)
+        if issubclass(elem_type, BlobType):
+            return fixed_blob_layout(elem_type)
+        return None
+
+    async def blob_vector(self, elem, count, elem_type):
+        """
+        Loads/dumps vector of `count` blobs without the size prefix,
+        e.g., key vectors of the RCT signatures (CLSAG s, MG ss rows, pseudoOuts)
+        or v1 ring signatures (fixed layout messages).
+        Fixed size elements are read / written in one call, otherwise falls back to per-element fields.
+        Loaded vector is set to the element reference.
+
+        :param elem: vector reference
+        :param count:
+        :param elem_type: blob type or fixed layout message type
+        :return:
+        """
+        layout = self._container_layout(elem_type)
+        if layout is None:
+            vect = await self.prepare_container(count, elem, elem_type=elem_type)
+            vect = get_elem(elem) if vect is None else vect
+            for i in range(count):
+                await self.field(eref(vect, i), elem_type)
+            return vect
+
+        try:
+            if self.writing:
+                vect = get_elem(elem)
+                if len(vect) != count:
+                    raise ValueError('Vector size mismatch')
+                await self.iobj.awrite(layout.encode_vector(vect))
+                return vect
+
+            buf = await self._read_exact(count * layout.size)
+            prev = self._reuse_elem(elem) if self.reuse else None
+            if isinstance(prev, list):
+                del prev[count:]
+                prev += [None] * (count - len(prev))
+                return layout.decode_vector_into(buf, prev)
+            return set_elem(elem, layout.decode_vector(buf, count))
+        except Exception as e:
+            raise helpers.ArchiveException(e, tracker=self.tracker) from e
+
+    async def _load_container_into(self, reader, container, c_len, container_type, params=None):
+        """
+        Loads container elements into the existing container, reuse mode.
+        Container is truncated / extended to the loaded size, existing elements are reused.
+        """
+        elem_type = container_elem_type(container_type, params)
+        del container[c_len:]
+        for i in range(c_len):
+            try:
+                self.tracker.push_index(i)
+                if i < len(container):
+                    await self.load_field(reader, elem_type, params[1:] if params else None, eref(container, i))
+                else:
+                    container.append(await self.load_field(reader, elem_type, params[1:] if params else None))
+                self.tracker.pop()
+            except Exception as e:
+                raise helpers.ArchiveException(e, tracker=self.tracker) from e
+        return container
+
     async def _dump_tuple(self, writer, elem, elem_type, params=None):
         """
         Dumps tuple of elements to the writer.
@@ -736,16 +1049,31 @@ class Archive(object):
             elem = elem_type() if elem is None else elem
 
         tag = await load_uint(reader, 1)
-        for field in elem_type.f_specs():
-            ftype = field[1]
-            if ftype.VARIANT_CODE == tag:
-                fvalue = await self.load_field(
-                    reader, ftype, field[2:], elem if not is_wrapped else None
-                )
-                if is_wrapped:
-                    elem.set_variant(field[0], fvalue)
-                return elem if is_wrapped else fvalue
-        raise ValueError("Unknown tag: %s" % tag)
+        field = elem_type.fdef_by_code(tag)
+        if field is None:
+            raise ValueError("Unknown tag: %s" % tag)
+
+        ftype = field[1]
+        prev = elem if not is_wrapped else self._variant_prev(elem, field[0])
+        fvalue = await self.load_field(
+            reader, ftype, field[2:], prev if isinstance(prev, ftype) else None
+        )
+        if is_wrapped:
+            elem.set_variant(field[0], fvalue)
+        return elem if is_wrapped else fvalue
+
+    def _variant_prev(self, elem, fname):
+        """
+        Returns previous value of the wrapped variant for the reuse mode.
+        Previous value of another variant type is removed.
+        """
+        if not self.reuse or elem.variant_elem is None:
+            return None
+        if elem.variant_elem == fname:
+            return getattr(elem, fname, None)
+        if hasattr(elem, elem.variant_elem):
+            delattr(elem, elem.variant_elem)
+        return None
 
 
 async def dump_blob(writer, elem, elem_type, params=None):
@@ -774,6 +1102,37 @@ async def dump_blob(writer, elem, elem_type, params=None):
     await writer.awrite(data)
 
 
+async def load_blob_into(reader, elem_type, elem=None):
+    """
+    Loads blob from reader into the existing bytearray, resized to the blob size.
+    Allocates a new bytearray if elem is None.
+    The size is untrusted, the bytearray grows by bounded chunks as the data is read.
+
+    :param reader:
+    :param elem_type:
+    :param elem: bytearray
+    :return:
+    """
+    ivalue = elem_type.SIZE if elem_type.FIX_SIZE else await load_uvarint(reader)
+    if elem is None:
+        elem = bytearray(min(ivalue, Archive.READ_CHUNK))
+    elif len(elem) > ivalue:
+        del elem[ivalue:]
+
+    nread = await reader.areadinto(elem)
+    while nread == len(elem) < ivalue:
+        chunk = bytearray(min(Archive.READ_CHUNK, ivalue - len(elem)))
+        cread = await reader.areadinto(chunk)
+        elem += chunk[:cread]
+        nread += cread
+        if cread != len(chunk):
+            break
+
+    if nread != ivalue:
+        raise ValueError('Invalid buffer size read, nread: %s vs expecting: %s' % (nread, ivalue))
+    return elem
+
+
 async def load_blob(reader, elem_type, params=None, elem=None):
     """
     Loads blob from reader to the element. Returns the loaded blob.
@@ -829,15 +1188,4 @@ async def load_unicode(reader):
 
 
 def find_variant_fdef(elem_type, elem):
-    fields = elem_type.f_specs()
-    for x in fields:
-        if isinstance(elem, x[1]):
-            return x
-
-    # Not direct hierarchy
-    name = elem.__class__.__name__
-    for x in fields:
-        if name == x[1].__name__:
-            return x
-
-    raise ValueError("Unrecognized variant: %s" % elem)
+    return elem_type.fdef_by_elem(elem)
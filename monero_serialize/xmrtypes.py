@@ -8,7 +8,9 @@ XMR types
 from . import xmrserialize as x
 from . import xmrrpc
 from .xmrserialize import eref
+from .protobuf import AHashWriter
 from .core import versioning
+from .core.keccak import keccak_256
 
 
 #
@@ -366,22 +368,17 @@ class RctSigBase(x.MessageType):
         await self._msg_field(ar, idx=0)
         if self.type == RctType.Null:
             return
-        if self.type != RctType.Full and self.type != RctType.FullBulletproof and \
-                self.type != RctType.Simple and self.type != RctType.SimpleBulletproof and \
-                self.type != RctType.Bulletproof and self.type != RctType.Bulletproof2 and \
-                self.type != RctType.CLSAG and self.type != RctType.BulletproofPlus:
+        if self.type not in RCT_TYPES:
             raise ValueError('Unknown type')
 
         await self._msg_field(ar, idx=1)
         if self.type == RctType.Simple:
             await ar.tag('pseudoOuts')
             await ar.begin_array()
-            await ar.prepare_container(inputs, eref(self, 'pseudoOuts'), KeyV)
             if ar.writing and len(self.pseudoOuts) != inputs:
                 raise ValueError('pseudoOuts size mismatch')
 
-            for i in range(inputs):
-                await ar.field(eref(self.pseudoOuts, i), KeyV.ELEM_TYPE)
+            await ar.blob_vector(eref(self, 'pseudoOuts'), inputs, KeyV.ELEM_TYPE)
             await ar.end_array()
 
         await ar.tag('ecdhInfo')
@@ -392,6 +389,7 @@ class RctSigBase(x.MessageType):
 
         for i in range(outputs):
             if self.type in (RctType.Bulletproof2, RctType.CLSAG, RctType.BulletproofPlus):
+                await ar.prepare_message(eref(self.ecdhInfo, i), EcdhTuple)
                 am8 = [self.ecdhInfo[i].amount[0:8] if ar.writing else bytearray(0)]
                 await ar.field(eref(am8, 0), Hash8)
                 if not ar.writing:
@@ -408,6 +406,7 @@ class RctSigBase(x.MessageType):
             raise ValueError('outPk size mismatch')
 
         for i in range(outputs):
+            await ar.prepare_message(eref(self.outPk, i), CtKey)
             await ar.field(eref(self.outPk[i], 'mask'), ECKey)
         await ar.end_array()
 
@@ -434,6 +433,11 @@ class RctType(object):
     SimpleBulletproof = 4   # pre v9, deprecated
 
 
+# RCT types with signatures, valid in serialize_rctsig_base / serialize_rctsig_prunable
+RCT_TYPES = (RctType.Full, RctType.Simple, RctType.Bulletproof, RctType.Bulletproof2,
+             RctType.CLSAG, RctType.BulletproofPlus)
+
+
 def is_rct_bp(rct_type):
     return rct_type in (RctType.Bulletproof, RctType.Bulletproof2, RctType.CLSAG, RctType.BulletproofPlus)
 
@@ -463,9 +467,7 @@ class RctSigPrunable(x.MessageType):
         if type == RctType.Null:
             return True
 
-        if type != RctType.Full and type != RctType.Bulletproof and \
-                type != RctType.Simple and type != RctType.Bulletproof2 and \
-                type != RctType.CLSAG and type != RctType.BulletproofPlus:
+        if type not in RCT_TYPES:
             raise ValueError('Unknown type')
 
         if type == RctType.BulletproofPlus:
@@ -522,15 +524,14 @@ class RctSigPrunable(x.MessageType):
                 # We save the CLSAGs contents directly, because we want it to save its
                 # arrays without the size prefixes, and the load can't know what size
                 # to expect if it's not in the data
+                await ar.prepare_message(eref(self.CLSAGs, i), CLSAG)
                 await ar.begin_object()
                 await ar.tag('s')
                 await ar.begin_array()
-                await ar.prepare_container(mixin + 1, eref(self.CLSAGs[i], 's'), elem_type=KeyV)
-                if len(self.CLSAGs[i].s) != mixin + 1:
+                if ar.writing and len(self.CLSAGs[i].s) != mixin + 1:
                     raise ValueError('CLSAGs[i].s size mismatch')
 
-                for j in range(mixin + 1):
-                    await ar.field(eref(self.CLSAGs[i].s, j), elem_type=KeyV.ELEM_TYPE)
+                await ar.blob_vector(eref(self.CLSAGs[i], 's'), mixin + 1, KeyV.ELEM_TYPE)
                 await ar.end_array()
 
                 await ar.tag('c1')
@@ -555,6 +556,7 @@ class RctSigPrunable(x.MessageType):
                 # We save the MGs contents directly, because we want it to save its
                 # arrays and matrices without the size prefixes, and the load can't
                 # know what size to expect if it's not in the data
+                await ar.prepare_message(eref(self.MGs, i), MgSig)
                 await ar.begin_object()
                 await ar.tag('ss')
                 await ar.begin_array()
@@ -566,13 +568,10 @@ class RctSigPrunable(x.MessageType):
                 for j in range(mixin + 1):
                     await ar.begin_array()
                     mg_ss2_elements = 1 + (1 if not is_full else inputs)
-                    await ar.prepare_container(mg_ss2_elements, eref(self.MGs[i].ss, j), elem_type=KeyM.ELEM_TYPE)
-
                     if ar.writing and len(self.MGs[i].ss[j]) != mg_ss2_elements:
                         raise ValueError('MGs size mismatch 2')
 
-                    for k in range(mg_ss2_elements):
-                        await ar.field(eref(self.MGs[i].ss[j], k), elem_type=KeyV.ELEM_TYPE)
+                    await ar.blob_vector(eref(self.MGs[i].ss, j), mg_ss2_elements, KeyV.ELEM_TYPE)
                     await ar.end_array()
 
                 await ar.tag('cc')
@@ -582,14 +581,39 @@ class RctSigPrunable(x.MessageType):
 
         if type in (RctType.Bulletproof, RctType.Bulletproof2, RctType.CLSAG, RctType.BulletproofPlus):
             await ar.begin_array()
-            await ar.prepare_container(inputs, eref(self, 'pseudoOuts'), elem_type=KeyV)
             if ar.writing and len(self.pseudoOuts) != inputs:
                 raise ValueError('pseudoOuts size mismatch')
 
-            for i in range(inputs):
-                await ar.field(eref(self.pseudoOuts, i), elem_type=KeyV.ELEM_TYPE)
+            await ar.blob_vector(eref(self, 'pseudoOuts'), inputs, KeyV.ELEM_TYPE)
             await ar.end_array()
 
+    def range_proof_keys(self, type):
+        """
+        Yields keys of the range proofs in the order hashed by get_pre_mlsag_hash,
+        i.e., the proofs without commitments V and size prefixes.
+        :param type: RctType
+        :return:
+        """
+        if type == RctType.BulletproofPlus:
+            for p in self.bulletproofs_plus:
+                yield from (p.A, p.A1, p.B, p.r1, p.s1, p.d1)
+                yield from p.L
+                yield from p.R
+
+        elif is_rct_bp(type):
+            for p in self.bulletproofs:
+                yield from (p.A, p.S, p.T1, p.T2, p.taux, p.mu)
+                yield from p.L
+                yield from p.R
+                yield from (p.a, p.b, p.t)
+
+        else:
+            for r in self.rangeSigs:
+                yield from r.asig.s0
+                yield from r.asig.s1
+                yield r.asig.ee
+                yield from r.Ci
+
     async def boost_serialize(self, ar, version):
         await self._msg_field(ar, 'rangeSigs')
         if self.rangeSigs is None or len(self.rangeSigs) == 0:
@@ -606,6 +630,55 @@ class RctSig(RctSigBase):
         ('p', RctSigPrunable),
     ]
 
+    async def get_pre_mlsag_hash(self, inputs=None, outputs=None, hasher=None, ar=None):
+        """
+        Message signed by MLSAGs / CLSAGs: H(message || H(rctsig_base) || H(range proof keys)).
+        RCT base is serialized and the range proof keys fed directly to the hasher, no buffers are built.
+
+        :param inputs: number of inputs, len(pseudoOuts) of the Simple type by default (others do not serialize it)
+        :param outputs: number of outputs, len(ecdhInfo) by default
+        :param hasher: hasher factory with hashlib interface, Keccak-256 by default
+        :param ar: writing archive to reuse
+        :return: bytes
+        """
+        hasher = hasher or keccak_256
+        if inputs is None:
+            inputs = len(self.pseudoOuts) if self.type == RctType.Simple else 0
+        if outputs is None:
+            outputs = len(self.ecdhInfo)
+
+        base_writer = AHashWriter(hasher())
+        if ar is None:
+            ar = x.Archive(base_writer, True)
+        else:
+            ar.reset(base_writer)
+        await ar.enc_cached(self, ('rctsig_base', inputs, outputs), self.serialize_rctsig_base, ar, inputs, outputs)
+
+        kv = hasher()
+        for key in self.p.range_proof_keys(self.type):
+            kv.update(key)
+
+        h = hasher()
+        h.update(self.message)
+        h.update(base_writer.get_digest())
+        h.update(kv.digest())
+        return h.digest()
+
+
+async def get_pre_mlsag_hashes(rvs, hasher=None):
+    """
+    Batch mode of RctSig.get_pre_mlsag_hash, one writing archive is used for all signatures
+    :param rvs: RctSig, or (RctSig, inputs, outputs) tuples
+    :param hasher:
+    :return: list of hashes
+    """
+    ar = x.Archive(None, True)
+    res = []
+    for rv in rvs:
+        rv, inputs, outputs = rv if isinstance(rv, tuple) else (rv, None, None)
+        res.append(await rv.get_pre_mlsag_hash(inputs, outputs, hasher, ar))
+    return res
+
 
 class Signature(x.MessageType):
     __slots__ = ['c', 'r']
@@ -614,11 +687,6 @@ class Signature(x.MessageType):
         ('r', ECKey),
     ]
 
-    async def serialize_archive(self, ar, version=None):
-        ar.field(eref(self, 'c'), ECKey)
-        ar.field(eref(self, 'r'), ECKey)
-        return self
-
 
 class SignatureArray(x.ContainerType):
     FIX_SIZE = 0
@@ -639,6 +707,9 @@ def get_signature_size(msg):
         raise ValueError('Unknown tx in')
 
 
+CURRENT_TRANSACTION_VERSION = 2
+
+
 class Transaction(TransactionPrefix):
     # noinspection PyTypeChecker
     MFIELDS = TransactionPrefix.MFIELDS + [
@@ -659,25 +730,7 @@ class Transaction(TransactionPrefix):
         if self.version == 1:
             await ar.tag('signatures')
             await ar.begin_array()
-            await ar.prepare_container(len(self.vin), eref(self, 'signatures'), elem_type=SignatureArray)
-            signatures_not_expected = len(self.signatures) == 0
-            if not signatures_not_expected and len(self.vin) != len(self.signatures):
-                raise ValueError('Signature size mismatch')
-
-            for i in range(len(self.vin)):
-                sig_size = get_signature_size(self.vin[i])
-                if signatures_not_expected:
-                    if 0 == sig_size:
-                        continue
-                    else:
-                        raise ValueError('Unexpected sig')
-
-                await ar.prepare_container(sig_size, eref(self.signatures, i), elem_type=SignatureArray)
-                if sig_size != len(self.signatures[i]):
-                    raise ValueError('Unexpected sig size')
-
-                for j in range(sig_size):
-                    await ar.field(eref(self.signatures[i], j), Signature)
+            await self.serialize_signatures_v1(ar)
 
         else:
             await ar.tag('rct_signatures')
@@ -686,7 +739,8 @@ class Transaction(TransactionPrefix):
 
             await ar.begin_object()
             await ar.prepare_message(eref(self, 'rct_signatures'), RctSig)
-            await self.rct_signatures.serialize_rctsig_base(ar, len(self.vin), len(self.vout))
+            await ar.enc_cached(self.rct_signatures, ('rctsig_base', len(self.vin), len(self.vout)),
+                                self.rct_signatures.serialize_rctsig_base, ar, len(self.vin), len(self.vout))
             await ar.end_object()
 
             if self.rct_signatures.type != RctType.Null:
@@ -694,12 +748,40 @@ class Transaction(TransactionPrefix):
                 await ar.tag('rctsig_prunable')
                 await ar.begin_object()
                 await ar.prepare_message(eref(self.rct_signatures, 'p'), RctSigPrunable)
-                await self.rct_signatures.p.serialize_rctsig_prunable(ar, self.rct_signatures.type,
-                                                                      len(self.vin), len(self.vout),
-                                                                      mixin_size)
+                await ar.enc_cached(self.rct_signatures.p,
+                                    ('rctsig_prunable', self.rct_signatures.type, len(self.vin), len(self.vout), mixin_size),
+                                    self.rct_signatures.p.serialize_rctsig_prunable, ar, self.rct_signatures.type,
+                                    len(self.vin), len(self.vout), mixin_size)
                 await ar.end_object()
         return self
 
+    async def serialize_signatures_v1(self, ar):
+        """
+        Pre-RingCT ring signatures, len(key_offsets) Signature(c, r) pairs per input.
+        All pairs of the transaction are read / written as one block of sum(len(key_offsets)) * 64 bytes.
+        :param ar:
+        :return:
+        """
+        sig_sizes = [get_signature_size(inp) for inp in self.vin]
+        if ar.writing:
+            if len(self.signatures) == 0:
+                if any(sig_sizes):
+                    raise ValueError('Unexpected sig')
+                return
+            if len(self.vin) != len(self.signatures):
+                raise ValueError('Signature size mismatch')
+            if any(len(sigs) != size for sigs, size in zip(self.signatures, sig_sizes)):
+                raise ValueError('Unexpected sig size')
+
+        block = [[sig for sigs in self.signatures for sig in sigs] if ar.writing else None]
+        await ar.blob_vector(eref(block, 0), sum(sig_sizes), Signature)
+        if not ar.writing:
+            sigs, offset = [], 0
+            for size in sig_sizes:
+                sigs.append(block[0][offset:offset + size])
+                offset += size
+            self.signatures = sigs
+
     async def boost_serialize(self, ar, version):
         await ar.message(self, TransactionPrefix, use_version=version)
 
@@ -707,7 +789,7 @@ class Transaction(TransactionPrefix):
             raise ValueError('TxV1 not supported')
 
         else:
-            await ar.prepare_message(eref(self, 'rct_signatures'), RctSigBase)
+            await ar.prepare_message(eref(self, 'rct_signatures'), RctSig)
             await ar.message(self.rct_signatures, RctSigBase)
             if self.rct_signatures.type != RctType.Null:
                 await ar.prepare_message(eref(self.rct_signatures, 'p'), RctSigPrunable)
@@ -812,7 +894,7 @@ class TxExtraPadding(x.MessageType):
             if self.size > self.TX_EXTRA_PADDING_MAX_COUNT:
                 raise ValueError('Padding too big')
             for i in range(self.size):
-                ar.uint(0, x.UInt8)
+                await ar.uint(0, x.UInt8)
 
         else:
             self.size = 0
@@ -62,5 +62,7 @@ setup(
     extras_require={
         'dev': dev_extras,
         'docs': docs_extras,
+        'numpy': ['numpy'],
+        'keccak': ['pycryptodomex'],
     },
 )